@@ -1,12 +1,45 @@
-from flask import Flask, jsonify, request
+from flask import (Flask, jsonify, request, g, has_app_context, has_request_context,
+                   after_this_request, Response)
 from flask_cors import CORS
 import sqlite3
+import csv
+import io
+import json
 import os
 import logging
+import random
 import sys
+import threading
+import time
 from pathlib import Path
+from urllib.request import pathname2url
 from datetime import datetime
 from typing import Dict, List, Optional, Union, Any
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from db_pool import ConnectionPool, PooledConnection
+from write_queue import WriteQueue, WriteQueueFull
+from dashboard_counters import read_counters
+from migrations import migrate
+from pagination import PaginationError, parse_limit, keyset_page, build_keyset_query
+from streaming import NDJSON_MIMETYPE, wants_stream, wants_ndjson, stream_response
+from ref_cache import ReferenceCache
+from export import EXPORTS, FORMATS as EXPORT_FORMATS, iter_export, export_headers
+from bulk_import import ENTITIES as IMPORT_ENTITIES, ImportJobError, run_import, get_job
+from search import SearchError, search
+from rollups import RollupQueryError, ridership, revenue
+from archive import ColdStore, default_archive_dir
+from od_matrix import FORMATS as OD_FORMATS, ODQueryError, od_matrix, parse_hours, station_ids
+from fare_engine import FareEngine, to_json_list
+from trip_ops import (TripOpError, MAX_BATCH_EVENTS, run_immediate, exit_trip,
+                      ingest_tap_events, is_lock_error)
+from storage_profile import (resolve_profile, apply_database_settings,
+                             apply_connection_settings, checkpoint, report_settings)
+from request_trace import RequestTrace, TracingJSONProvider, current_trace
+from slow_query import SlowQueryLog
+from deadlines import Deadline, DEFAULT_ROUTE_DEADLINES_MS, parse_route_deadlines, budget_for
+from metrics import (MetricsRegistry, PROMETHEUS_MIMETYPE, ROW_BUCKETS,
+                     process_memory_family, file_size)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -14,22 +47,422 @@ logger = logging.getLogger(__name__)
 
 # Initialize Flask app
 app = Flask(__name__)
+app.json = TracingJSONProvider(app)
 CORS(app)  # Enable CORS for all routes
 
 # Database configuration
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_PATH = os.path.join(BASE_DIR, '..', 'project.db')
 
+# Connection pool configuration
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '8'))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '10'))
+DB_POOL_MAX_LIFETIME = float(os.environ.get('DB_POOL_MAX_LIFETIME', '3600'))
+DB_POOL_MAX_USES = int(os.environ.get('DB_POOL_MAX_USES', '10000'))
+
+# Requests read through read-only connections; mutations go to the writer (see run_write)
+DB_READ_WRITE_SPLIT = os.environ.get('DB_READ_WRITE_SPLIT', '1') not in ('0', 'false', 'off')
+
+# SQLite storage profile (see storage_profile.PROFILES)
+DB_STORAGE_PROFILE = os.environ.get('DB_STORAGE_PROFILE', 'balanced')
+
+# Group-commit writer for the trip write paths (see write_queue.WriteQueue)
+DB_WRITE_QUEUE = os.environ.get('DB_WRITE_QUEUE', '1') not in ('0', 'false', 'off')
+DB_WRITE_BATCH_MAX = int(os.environ.get('DB_WRITE_BATCH_MAX', '64'))
+DB_WRITE_BATCH_DELAY_MS = float(os.environ.get('DB_WRITE_BATCH_DELAY_MS', '2'))
+DB_WRITE_QUEUE_DEPTH = int(os.environ.get('DB_WRITE_QUEUE_DEPTH', '1000'))
+DB_WRITE_TIMEOUT = float(os.environ.get('DB_WRITE_TIMEOUT', '30'))
+
+# Fraction of requests traced with SQL counts and Server-Timing (see request_trace)
+DB_TRACE_SAMPLE_RATE = float(os.environ.get('DB_TRACE_SAMPLE_RATE', '0'))
+
+# Statements slower than this are logged with their plan (see slow_query); 0 disables
+DB_SLOW_QUERY_MS = float(os.environ.get('DB_SLOW_QUERY_MS', '100'))
+
+# SQL time budget per request, and per-route overrides (see deadlines); 0 means no limit
+DB_DEADLINE_MS = float(os.environ.get('DB_DEADLINE_MS', '10000'))
+DB_ROUTE_DEADLINES = {**DEFAULT_ROUTE_DEADLINES_MS,
+                      **parse_route_deadlines(os.environ.get('DB_ROUTE_DEADLINES', ''))}
+
+# Cold tier of archived trips and transactions (see archive); default archive/ next to DB_PATH
+ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR')
+
+_db_pool: Optional[ConnectionPool] = None
+_read_pool: Optional[ConnectionPool] = None
+_db_pool_lock = threading.Lock()
+_write_queue: Optional[WriteQueue] = None
+slow_query_log = SlowQueryLog(DB_SLOW_QUERY_MS)
+
+def get_storage_profile() -> Dict[str, Any]:
+    """Resolve the configured storage profile, including env overrides."""
+    return resolve_profile(DB_STORAGE_PROFILE)
+
+def _setup_connection(conn: sqlite3.Connection, profile: Dict[str, Any]) -> None:
+    apply_connection_settings(conn, profile)
+    if DB_SLOW_QUERY_MS > 0:
+        slow_query_log.attach(conn)
+
+def get_db_pool() -> ConnectionPool:
+    """
+    Return the process-wide read-write pool, creating it on first use.
+
+    With DB_READ_WRITE_SPLIT it holds a single connection, which run_write
+    uses when DB_WRITE_QUEUE is off; requests read on get_read_pool().
+    """
+    global _db_pool
+    if _db_pool is None:
+        with _db_pool_lock:
+            if _db_pool is None:
+                profile = get_storage_profile()
+                slow_query_log.threshold = DB_SLOW_QUERY_MS / 1000.0
+                _db_pool = ConnectionPool(
+                    DB_PATH,
+                    size=1 if DB_READ_WRITE_SPLIT else DB_POOL_SIZE,
+                    timeout=DB_POOL_TIMEOUT,
+                    max_lifetime=DB_POOL_MAX_LIFETIME,
+                    max_uses=DB_POOL_MAX_USES,
+                    on_connect=lambda conn: _setup_connection(conn, profile),
+                )
+    return _db_pool
+
+def get_read_pool() -> ConnectionPool:
+    """
+    Return the pool that read-only requests use: DB_POOL_SIZE connections
+    opened with mode=ro under DB_READ_WRITE_SPLIT, otherwise the
+    read-write pool. In WAL mode readers never wait for the writer.
+    """
+    global _read_pool
+    if not DB_READ_WRITE_SPLIT:
+        return get_db_pool()
+    if _read_pool is None:
+        with _db_pool_lock:
+            if _read_pool is None:
+                profile = get_storage_profile()
+                slow_query_log.threshold = DB_SLOW_QUERY_MS / 1000.0
+                _read_pool = ConnectionPool(
+                    f'file:{pathname2url(os.path.abspath(DB_PATH))}?mode=ro',
+                    size=DB_POOL_SIZE,
+                    timeout=DB_POOL_TIMEOUT,
+                    max_lifetime=DB_POOL_MAX_LIFETIME,
+                    max_uses=DB_POOL_MAX_USES,
+                    on_connect=lambda conn: _setup_connection(conn, profile),
+                    connect_kwargs={'uri': True},
+                )
+    return _read_pool
+
+_cold_store: Optional[ColdStore] = None
+
+def get_cold_store() -> ColdStore:
+    """Return the archive of old trips and transactions that analytics and exports also read."""
+    global _cold_store
+    root = ARCHIVE_DIR or default_archive_dir(DB_PATH)
+    if _cold_store is None or _cold_store.root != root:
+        _cold_store = ColdStore(root)
+    return _cold_store
+
+def _open_write_connection() -> sqlite3.Connection:
+    # Not pooled; PooledConnection only so the slow-query log and request
+    # traces can attach to it.
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False, factory=PooledConnection)
+    conn.row_factory = sqlite3.Row
+    _setup_connection(conn, get_storage_profile())
+    return conn
+
+def get_write_queue() -> WriteQueue:
+    """
+    Return the process-wide group-commit writer, creating it on first use.
+
+    It owns the one write connection requests use; no request ever holds a
+    writer itself, so tap writes never queue behind a slow handler.
+    """
+    global _write_queue
+    if _write_queue is None:
+        with _db_pool_lock:
+            if _write_queue is None:
+                _write_queue = WriteQueue(
+                    _open_write_connection,
+                    max_batch=DB_WRITE_BATCH_MAX,
+                    max_delay_ms=DB_WRITE_BATCH_DELAY_MS,
+                    max_depth=DB_WRITE_QUEUE_DEPTH,
+                    on_lock_wait=record_lock_wait('queue'),
+                )
+    return _write_queue
+
+def _request_scoped(op):
+    """
+    Wrap a write operation so it runs under the request's trace and
+    deadline on whichever connection executes it. The deadline is checked
+    before the operation starts rather than interrupting it: an interrupt
+    would roll back the whole group commit it shares with other requests.
+    """
+    trace, deadline = current_trace(), request_deadline()
+    if trace is None and deadline is None:
+        return op
+
+    def scoped(conn):
+        if deadline is not None and deadline():
+            raise sqlite3.OperationalError('interrupted')
+        if trace is None:
+            return op(conn)
+        trace.attach(conn)
+        try:
+            return op(conn)
+        finally:
+            trace.detach(conn)
+    return scoped
+
+def run_write(op):
+    """
+    Run a write operation (a callable taking the connection, see trip_ops)
+    in a transaction. Every mutation goes through here: on the group-commit
+    writer when DB_WRITE_QUEUE is on, otherwise on the read-write pool's
+    connection, leased for this transaction only.
+    """
+    op = _request_scoped(op)
+    if not DB_WRITE_QUEUE:
+        conn = get_db_pool().acquire()
+        try:
+            return run_immediate(conn, op, on_lock_wait=record_lock_wait('direct'))
+        finally:
+            conn.close()
+    trace = current_trace()
+    if trace is None:
+        return get_write_queue().execute(op, DB_WRITE_TIMEOUT)
+    with trace.span('write'):
+        return get_write_queue().execute(op, DB_WRITE_TIMEOUT)
+
+def refresh_fares() -> None:
+    """
+    Reload the fare matrix if its tables changed. The versions and the
+    reload are read on a read-pool connection returned straight away, so a
+    write request never holds the writer the queue is waiting for.
+    """
+    conn = get_read_pool().acquire()
+    try:
+        fare_engine.refresh(conn)
+    finally:
+        conn.close()
+
+def reset_db_pool() -> None:
+    """Close the pools and writer so the next request reopens them with current settings."""
+    global _db_pool, _read_pool, _write_queue
+    with _db_pool_lock:
+        if _write_queue is not None:
+            _write_queue.stop()
+            _write_queue = None
+        if _db_pool is not None:
+            _db_pool.close_all()
+            _db_pool = None
+        if _read_pool is not None:
+            _read_pool.close_all()
+            _read_pool = None
+
 def get_db_connection():
-    """Create and return a database connection."""
+    """
+    Return a pooled database connection.
+
+    Inside a request the same connection is handed out for the whole request
+    and returned to the pool on teardown; calling close() on it returns it early.
+    Requests get a read-only connection (see get_read_pool) whatever their
+    method; their writes go through run_write.
+    """
     try:
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row
+        if not has_app_context():
+            return get_db_pool().acquire()
+        lease = g.get('db_lease')
+        if lease is not None:
+            conn, lease_id = lease
+            if conn.checked_out and conn.lease == lease_id:
+                return conn
+        pool = get_read_pool() if has_request_context() else get_db_pool()
+        trace = g.get('request_trace')
+        if trace is None:
+            conn = pool.acquire()
+        else:
+            with trace.span('connect'):
+                conn = pool.acquire()
+            trace.attach(conn)
+        deadline = request_deadline()
+        if deadline is not None:
+            deadline.attach(conn)
+        g.db_lease = (conn, conn.lease)
         return conn
     except sqlite3.Error as e:
         logger.error(f"Database connection error: {e}")
         raise
 
+@app.before_request
+def start_request_trace():
+    """
+    Trace DB_TRACE_SAMPLE_RATE of requests; unsampled requests skip all of
+    the tracing hooks.
+    """
+    if DB_TRACE_SAMPLE_RATE > 0 and random.random() < DB_TRACE_SAMPLE_RATE:
+        trace = g.request_trace = RequestTrace()
+
+        @after_this_request
+        def finish_request_trace(response):
+            trace.finish(response, request.method, request.path)
+            return response
+
+@app.teardown_appcontext
+def release_db_connection(exception=None):
+    """Hand the request's connection back to the pool."""
+    lease = g.pop('db_lease', None)
+    if lease is not None:
+        conn, lease_id = lease
+        if conn.checked_out and conn.lease == lease_id:
+            conn.close()
+
+# Prometheus metrics, served at /metrics
+metrics = MetricsRegistry()
+metrics.counter('http_requests_total', 'Requests handled, by method, route and status.')
+metrics.counter('http_request_errors_total', 'Responses with a 4xx or 5xx status, by method, route and status.')
+metrics.histogram('http_request_duration_seconds',
+                  'Time to produce the response, by method and route (streamed bodies excluded).')
+metrics.histogram('list_rows_returned', 'Rows in each page returned by a list endpoint.', ROW_BUCKETS)
+metrics.histogram('sqlite_lock_wait_seconds',
+                  'Time write transactions waited for the SQLite write lock (BEGIN IMMEDIATE, '
+                  'including busy retries), by write path.')
+metrics.counter('sqlite_busy_errors_total', 'Writes that gave up waiting for the SQLite write lock.',
+                labeled=False)
+
+metrics.counter('sqlite_deadline_exceeded_total',
+                'Requests whose SQL was interrupted for exceeding the route budget, by method and route.')
+
+def record_lock_wait(path: str):
+    """Callback for run_immediate/WriteQueue that records lock waits under `path`."""
+    labels = (('path', path),)
+    return lambda seconds: metrics.observe('sqlite_lock_wait_seconds', labels, seconds)
+
+def collect_database_metrics():
+    """Database file, WAL, pool and write queue figures, read at scrape time."""
+    yield ('sqlite_database_size_bytes', 'gauge', 'Size of the SQLite database file.',
+           [((), file_size(DB_PATH))])
+    yield ('sqlite_wal_size_bytes', 'gauge', 'Size of the write-ahead log.',
+           [((), file_size(DB_PATH + '-wal'))])
+    pools = [('write' if DB_READ_WRITE_SPLIT else 'shared', get_db_pool().stats())]
+    if DB_READ_WRITE_SPLIT:
+        pools.append(('read', get_read_pool().stats()))
+    yield ('db_pool_connections', 'gauge', 'Open pooled connections, by pool and state.',
+           [((('pool', name), ('state', state)), stats[key])
+            for name, stats in pools for state, key in (('idle', 'idle'), ('in_use', 'inUse'))])
+    yield ('db_pool_size', 'gauge', 'Maximum pooled connections, by pool.',
+           [((('pool', name),), stats['size']) for name, stats in pools])
+    yield ('db_pool_busy_seconds_total', 'counter',
+           'Time connections were checked out, by pool; its rate over the pool size is utilization.',
+           [((('pool', name),), stats['busyTimeMs'] / 1000) for name, stats in pools])
+    yield ('db_pool_checkouts_total', 'counter',
+           'Connection checkouts, by pool and whether an idle connection was reused.',
+           [((('pool', name), ('result', result)), stats[key])
+            for name, stats in pools for result, key in (('hit', 'hits'), ('miss', 'misses'))])
+    yield ('db_pool_waits_total', 'counter', 'Checkouts that had to wait for a free connection, by pool.',
+           [((('pool', name),), stats['waits']) for name, stats in pools])
+    yield ('db_pool_wait_seconds_total', 'counter', 'Time spent waiting for a free connection, by pool.',
+           [((('pool', name),), stats['waitTimeMs'] / 1000) for name, stats in pools])
+    yield ('db_pool_timeouts_total', 'counter', 'Checkouts that timed out, by pool.',
+           [((('pool', name),), stats['timeouts']) for name, stats in pools])
+    yield ('db_pool_recycled_total', 'counter', 'Connections closed for age or use count, by pool.',
+           [((('pool', name),), stats['recycled']) for name, stats in pools])
+    if DB_WRITE_QUEUE:
+        queue_stats = get_write_queue().stats()
+        yield ('write_queue_depth', 'gauge', 'Operations waiting for the writer.', [((), queue_stats['queued'])])
+        yield ('write_queue_ops_total', 'counter', 'Operations run by the writer, by outcome.',
+               [((('result', 'ok'),), queue_stats['ops'] - queue_stats['failedOps']),
+                ((('result', 'failed'),), queue_stats['failedOps'])])
+        yield ('write_queue_commits_total', 'counter', 'Group commits.', [((), queue_stats['batches'])])
+        yield ('write_queue_rejected_total', 'counter', 'Operations refused because the queue was full.',
+               [((), queue_stats['rejected'])])
+
+metrics.add_collector(collect_database_metrics)
+metrics.add_collector(process_memory_family)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    """Count the request and its latency under its route template."""
+    started = g.get('request_started')
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+        labels = (('method', request.method), ('route', route))
+        metrics.observe('http_request_duration_seconds', labels, time.perf_counter() - started)
+        with_status = labels + (('status', str(response.status_code)),)
+        metrics.inc('http_requests_total', with_status)
+        if response.status_code >= 400:
+            metrics.inc('http_request_errors_total', with_status)
+    return response
+
+def request_deadline() -> Optional[Deadline]:
+    """The current request's SQL deadline, started on first use; None if the route has no budget."""
+    if not has_request_context():
+        return None
+    deadline = g.get('sql_deadline')
+    if deadline is None:
+        rule = request.url_rule.rule if request.url_rule is not None else None
+        budget_ms = budget_for(request.method, rule, DB_ROUTE_DEADLINES, DB_DEADLINE_MS)
+        if budget_ms <= 0:
+            return None
+        deadline = g.sql_deadline = Deadline(budget_ms)
+    return deadline
+
+@app.after_request
+def answer_expired_deadline(response):
+    """Turn whatever a handler made of an interrupted query into a 503 with a retry hint."""
+    deadline = g.get('sql_deadline')
+    if deadline is None or not deadline.expired:
+        return response
+    route = request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+    metrics.inc('sqlite_deadline_exceeded_total', (('method', request.method), ('route', route)))
+    logger.warning(f"{request.method} {request.path} exceeded its {deadline.budget_ms:g} ms SQL budget")
+    response = jsonify({"error": f"Query exceeded its {deadline.budget_ms:g} ms time budget; "
+                                 f"narrow the request or retry later"})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
+def page_response(items: List[Dict[str, Any]], next_cursor: Optional[str]):
+    """JSON body of a list endpoint page; records the page size."""
+    metrics.observe('list_rows_returned', (('route', request.url_rule.rule),), len(items))
+    return jsonify({'items': items, 'nextCursor': next_cursor}), 200
+
+# Version-stamped cache for the small reference endpoints
+reference_cache = ReferenceCache()
+
+def _reference_body_response(body: bytes, etag: str) -> Response:
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+# Fare matrix; reloads itself when FareRule, Station or CardType versions change
+fare_engine = FareEngine()
+
+def cached_reference_response(key: str):
+    """
+    Answer a reference endpoint from the version cache; the only SQL is the
+    read of the RefVersion rows.
+    :return: (response or None on a cache miss, ETag to store the fresh body under)
+    """
+    reference_cache.sync(get_db_connection())
+    etag = reference_cache.etag(key)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response, etag
+    body = reference_cache.get(key, etag)
+    if body is not None:
+        return _reference_body_response(body, etag), etag
+    return None, etag
+
+def reference_response(key: str, etag: str, data: Any) -> Response:
+    """Serialize reference data once and cache the bytes under `etag`."""
+    body = app.json.dumps(data).encode('utf-8')
+    reference_cache.put(key, etag, body)
+    return _reference_body_response(body, etag)
+
 # ==================== ROUTES ====================
 
 @app.route('/', methods=['GET'])
@@ -45,7 +478,13 @@ def root():
             'stations': '/stations',
             'trips': '/trips',
             'transactions': '/transactions',
-            'fare_rules': '/fare-rules'
+            'fare_rules': '/fare-rules',
+            'fare_quote': '/fares/quote',
+            'search': '/search',
+            'ridership': '/analytics/ridership',
+            'revenue': '/analytics/revenue',
+            'od_matrix': '/analytics/od-matrix',
+            'metrics': '/metrics'
         }
     })
 
@@ -58,6 +497,9 @@ def health_check():
         return jsonify({
             'status': 'healthy',
             'database': 'connected',
+            'pool': get_db_pool().stats(),
+            'readPool': get_read_pool().stats() if DB_READ_WRITE_SPLIT else None,
+            'writeQueue': get_write_queue().stats() if DB_WRITE_QUEUE else None,
             'timestamp': datetime.now().isoformat()
         }), 200
     except Exception as e:
@@ -66,6 +508,31 @@ def health_check():
             'error': str(e)
         }), 500
 
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Request, database and process metrics in Prometheus text format."""
+    return Response(metrics.render(), content_type=PROMETHEUS_MIMETYPE)
+
+@app.route('/debug/slow-queries', methods=['GET'])
+def get_slow_queries():
+    """
+    Slow statements grouped by normalized SQL, with their query plans.
+
+    Query params: limit (default 20), sort (totalMs, maxMs or count)
+    """
+    try:
+        limit = request.args.get('limit', default=20, type=int)
+        sort = request.args.get('sort', 'totalMs')
+        if sort not in ('totalMs', 'maxMs', 'count'):
+            return jsonify({"error": "sort must be totalMs, maxMs or count"}), 400
+        return jsonify({
+            'thresholdMs': DB_SLOW_QUERY_MS,
+            'queries': slow_query_log.top(limit, sort),
+        }), 200
+    except Exception as e:
+        logger.error(f"Error reading slow queries: {e}")
+        return jsonify({"error": "Failed to read slow queries"}), 500
+
 @app.route('/dashboard/stats', methods=['GET'])
 def get_dashboard_stats():
     """Get dashboard statistics."""
@@ -74,45 +541,8 @@ def get_dashboard_stats():
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        # Total Passengers
-        cursor.execute('SELECT COUNT(*) as count FROM Passenger')
-        total_passengers = cursor.fetchone()['count']
-        
-        # Active Cards (Status = 'Active')
-        cursor.execute("SELECT COUNT(*) as count FROM Card WHERE Status = 'Active'")
-        active_cards = cursor.fetchone()['count']
-        
-        # Blocked Cards
-        cursor.execute("SELECT COUNT(*) as count FROM Card WHERE Status = 'Blocked'")
-        blocked_cards = cursor.fetchone()['count']
-        
-        # Total Balance across all cards
-        cursor.execute('SELECT COALESCE(SUM(Balance), 0) as total FROM Card')
-        total_balance = cursor.fetchone()['total']
-        
-        # Total Trips
-        cursor.execute('SELECT COUNT(*) as count FROM Trip')
-        total_trips = cursor.fetchone()['count']
-        
-        # Active Trips (trips without ExitTime are considered active)
-        cursor.execute("SELECT COUNT(*) as count FROM Trip WHERE ExitTime IS NULL")
-        active_trips = cursor.fetchone()['count']
-        
-        # Total Stations
-        cursor.execute('SELECT COUNT(*) as count FROM Station')
-        total_stations = cursor.fetchone()['count']
-        
-        # Average Fare
-        cursor.execute('SELECT COALESCE(AVG(FareAmount), 0) as avg FROM FareRule')
-        average_fare = cursor.fetchone()['avg']
-        
-        # Total Transactions
-        cursor.execute('SELECT COUNT(*) as count FROM [Transaction]')
-        total_transactions = cursor.fetchone()['count']
-        
-        # Total Revenue (sum of all transaction amounts)
-        cursor.execute('SELECT COALESCE(SUM(Amount), 0) as total FROM [Transaction]')
-        total_revenue = cursor.fetchone()['total']
+        # All totals come from the trigger-maintained DashboardCounters row
+        stats = read_counters(conn)
         
         # Recent Transactions (last 5)
         cursor.execute('''
@@ -126,19 +556,8 @@ def get_dashboard_stats():
         ''')
         recent_transactions = [dict(row) for row in cursor.fetchall()]
         
-        return jsonify({
-            'totalPassengers': total_passengers,
-            'activeCards': active_cards,
-            'blockedCards': blocked_cards,
-            'totalBalance': float(total_balance),
-            'totalTrips': total_trips,
-            'activeTrips': active_trips,
-            'totalStations': total_stations,
-            'averageFare': float(average_fare),
-            'totalTransactions': total_transactions,
-            'totalRevenue': float(total_revenue),
-            'recentTransactions': recent_transactions
-        }), 200
+        stats['recentTransactions'] = recent_transactions
+        return jsonify(stats), 200
         
     except Exception as e:
         logger.error(f"Error fetching dashboard stats: {str(e)}")
@@ -149,71 +568,86 @@ def get_dashboard_stats():
 
 @app.route('/passengers', methods=['GET'])
 def get_passengers():
-    """Get all passengers."""
+    """
+    Get passengers, one page at a time.
+
+    Query parameters: limit, after (cursor), email, from/to (RegistrationDate,
+    to is exclusive). Pages are ordered by PassengerID.
+    """
+    conn = None
     try:
+        limit = parse_limit(request.args.get('limit'))
+        filters, params = [], []
+        
+        if request.args.get('email'):
+            filters.append("Email = ?")
+            params.append(request.args['email'])
+        if request.args.get('from'):
+            filters.append("RegistrationDate >= ?")
+            params.append(request.args['from'])
+        if request.args.get('to'):
+            filters.append("RegistrationDate < ?")
+            params.append(request.args['to'])
+        
         conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM Passenger')
-        passengers = [dict(row) for row in cursor.fetchall()]
-        return jsonify(passengers), 200
+        passengers, next_cursor = keyset_page(
+            conn, 'SELECT * FROM Passenger',
+            order_by=[('PassengerID', 'PassengerID')],
+            filters=filters, params=params,
+            after=request.args.get('after'), limit=limit)
+        return page_response(passengers, next_cursor)
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     finally:
-        conn.close()
+        if conn:
+            conn.close()
+
+def _passenger_conflict(e: sqlite3.IntegrityError) -> str:
+    """Which unique Passenger column a failed insert or update collided on."""
+    return "Phone number already exists" if 'Passenger.PhoneNumber' in str(e) else "Email already exists"
 
 @app.route('/passengers', methods=['POST'])
 def create_passenger():
     """Create a new passenger."""
-    conn = None
     try:
         data = request.get_json()
         required_fields = ['FirstName', 'LastName', 'Email']
         
         if not all(field in data for field in required_fields):
             return jsonify({"error": "Missing required fields"}), 400
-            
-        conn = get_db_connection()
-        cursor = conn.cursor()
         
-        cursor.execute('''
+        values = (data['FirstName'], data['LastName'], data['Email'],
+                  data.get('PhoneNumber') or None, datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+        passenger_id = run_write(lambda c: c.execute('''
             INSERT INTO Passenger (FirstName, LastName, Email, PhoneNumber, RegistrationDate)
             VALUES (?, ?, ?, ?, ?)
-        ''', (data['FirstName'], data['LastName'], data['Email'], 
-              data.get('PhoneNumber', ''), datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
-        
-        conn.commit()
-        passenger_id = cursor.lastrowid
+        ''', values).lastrowid)
         logger.info(f"Created passenger with ID {passenger_id}")
         
         return jsonify({"message": "Passenger created successfully", "PassengerID": passenger_id}), 201
         
+    except WriteQueueFull:
+        return jsonify({"error": "Server busy, retry"}), 503, {'Retry-After': '1'}
+    except FutureTimeout:
+        return jsonify({"error": "Write timed out"}), 504
     except sqlite3.IntegrityError as e:
         if 'UNIQUE constraint failed' in str(e):
-            return jsonify({"error": "Email already exists"}), 409
+            return jsonify({"error": _passenger_conflict(e)}), 409
         logger.error(f"Integrity error in create_passenger: {str(e)}")
         return jsonify({"error": "Database integrity error"}), 500
     except Exception as e:
         logger.error(f"Error in create_passenger: {str(e)}")
         return jsonify({"error": "Failed to create passenger"}), 500
-    finally:
-        if conn:
-            conn.close()
 
 @app.route('/passengers/<int:passenger_id>', methods=['PUT'])
 def update_passenger(passenger_id: int):
     """Update an existing passenger."""
-    conn = None
     try:
         data = request.get_json()
         if not data:
             return jsonify({"error": "No data provided"}), 400
-            
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM Passenger WHERE PassengerID = ?', (passenger_id,))
-        if not cursor.fetchone():
-            return jsonify({"error": "Passenger not found"}), 404
         
         update_fields = []
         params = []
@@ -229,7 +663,7 @@ def update_passenger(passenger_id: int):
             params.append(data['Email'])
         if 'PhoneNumber' in data:
             update_fields.append("PhoneNumber = ?")
-            params.append(data['PhoneNumber'])
+            params.append(data['PhoneNumber'] or None)
             
         if not update_fields:
             return jsonify({"error": "No valid fields to update"}), 400
@@ -237,102 +671,121 @@ def update_passenger(passenger_id: int):
         params.append(passenger_id)
         update_query = f"UPDATE Passenger SET {', '.join(update_fields)} WHERE PassengerID = ?"
         
-        cursor.execute(update_query, params)
-        conn.commit()
+        if run_write(lambda c: c.execute(update_query, params).rowcount) == 0:
+            return jsonify({"error": "Passenger not found"}), 404
         
         return jsonify({"message": "Passenger updated successfully"}), 200
         
+    except WriteQueueFull:
+        return jsonify({"error": "Server busy, retry"}), 503, {'Retry-After': '1'}
+    except FutureTimeout:
+        return jsonify({"error": "Write timed out"}), 504
     except sqlite3.IntegrityError as e:
         if 'UNIQUE constraint failed' in str(e):
-            return jsonify({"error": "Email already exists"}), 409
+            return jsonify({"error": _passenger_conflict(e)}), 409
         return jsonify({"error": "Database integrity error"}), 500
     except sqlite3.Error as e:
         logger.error(f"Database error in update_passenger: {str(e)}")
         return jsonify({"error": "Failed to update passenger"}), 500
-    finally:
-        if conn:
-            conn.close()
 
 @app.route('/passengers/<int:passenger_id>', methods=['DELETE'])
 def delete_passenger(passenger_id: int):
     """Delete a passenger."""
-    conn = None
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM Passenger WHERE PassengerID = ?', (passenger_id,))
-        if not cursor.fetchone():
+        deleted = run_write(lambda c: c.execute('DELETE FROM Passenger WHERE PassengerID = ?', (passenger_id,)).rowcount)
+        if deleted == 0:
             return jsonify({"error": "Passenger not found"}), 404
         
-        cursor.execute('DELETE FROM Passenger WHERE PassengerID = ?', (passenger_id,))
-        conn.commit()
-        
         return jsonify({"message": "Passenger deleted successfully"}), 200
         
+    except WriteQueueFull:
+        return jsonify({"error": "Server busy, retry"}), 503, {'Retry-After': '1'}
+    except FutureTimeout:
+        return jsonify({"error": "Write timed out"}), 504
     except sqlite3.Error as e:
         logger.error(f"Database error in delete_passenger: {str(e)}")
         return jsonify({"error": "Failed to delete passenger"}), 500
-    finally:
-        if conn:
-            conn.close()
 
 @app.route('/cards', methods=['GET'])
 def get_cards():
-    """Get all cards."""
+    """
+    Get cards with passenger and card type names, one page at a time.
+
+    Query parameters: limit, after (cursor), passengerId, cardTypeId, status.
+    Pages are ordered by CardID.
+    """
+    conn = None
     try:
+        limit = parse_limit(request.args.get('limit'))
+        filters, params = [], []
+        
+        passenger_id = request.args.get('passengerId', type=int)
+        if passenger_id is not None:
+            filters.append("c.PassengerID = ?")
+            params.append(passenger_id)
+        card_type_id = request.args.get('cardTypeId', type=int)
+        if card_type_id is not None:
+            filters.append("c.CardTypeID = ?")
+            params.append(card_type_id)
+        if request.args.get('status'):
+            filters.append("c.Status = ?")
+            params.append(request.args['status'])
+        
         conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
+        cards, next_cursor = keyset_page(conn, '''
             SELECT c.*, p.FirstName, p.LastName, ct.TypeName 
             FROM Card c
             LEFT JOIN Passenger p ON c.PassengerID = p.PassengerID
             LEFT JOIN CardType ct ON c.CardTypeID = ct.CardTypeID
-        ''')
-        cards = [dict(row) for row in cursor.fetchall()]
-        return jsonify(cards), 200
+        ''', order_by=[('c.CardID', 'CardID')],
+            filters=filters, params=params,
+            after=request.args.get('after'), limit=limit)
+        return page_response(cards, next_cursor)
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     finally:
-        conn.close()
+        if conn:
+            conn.close()
 
 @app.route('/cards', methods=['POST'])
 def create_card():
     """Create a new card."""
-    conn = None
     try:
         data = request.get_json()
         required_fields = ['CardNumber', 'PassengerID', 'CardTypeID']
         
         if not all(field in data for field in required_fields):
             return jsonify({"error": "Missing required fields"}), 400
-            
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Verify passenger and card type exist
-        cursor.execute('SELECT COUNT(*) FROM Passenger WHERE PassengerID = ?', (data['PassengerID'],))
-        if cursor.fetchone()[0] == 0:
-            return jsonify({"error": "Passenger not found"}), 404
-            
-        cursor.execute('SELECT COUNT(*) FROM CardType WHERE CardTypeID = ?', (data['CardTypeID'],))
-        if cursor.fetchone()[0] == 0:
-            return jsonify({"error": "Card type not found"}), 404
         
-        cursor.execute('''
-            INSERT INTO Card (CardNumber, Balance, IssueDate, Status, PassengerID, CardTypeID)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (data['CardNumber'], data.get('Balance', 0.0), 
-              datetime.now().strftime('%Y-%m-%d'), 
-              data.get('Status', 'Active'), 
-              data['PassengerID'], data['CardTypeID']))
-        
-        conn.commit()
-        card_id = cursor.lastrowid
+        def insert(conn):
+            # Verify passenger and card type exist
+            if conn.execute('SELECT COUNT(*) FROM Passenger WHERE PassengerID = ?',
+                            (data['PassengerID'],)).fetchone()[0] == 0:
+                raise TripOpError("Passenger not found", 404)
+            if conn.execute('SELECT COUNT(*) FROM CardType WHERE CardTypeID = ?',
+                            (data['CardTypeID'],)).fetchone()[0] == 0:
+                raise TripOpError("Card type not found", 404)
+            return conn.execute('''
+                INSERT INTO Card (CardNumber, Balance, IssueDate, Status, PassengerID, CardTypeID)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (data['CardNumber'], data.get('Balance', 0.0), 
+                  datetime.now().strftime('%Y-%m-%d'), 
+                  data.get('Status', 'Active'), 
+                  data['PassengerID'], data['CardTypeID'])).lastrowid
+        
+        card_id = run_write(insert)
         logger.info(f"Created card with ID {card_id}")
         
         return jsonify({"message": "Card created successfully", "CardID": card_id}), 201
         
+    except TripOpError as e:
+        return jsonify({"error": e.message}), e.status
+    except WriteQueueFull:
+        return jsonify({"error": "Server busy, retry"}), 503, {'Retry-After': '1'}
+    except FutureTimeout:
+        return jsonify({"error": "Write timed out"}), 504
     except sqlite3.IntegrityError as e:
         if 'UNIQUE constraint failed' in str(e):
             return jsonify({"error": "Card number already exists"}), 409
@@ -341,25 +794,14 @@ def create_card():
     except Exception as e:
         logger.error(f"Error in create_card: {str(e)}")
         return jsonify({"error": "Failed to create card"}), 500
-    finally:
-        if conn:
-            conn.close()
 
 @app.route('/cards/<int:card_id>', methods=['PUT'])
 def update_card(card_id: int):
     """Update an existing card."""
-    conn = None
     try:
         data = request.get_json()
         if not data:
             return jsonify({"error": "No data provided"}), 400
-            
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM Card WHERE CardID = ?', (card_id,))
-        if not cursor.fetchone():
-            return jsonify({"error": "Card not found"}), 404
         
         update_fields = []
         params = []
@@ -377,46 +819,45 @@ def update_card(card_id: int):
         params.append(card_id)
         update_query = f"UPDATE Card SET {', '.join(update_fields)} WHERE CardID = ?"
         
-        cursor.execute(update_query, params)
-        conn.commit()
+        if run_write(lambda c: c.execute(update_query, params).rowcount) == 0:
+            return jsonify({"error": "Card not found"}), 404
         
         return jsonify({"message": "Card updated successfully"}), 200
         
+    except WriteQueueFull:
+        return jsonify({"error": "Server busy, retry"}), 503, {'Retry-After': '1'}
+    except FutureTimeout:
+        return jsonify({"error": "Write timed out"}), 504
     except sqlite3.Error as e:
         logger.error(f"Database error in update_card: {str(e)}")
         return jsonify({"error": "Failed to update card"}), 500
-    finally:
-        if conn:
-            conn.close()
 
 @app.route('/cards/<int:card_id>', methods=['DELETE'])
 def delete_card(card_id: int):
     """Delete a card."""
-    conn = None
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM Card WHERE CardID = ?', (card_id,))
-        if not cursor.fetchone():
+        deleted = run_write(lambda c: c.execute('DELETE FROM Card WHERE CardID = ?', (card_id,)).rowcount)
+        if deleted == 0:
             return jsonify({"error": "Card not found"}), 404
         
-        cursor.execute('DELETE FROM Card WHERE CardID = ?', (card_id,))
-        conn.commit()
-        
         return jsonify({"message": "Card deleted successfully"}), 200
         
+    except WriteQueueFull:
+        return jsonify({"error": "Server busy, retry"}), 503, {'Retry-After': '1'}
+    except FutureTimeout:
+        return jsonify({"error": "Write timed out"}), 504
     except sqlite3.Error as e:
         logger.error(f"Database error in delete_card: {str(e)}")
         return jsonify({"error": "Failed to delete card"}), 500
-    finally:
-        if conn:
-            conn.close()
 
 
 @app.route('/stations', methods=['GET'])
 def get_stations():
     """Get all stations."""
+    cached, etag = cached_reference_response('stations')
+    if cached is not None:
+        return cached
+    
     conn = None
     try:
         logger.info("Attempting to fetch stations...")
@@ -445,7 +886,7 @@ def get_stations():
         ''')
         stations = [dict(zip(columns, row)) for row in cursor.fetchall()]
         logger.info(f"Successfully fetched {len(stations)} stations")
-        return jsonify(stations), 200
+        return reference_response('stations', etag, stations), 200
         
     except sqlite3.Error as e:
         logger.error(f"Database error in get_stations: {str(e)}")
@@ -460,28 +901,25 @@ def get_stations():
 @app.route('/stations', methods=['POST'])
 def create_station():
     """Create a new station."""
-    conn = None
     try:
         data = request.get_json()
         required_fields = ['StationName']
         
         if not all(field in data for field in required_fields):
             return jsonify({"error": "Missing required fields"}), 400
-            
-        conn = get_db_connection()
-        cursor = conn.cursor()
         
-        cursor.execute('''
+        station_id = run_write(lambda c: c.execute('''
             INSERT INTO Station (StationName, LineColor)
             VALUES (?, ?)
-        ''', (data['StationName'], data.get('LineColor')))
-        
-        conn.commit()
-        station_id = cursor.lastrowid
+        ''', (data['StationName'], data.get('LineColor'))).lastrowid)
         logger.info(f"Created station with ID {station_id}")
         
         return jsonify({"message": "Station created successfully", "StationID": station_id}), 201
         
+    except WriteQueueFull:
+        return jsonify({"error": "Server busy, retry"}), 503, {'Retry-After': '1'}
+    except FutureTimeout:
+        return jsonify({"error": "Write timed out"}), 504
     except sqlite3.IntegrityError as e:
         if 'UNIQUE constraint failed' in str(e):
             return jsonify({"error": "Station name already exists"}), 409
@@ -490,25 +928,14 @@ def create_station():
     except Exception as e:
         logger.error(f"Error in create_station: {str(e)}")
         return jsonify({"error": "Failed to create station"}), 500
-    finally:
-        if conn:
-            conn.close()
 
 @app.route('/stations/<int:station_id>', methods=['PUT'])
 def update_station(station_id: int):
     """Update an existing station."""
-    conn = None
     try:
         data = request.get_json()
         if not data:
             return jsonify({"error": "No data provided"}), 400
-            
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM Station WHERE StationID = ?', (station_id,))
-        if not cursor.fetchone():
-            return jsonify({"error": "Station not found"}), 404
         
         update_fields = []
         params = []
@@ -526,11 +953,15 @@ def update_station(station_id: int):
         params.append(station_id)
         update_query = f"UPDATE Station SET {', '.join(update_fields)} WHERE StationID = ?"
         
-        cursor.execute(update_query, params)
-        conn.commit()
+        if run_write(lambda c: c.execute(update_query, params).rowcount) == 0:
+            return jsonify({"error": "Station not found"}), 404
         
         return jsonify({"message": "Station updated successfully"}), 200
         
+    except WriteQueueFull:
+        return jsonify({"error": "Server busy, retry"}), 503, {'Retry-After': '1'}
+    except FutureTimeout:
+        return jsonify({"error": "Write timed out"}), 504
     except sqlite3.IntegrityError as e:
         if 'UNIQUE constraint failed' in str(e):
             return jsonify({"error": "Station name already exists"}), 409
@@ -538,37 +969,32 @@ def update_station(station_id: int):
     except sqlite3.Error as e:
         logger.error(f"Database error in update_station: {str(e)}")
         return jsonify({"error": "Failed to update station"}), 500
-    finally:
-        if conn:
-            conn.close()
 
 @app.route('/stations/<int:station_id>', methods=['DELETE'])
 def delete_station(station_id: int):
     """Delete a station."""
-    conn = None
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM Station WHERE StationID = ?', (station_id,))
-        if not cursor.fetchone():
+        deleted = run_write(lambda c: c.execute('DELETE FROM Station WHERE StationID = ?', (station_id,)).rowcount)
+        if deleted == 0:
             return jsonify({"error": "Station not found"}), 404
         
-        cursor.execute('DELETE FROM Station WHERE StationID = ?', (station_id,))
-        conn.commit()
-        
         return jsonify({"message": "Station deleted successfully"}), 200
         
+    except WriteQueueFull:
+        return jsonify({"error": "Server busy, retry"}), 503, {'Retry-After': '1'}
+    except FutureTimeout:
+        return jsonify({"error": "Write timed out"}), 504
     except sqlite3.Error as e:
         logger.error(f"Database error in delete_station: {str(e)}")
         return jsonify({"error": "Failed to delete station"}), 500
-    finally:
-        if conn:
-            conn.close()
 
 @app.route('/card-types', methods=['GET'])
 def get_card_types():
     """Get all card types."""
+    cached, etag = cached_reference_response('card-types')
+    if cached is not None:
+        return cached
+    
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
@@ -576,7 +1002,7 @@ def get_card_types():
             SELECT * FROM CardType ORDER BY TypeName
         ''')
         card_types = [dict(row) for row in cursor.fetchall()]
-        return jsonify(card_types), 200
+        return reference_response('card-types', etag, card_types), 200
     except sqlite3.Error as e:
         logger.error(f"Error fetching card types: {e}")
         return jsonify({"error": "Failed to fetch card types"}), 500
@@ -587,28 +1013,25 @@ def get_card_types():
 @app.route('/card-types', methods=['POST'])
 def create_card_type():
     """Create a new card type."""
-    conn = None
     try:
         data = request.get_json()
         required_fields = ['TypeName', 'BaseFareMultiplier']
         
         if not all(field in data for field in required_fields):
             return jsonify({"error": "Missing required fields"}), 400
-            
-        conn = get_db_connection()
-        cursor = conn.cursor()
         
-        cursor.execute('''
+        card_type_id = run_write(lambda c: c.execute('''
             INSERT INTO CardType (TypeName, BaseFareMultiplier, Description)
             VALUES (?, ?, ?)
-        ''', (data['TypeName'], data['BaseFareMultiplier'], data.get('Description', '')))
-        
-        conn.commit()
-        card_type_id = cursor.lastrowid
+        ''', (data['TypeName'], data['BaseFareMultiplier'], data.get('Description', ''))).lastrowid)
         logger.info(f"Created card type with ID {card_type_id}")
         
         return jsonify({"message": "Card type created successfully", "CardTypeID": card_type_id}), 201
         
+    except WriteQueueFull:
+        return jsonify({"error": "Server busy, retry"}), 503, {'Retry-After': '1'}
+    except FutureTimeout:
+        return jsonify({"error": "Write timed out"}), 504
     except sqlite3.IntegrityError as e:
         if 'UNIQUE constraint failed' in str(e):
             return jsonify({"error": "Card type name already exists"}), 409
@@ -617,25 +1040,14 @@ def create_card_type():
     except Exception as e:
         logger.error(f"Error in create_card_type: {str(e)}")
         return jsonify({"error": "Failed to create card type"}), 500
-    finally:
-        if conn:
-            conn.close()
 
 @app.route('/card-types/<int:card_type_id>', methods=['PUT'])
 def update_card_type(card_type_id: int):
     """Update an existing card type."""
-    conn = None
     try:
         data = request.get_json()
         if not data:
             return jsonify({"error": "No data provided"}), 400
-            
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM CardType WHERE CardTypeID = ?', (card_type_id,))
-        if not cursor.fetchone():
-            return jsonify({"error": "Card type not found"}), 404
         
         update_fields = []
         params = []
@@ -656,11 +1068,15 @@ def update_card_type(card_type_id: int):
         params.append(card_type_id)
         update_query = f"UPDATE CardType SET {', '.join(update_fields)} WHERE CardTypeID = ?"
         
-        cursor.execute(update_query, params)
-        conn.commit()
+        if run_write(lambda c: c.execute(update_query, params).rowcount) == 0:
+            return jsonify({"error": "Card type not found"}), 404
         
         return jsonify({"message": "Card type updated successfully"}), 200
         
+    except WriteQueueFull:
+        return jsonify({"error": "Server busy, retry"}), 503, {'Retry-After': '1'}
+    except FutureTimeout:
+        return jsonify({"error": "Write timed out"}), 504
     except sqlite3.IntegrityError as e:
         if 'UNIQUE constraint failed' in str(e):
             return jsonify({"error": "Card type name already exists"}), 409
@@ -668,61 +1084,101 @@ def update_card_type(card_type_id: int):
     except sqlite3.Error as e:
         logger.error(f"Database error in update_card_type: {str(e)}")
         return jsonify({"error": "Failed to update card type"}), 500
-    finally:
-        if conn:
-            conn.close()
 
 @app.route('/card-types/<int:card_type_id>', methods=['DELETE'])
 def delete_card_type(card_type_id: int):
     """Delete a card type."""
-    conn = None
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM CardType WHERE CardTypeID = ?', (card_type_id,))
-        if not cursor.fetchone():
+        deleted = run_write(lambda c: c.execute('DELETE FROM CardType WHERE CardTypeID = ?', (card_type_id,)).rowcount)
+        if deleted == 0:
             return jsonify({"error": "Card type not found"}), 404
         
-        cursor.execute('DELETE FROM CardType WHERE CardTypeID = ?', (card_type_id,))
-        conn.commit()
-        
         return jsonify({"message": "Card type deleted successfully"}), 200
         
+    except WriteQueueFull:
+        return jsonify({"error": "Server busy, retry"}), 503, {'Retry-After': '1'}
+    except FutureTimeout:
+        return jsonify({"error": "Write timed out"}), 504
     except sqlite3.Error as e:
         logger.error(f"Database error in delete_card_type: {str(e)}")
         return jsonify({"error": "Failed to delete card type"}), 500
-    finally:
-        if conn:
-            conn.close()
+
+TRIPS_SELECT = """
+    SELECT
+        t.TripID, t.EntryTime, t.ExitTime, t.FareAmount,
+        c.CardNumber, p.PassengerID, p.FirstName, p.LastName,
+        es.StationID as EntryStationID, es.StationName as EntryStation,
+        xs.StationID as ExitStationID, xs.StationName as ExitStation
+    FROM Trip t
+    JOIN Card c ON t.CardID = c.CardID
+    JOIN Passenger p ON c.PassengerID = p.PassengerID
+    LEFT JOIN Station es ON t.EntryStationID = es.StationID
+    LEFT JOIN Station xs ON t.ExitStationID = xs.StationID
+"""
+TRIPS_ORDER = [('t.EntryTime', 'EntryTime'), ('t.TripID', 'TripID')]
 
 @app.route('/trips', methods=['GET'])
 def get_trips():
-    """Get all trips with related information."""
+    """
+    Get trips with related information, newest first, one page at a time.
+
+    Query parameters: limit, after (cursor), cardId, passengerId, stationId
+    (entry or exit), status (open/closed), from/to (EntryTime, to is exclusive).
+    Pages are ordered by (EntryTime, TripID) descending.
+    
+    With ?stream=1 or Accept: application/x-ndjson every matching row is
+    streamed (as a JSON array or NDJSON) instead of a single page.
+    """
+    conn = None
     try:
+        limit = parse_limit(request.args.get('limit'))
+        filters, params = [], []
+        
+        card_id = request.args.get('cardId', type=int)
+        if card_id is not None:
+            filters.append("t.CardID = ?")
+            params.append(card_id)
+        passenger_id = request.args.get('passengerId', type=int)
+        if passenger_id is not None:
+            filters.append("c.PassengerID = ?")
+            params.append(passenger_id)
+        station_id = request.args.get('stationId', type=int)
+        if station_id is not None:
+            filters.append("(t.EntryStationID = ? OR t.ExitStationID = ?)")
+            params.extend([station_id, station_id])
+        status = request.args.get('status')
+        if status == 'open':
+            filters.append("t.ExitTime IS NULL")
+        elif status == 'closed':
+            filters.append("t.ExitTime IS NOT NULL")
+        elif status:
+            return jsonify({"error": "status must be 'open' or 'closed'"}), 400
+        if request.args.get('from'):
+            filters.append("t.EntryTime >= ?")
+            params.append(request.args['from'])
+        if request.args.get('to'):
+            filters.append("t.EntryTime < ?")
+            params.append(request.args['to'])
+        
+        if wants_stream(request):
+            sql, values = build_keyset_query(TRIPS_SELECT, TRIPS_ORDER, descending=True,
+                                             filters=filters, params=params,
+                                             after=request.args.get('after'))
+            return stream_response(get_read_pool().acquire, sql, values, ndjson=wants_ndjson(request))
+        
         conn = get_db_connection()
-        cursor = conn.cursor()
-        query = """
-        SELECT
-            t.TripID, t.EntryTime, t.ExitTime, t.FareAmount,
-            c.CardNumber, p.PassengerID, p.FirstName, p.LastName,
-            es.StationID as EntryStationID, es.StationName as EntryStation,
-            xs.StationID as ExitStationID, xs.StationName as ExitStation
-        FROM Trip t
-        JOIN Card c ON t.CardID = c.CardID
-        JOIN Passenger p ON c.PassengerID = p.PassengerID
-        LEFT JOIN Station es ON t.EntryStationID = es.StationID
-        LEFT JOIN Station xs ON t.ExitStationID = xs.StationID
-        ORDER BY t.EntryTime DESC
-        """
-        cursor.execute(query)
-        trips = [dict(row) for row in cursor.fetchall()]
-        return jsonify(trips)
+        trips, next_cursor = keyset_page(
+            conn, TRIPS_SELECT, TRIPS_ORDER, descending=True,
+            filters=filters, params=params,
+            after=request.args.get('after'), limit=limit)
+        return page_response(trips, next_cursor)
+    except PaginationError as e:
+        return jsonify({"error": str(e)}), 400
     except sqlite3.Error as e:
         logger.error(f"Error fetching trips: {e}")
         return jsonify({"error": "Failed to fetch trips"}), 500
     finally:
-        if 'conn' in locals():
+        if conn:
             conn.close()
 
 @app.route('/trips', methods=['POST'])
@@ -744,196 +1200,484 @@ def create_trip():
             'ExitStationID': int(data['exitStationId']) if data.get('exitStationId') else None
         }
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
         query = """
         INSERT INTO Trip (EntryTime, ExitTime, FareAmount, CardID, EntryStationID, ExitStationID)
         VALUES (:EntryTime, :ExitTime, :FareAmount, :CardID, :EntryStationID, :ExitStationID)
         """
         
-        cursor.execute(query, trip_data)
-        trip_id = cursor.lastrowid
-        conn.commit()
+        trip_id = run_write(lambda c: c.execute(query, trip_data).lastrowid)
         
         return jsonify({"id": trip_id, "message": "Trip recorded successfully"}), 201
         
     except ValueError as e:
         logger.error(f"Invalid input: {e}")
         return jsonify({"error": "Invalid input data"}), 400
+    except WriteQueueFull:
+        return jsonify({"error": "Server busy, retry"}), 503, {'Retry-After': '1'}
+    except FutureTimeout:
+        return jsonify({"error": "Write timed out"}), 504
     except sqlite3.Error as e:
         logger.error(f"Database error: {e}")
         return jsonify({"error": "Failed to record trip"}), 500
     except Exception as e:
         logger.error(f"Error creating trip: {e}")
         return jsonify({"error": "An unexpected error occurred"}), 500
+
+@app.route('/trips/<int:trip_id>/exit', methods=['POST'])
+def exit_trip_route(trip_id):
+    """
+    Tap out: close an open trip, price it from the fare matrix, debit the
+    card and record a 'Fare' transaction, all in one transaction.
+
+    Body: {"exitStationId": 3, "exitTime": "YYYY-MM-DD HH:MM:SS" (optional)}
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        if 'exitStationId' not in data:
+            return jsonify({"error": "Missing required fields"}), 400
+        exit_station_id = int(data['exitStationId'])
+        exit_time = data.get('exitTime') or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        
+        refresh_fares()
+        trip = run_write(lambda c: exit_trip(c, fare_engine, trip_id, exit_station_id, exit_time))
+        
+        return jsonify(trip), 200
+        
+    except TripOpError as e:
+        return jsonify({"error": e.message}), e.status
+    except (ValueError, TypeError) as e:
+        logger.error(f"Invalid input: {e}")
+        return jsonify({"error": "Invalid input data"}), 400
+    except WriteQueueFull:
+        return jsonify({"error": "Server busy, retry"}), 503, {'Retry-After': '1'}
+    except FutureTimeout:
+        return jsonify({"error": "Write timed out"}), 504
+    except sqlite3.Error as e:
+        if is_lock_error(e):
+            metrics.inc('sqlite_busy_errors_total')
+            logger.warning(f"Trip exit {trip_id} gave up waiting for the write lock: {e}")
+            return jsonify({"error": "Database busy, retry"}), 503, {'Retry-After': '1'}
+        logger.error(f"Database error in exit_trip: {e}")
+        return jsonify({"error": "Failed to complete trip"}), 500
+
+@app.route('/trips/batch', methods=['POST'])
+def create_trips_batch():
+    """
+    Ingest a batch of gate tap events in one transaction.
+
+    Body is a JSON array (or {"events": [...]}) or, with Content-Type
+    application/x-ndjson, one event per line. Each event is
+    {"type": "entry"|"exit", "cardId", "stationId", "time"}. Exits are
+    priced and debited like POST /trips/<id>/exit. Invalid or refused
+    events are reported per item and do not affect the others.
+    """
+    try:
+        if request.mimetype == NDJSON_MIMETYPE:
+            events = [json.loads(line) for line in request.get_data(as_text=True).splitlines() if line.strip()]
+        else:
+            events = request.get_json(silent=True)
+            if isinstance(events, dict):
+                events = events.get('events')
+        if not isinstance(events, list):
+            return jsonify({"error": "Expected a JSON array of events or NDJSON"}), 400
+        if len(events) > MAX_BATCH_EVENTS:
+            return jsonify({"error": f"At most {MAX_BATCH_EVENTS} events per batch"}), 413
+        
+        refresh_fares()
+        results = run_write(lambda c: ingest_tap_events(c, fare_engine, events))
+        accepted = sum(r['ok'] for r in results)
+        
+        return jsonify({'accepted': accepted, 'rejected': len(results) - accepted, 'results': results}), 200
+        
+    except json.JSONDecodeError as e:
+        return jsonify({"error": f"Invalid NDJSON: {e}"}), 400
+    except WriteQueueFull:
+        return jsonify({"error": "Server busy, retry"}), 503, {'Retry-After': '1'}
+    except FutureTimeout:
+        return jsonify({"error": "Write timed out"}), 504
+    except sqlite3.Error as e:
+        if is_lock_error(e):
+            metrics.inc('sqlite_busy_errors_total')
+            logger.warning(f"Tap batch gave up waiting for the write lock: {e}")
+            return jsonify({"error": "Database busy, retry"}), 503, {'Retry-After': '1'}
+        logger.error(f"Database error in create_trips_batch: {e}")
+        return jsonify({"error": "Failed to record trips"}), 500
+
+@app.route('/fares/quote', methods=['GET'])
+def quote_fare():
+    """
+    Price a journey from the in-memory fare matrix.
+
+    Query parameters: from, to (StationIDs), cardTypeId (optional, applies
+    the card type's BaseFareMultiplier), at (optional travel time, decides
+    peak vs off-peak; defaults to now).
+    """
+    try:
+        from_id = request.args.get('from', type=int)
+        to_id = request.args.get('to', type=int)
+        if from_id is None or to_id is None:
+            return jsonify({"error": "from and to station IDs are required"}), 400
+        card_type_id = request.args.get('cardTypeId', type=int)
+        at = request.args.get('at')
+        
+        refresh_fares()
+        if card_type_id is not None and not fare_engine.has_card_type(card_type_id):
+            return jsonify({"error": "Card type not found"}), 404
+        
+        quote = fare_engine.quote(from_id, to_id, card_type_id, at)
+        if quote is None:
+            return jsonify({"error": "No fare rule for this journey"}), 404
+        
+        return jsonify({'from': from_id, 'to': to_id, 'cardTypeId': card_type_id, 'at': at, **quote}), 200
+        
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except sqlite3.Error as e:
+        logger.error(f"Database error in quote_fare: {str(e)}")
+        return jsonify({"error": "Failed to load fares"}), 500
+
+@app.route('/fares/quote/batch', methods=['POST'])
+def quote_fares_batch():
+    """
+    Price many journeys in one vectorized call.
+
+    Body is either columnar, {"from": [...], "to": [...], "cardTypeId": id or
+    [...], "at": time or [...]}, or a list of objects, {"quotes": [{"from",
+    "to", "cardTypeId", "at"}, ...]}. The response holds parallel arrays;
+    journeys that cannot be priced get null.
+    """
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({"error": "No data provided"}), 400
+        
+        if 'quotes' in data:
+            quotes = data['quotes']
+            from_ids = [q.get('from') for q in quotes]
+            to_ids = [q.get('to') for q in quotes]
+            card_type_ids = [q.get('cardTypeId') for q in quotes]
+            at = [q.get('at') for q in quotes]
+        else:
+            from_ids = data.get('from', [])
+            to_ids = data.get('to', [])
+            card_type_ids = data.get('cardTypeId')
+            at = data.get('at')
+            if card_type_ids is not None and not isinstance(card_type_ids, list):
+                card_type_ids = [card_type_ids] * len(from_ids)
+        
+        if any(i is None for i in from_ids) or any(i is None for i in to_ids):
+            return jsonify({"error": "Every journey needs from and to station IDs"}), 400
+        
+        refresh_fares()
+        result = fare_engine.quote_many(from_ids, to_ids, card_type_ids, at)
+        
+        return jsonify({
+            'count': len(from_ids),
+            'fare': to_json_list(result['fare']),
+            'baseFare': to_json_list(result['baseFare']),
+            'fareType': result['fareType'],
+        }), 200
+        
+    except (ValueError, TypeError, AttributeError) as e:
+        return jsonify({"error": f"Invalid input data: {str(e)}"}), 400
+    except sqlite3.Error as e:
+        logger.error(f"Database error in quote_fares_batch: {str(e)}")
+        return jsonify({"error": "Failed to load fares"}), 500
+
+# ==================== SEARCH ====================
+
+@app.route('/search', methods=['GET'])
+def search_records():
+    """
+    Full-text search over passengers, cards or stations, best match first.
+
+    Query parameters: q (every word must match the start of a word in a
+    name, email, phone, card number or station name), type (passengers,
+    cards or stations), limit, after (cursor). Items have the same shape
+    as the matching list endpoint.
+    """
+    conn = None
+    try:
+        limit = parse_limit(request.args.get('limit'))
+        conn = get_db_connection()
+        items, next_cursor = search(conn, request.args.get('type', 'passengers'),
+                                    request.args.get('q', ''),
+                                    after=request.args.get('after'), limit=limit)
+        return page_response(items, next_cursor)
+    except (PaginationError, SearchError) as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error searching: {str(e)}")
+        return jsonify({'error': str(e)}), 500
     finally:
-        if 'conn' in locals():
+        if conn:
+            conn.close()
+
+# ==================== ANALYTICS ====================
+
+@app.route('/analytics/ridership', methods=['GET'])
+def get_ridership():
+    """
+    Entries, exits and fare revenue per time bucket, from the station-hour rollup.
+
+    Query parameters: bucket (hour, day, week or month; default day), from,
+    to (truncated to the hour, to exclusive), stationId, line (LineColor).
+    """
+    conn = None
+    try:
+        conn = get_db_connection()
+        series = ridership(conn, request.args.get('bucket', 'day'),
+                           date_from=request.args.get('from'), date_to=request.args.get('to'),
+                           station_id=request.args.get('stationId', type=int),
+                           line=request.args.get('line'))
+        return jsonify({'bucket': request.args.get('bucket', 'day'), 'series': series}), 200
+    except RollupQueryError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error fetching ridership: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+    finally:
+        if conn:
             conn.close()
 
+@app.route('/analytics/revenue', methods=['GET'])
+def get_revenue():
+    """
+    Revenue per time bucket: fare revenue by exit station and time, plus
+    trips, fare spend and top-ups by card type from the daily rollup.
+
+    Query parameters: as for /analytics/ridership, plus cardTypeId (day,
+    week or month buckets without stationId/line only).
+    """
+    conn = None
+    try:
+        conn = get_db_connection()
+        series = revenue(conn, request.args.get('bucket', 'day'),
+                         date_from=request.args.get('from'), date_to=request.args.get('to'),
+                         station_id=request.args.get('stationId', type=int),
+                         line=request.args.get('line'),
+                         card_type_id=request.args.get('cardTypeId', type=int))
+        return jsonify({'bucket': request.args.get('bucket', 'day'), 'series': series}), 200
+    except RollupQueryError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error fetching revenue: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+    finally:
+        if conn:
+            conn.close()
+
+@app.route('/analytics/od-matrix', methods=['GET'])
+def get_od_matrix():
+    """
+    Origin-destination matrix: completed trips by entry and exit station,
+    including archived trips.
+
+    Query parameters: from, to (EntryTime, to exclusive), hours (entry hour
+    slice such as 7-10 or 22-2), cardTypeId, format (dense or sparse;
+    default dense).
+    """
+    conn = None
+    try:
+        fmt = request.args.get('format', 'dense')
+        if fmt not in OD_FORMATS:
+            raise ODQueryError(f"format must be one of {', '.join(OD_FORMATS)}")
+        hours = parse_hours(request.args.get('hours'))
+        conn = get_db_connection()
+        matrix = od_matrix(conn, date_from=request.args.get('from'), date_to=request.args.get('to'),
+                           hours=hours, card_type_id=request.args.get('cardTypeId', type=int),
+                           cold=get_cold_store())
+        return jsonify(matrix.to_json(station_ids(conn), fmt)), 200
+    except ODQueryError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error building OD matrix: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+    finally:
+        if conn:
+            conn.close()
+
+# ==================== BULK IMPORT ====================
+
+@app.route('/import/<entity>', methods=['POST'])
+def import_records(entity: str):
+    """
+    Stream a CSV (with header) or NDJSON body of passengers or cards into the
+    database in large chunks. Rejected rows are reported, not fatal.
+
+    Query parameters: format (csv|ndjson, default from Content-Type),
+    jobId (resume an interrupted import; send the same file again),
+    source (label stored with the job, e.g. the file name).
+    """
+    conn = None
+    try:
+        if entity not in IMPORT_ENTITIES:
+            return jsonify({"error": f"Unknown import type; expected one of {', '.join(IMPORT_ENTITIES)}"}), 404
+        fmt = request.args.get('format') or ('ndjson' if request.mimetype == NDJSON_MIMETYPE else 'csv')
+        resume_job_id = request.args.get('jobId', type=int)
+        
+        conn = get_db_connection()
+        stream = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+        result = run_import(conn, entity, stream, fmt, source=request.args.get('source'),
+                            resume_job_id=resume_job_id, write=run_write)
+        
+        return jsonify(result), 200
+        
+    except ImportJobError as e:
+        return jsonify({"error": str(e)}), 400
+    except UnicodeDecodeError as e:
+        return jsonify({"error": "Import body must be UTF-8", "jobId": getattr(e, 'job_id', None)}), 400
+    except csv.Error as e:
+        return jsonify({"error": f"Malformed CSV: {e}", "jobId": getattr(e, 'job_id', None)}), 400
+    except Exception as e:
+        logger.error(f"Error in import_records: {str(e)}")
+        return jsonify({"error": "Import failed; send the same file again with jobId to resume",
+                        "jobId": getattr(e, 'job_id', None)}), 500
+    finally:
+        if conn:
+            conn.close()
+
+@app.route('/import/jobs/<int:job_id>', methods=['GET'])
+def get_import_job(job_id: int):
+    """Progress and totals of a bulk import job."""
+    conn = None
+    try:
+        conn = get_db_connection()
+        job = get_job(conn, job_id)
+        if job is None:
+            return jsonify({"error": "Import job not found"}), 404
+        return jsonify(job), 200
+    except sqlite3.Error as e:
+        logger.error(f"Database error in get_import_job: {str(e)}")
+        return jsonify({"error": "Failed to fetch import job"}), 500
+    finally:
+        if conn:
+            conn.close()
+
+# ==================== EXPORT ====================
+
+@app.route('/export/<kind>', methods=['GET'])
+def export_history(kind: str):
+    """
+    Stream the full trip or transaction history as CSV or NDJSON.
+
+    Query parameters: from, to (date range on TransactionDate / EntryTime,
+    `to` exclusive), cardId, format (csv|ndjson), compress=gzip, and afterId
+    to resume an interrupted download after the last ID received. Rows come
+    in primary key order from a server-side cursor, so memory stays flat;
+    archived rows are merged in from the cold tier.
+    """
+    if kind not in EXPORTS:
+        return jsonify({"error": f"Unknown export; expected one of {', '.join(EXPORTS)}"}), 404
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"error": f"format must be one of {', '.join(EXPORT_FORMATS)}"}), 400
+    compress = request.args.get('compress') == 'gzip'
+    
+    body = iter_export(get_read_pool().acquire, kind, fmt, compress,
+                       date_from=request.args.get('from'),
+                       date_to=request.args.get('to'),
+                       card_id=request.args.get('cardId', type=int),
+                       after_id=request.args.get('afterId', type=int),
+                       cold=get_cold_store())
+    mimetype, headers = export_headers(kind, fmt, compress)
+    return Response(body, mimetype=mimetype, headers=headers)
+
 # ==================== MAIN ====================
 
 def initialize_database():
-    """Initialize the database if it doesn't exist."""
+    """Create or upgrade the database schema and apply the storage profile."""
+    conn = None
     try:
         # Create database directory if it doesn't exist
         os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
         
         conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
+        profile = get_storage_profile()
+        apply_database_settings(conn, profile)
+        apply_connection_settings(conn, profile)
         
-        # Create tables if they don't exist
-        cursor.executescript('''
-            CREATE TABLE IF NOT EXISTS CardType (
-                CardTypeID INTEGER PRIMARY KEY AUTOINCREMENT,
-                TypeName TEXT NOT NULL UNIQUE,
-                BaseFareMultiplier REAL NOT NULL DEFAULT 1.0,
-                Description TEXT
-            );
-            
-            CREATE TABLE IF NOT EXISTS Passenger (
-                PassengerID INTEGER PRIMARY KEY AUTOINCREMENT,
-                FirstName TEXT NOT NULL,
-                LastName TEXT NOT NULL,
-                Email TEXT UNIQUE NOT NULL,
-                PhoneNumber TEXT,
-                RegistrationDate TEXT NOT NULL
-            );
-            
-            CREATE TABLE IF NOT EXISTS Station (
-                StationID INTEGER PRIMARY KEY AUTOINCREMENT,
-                StationName TEXT NOT NULL UNIQUE,
-                LineColor TEXT
-            );
-            
-            CREATE TABLE IF NOT EXISTS Card (
-                CardID INTEGER PRIMARY KEY AUTOINCREMENT,
-                CardNumber TEXT UNIQUE NOT NULL,
-                Balance REAL NOT NULL DEFAULT 0.0,
-                IssueDate TEXT NOT NULL,
-                Status TEXT NOT NULL CHECK(Status IN ('Active', 'Inactive', 'Blocked')),
-                PassengerID INTEGER,
-                CardTypeID INTEGER,
-                FOREIGN KEY (PassengerID) REFERENCES Passenger(PassengerID),
-                FOREIGN KEY (CardTypeID) REFERENCES CardType(CardTypeID)
-            );
-            
-            CREATE TABLE IF NOT EXISTS [Transaction] (
-                TransactionID INTEGER PRIMARY KEY AUTOINCREMENT,
-                TransactionType TEXT NOT NULL,
-                Amount REAL NOT NULL,
-                TransactionDate TEXT NOT NULL,
-                CardID INTEGER,
-                FOREIGN KEY (CardID) REFERENCES Card(CardID)
-            );
-            
-            CREATE TABLE IF NOT EXISTS FareRule (
-                FareRuleID INTEGER PRIMARY KEY AUTOINCREMENT,
-                StartStationID INTEGER,
-                EndStationID INTEGER,
-                FareType TEXT,
-                FareAmount REAL NOT NULL,
-                FOREIGN KEY (StartStationID) REFERENCES Station(StationID),
-                FOREIGN KEY (EndStationID) REFERENCES Station(StationID),
-                UNIQUE (StartStationID, EndStationID, FareType)
-            );
-            
-            CREATE TABLE IF NOT EXISTS Trip (
-                TripID INTEGER PRIMARY KEY AUTOINCREMENT,
-                EntryTime TEXT NOT NULL,
-                ExitTime TEXT,
-                FareAmount REAL,
-                CardID INTEGER NOT NULL,
-                EntryStationID INTEGER NOT NULL,
-                ExitStationID INTEGER,
-                FOREIGN KEY (CardID) REFERENCES Card(CardID),
-                FOREIGN KEY (EntryStationID) REFERENCES Station(StationID),
-                FOREIGN KEY (ExitStationID) REFERENCES Station(StationID)
-            );
-        ''')
-        
-        # Insert default card types if they don't exist
-        cursor.execute('SELECT COUNT(*) FROM CardType')
-        if cursor.fetchone()[0] == 0:
-            cursor.executemany(
-                'INSERT INTO CardType (TypeName, BaseFareMultiplier, Description) VALUES (?, ?, ?)',
-                [
-                    ('Regular', 1.0, 'Standard fare card'),
-                    ('Student', 0.5, 'Discounted fare for students'),
-                    ('Senior', 0.7, 'Discounted fare for senior citizens'),
-                    ('Monthly', 0.9, 'Monthly subscription card')
-                ]
-            )
-        
-        # Insert sample stations if they don't exist
-        cursor.execute('SELECT COUNT(*) FROM Station')
-        station_count = cursor.fetchone()[0]
-        logger.info(f"Found {station_count} existing stations in the database")
-        
-        if station_count == 0:
-            stations = [
-                ('Central Station', 'Blue'),
-                ('Downtown', 'Blue'),
-                ('University', 'Red'),
-                ('City Park', 'Green'),
-                ('Terminal', 'Red')
-            ]
-            logger.info("Inserting sample stations...")
-            try:
-                cursor.executemany(
-                    'INSERT INTO Station (StationName, LineColor) VALUES (?, ?)',
-                    stations
-                )
-                logger.info(f"Successfully inserted {len(stations)} stations")
-                
-                # Verify the insertion
-                cursor.execute('SELECT * FROM Station')
-                inserted_stations = cursor.fetchall()
-                logger.info(f"Current stations in database: {inserted_stations}")
-                
-            except sqlite3.Error as e:
-                logger.error(f"Error inserting stations: {e}")
-                raise
-        
-        conn.commit()
+        # Apply pending schema migrations (a no-op when already up to date)
+        migrate(conn)
+        checkpoint(conn, 'TRUNCATE')
         logger.info("Database initialized successfully")
         
     except Exception as e:
         logger.error(f"Error initializing database: {e}")
         raise
     finally:
-        conn.close()
+        if conn:
+            conn.close()
+
+TRANSACTIONS_SELECT = '''
+    SELECT 
+        t.TransactionID,
+        t.TransactionType,
+        t.Amount,
+        t.TransactionDate,
+        c.CardNumber,
+        p.FirstName || ' ' || p.LastName as PassengerName,
+        p.PassengerID
+    FROM [Transaction] t
+    JOIN Card c ON t.CardID = c.CardID
+    JOIN Passenger p ON c.PassengerID = p.PassengerID
+'''
+TRANSACTIONS_ORDER = [('t.TransactionDate', 'TransactionDate'), ('t.TransactionID', 'TransactionID')]
 
 @app.route('/transactions', methods=['GET'])
 def get_transactions():
-    """Get all transactions with related card and passenger information."""
+    """
+    Get transactions with related card and passenger information, newest first.
+
+    Query parameters: limit, after (cursor), cardId, passengerId, type,
+    from/to (TransactionDate, to is exclusive). Pages are ordered by
+    (TransactionDate, TransactionID) descending.
+    
+    With ?stream=1 or Accept: application/x-ndjson every matching row is
+    streamed (as a JSON array or NDJSON) instead of a single page.
+    """
     conn = None
     try:
-        logger.info("Fetching transactions...")
+        limit = parse_limit(request.args.get('limit'))
+        filters, params = [], []
+        
+        card_id = request.args.get('cardId', type=int)
+        if card_id is not None:
+            filters.append("t.CardID = ?")
+            params.append(card_id)
+        passenger_id = request.args.get('passengerId', type=int)
+        if passenger_id is not None:
+            filters.append("c.PassengerID = ?")
+            params.append(passenger_id)
+        if request.args.get('type'):
+            filters.append("t.TransactionType = ?")
+            params.append(request.args['type'])
+        if request.args.get('from'):
+            filters.append("t.TransactionDate >= ?")
+            params.append(request.args['from'])
+        if request.args.get('to'):
+            filters.append("t.TransactionDate < ?")
+            params.append(request.args['to'])
+        
+        if wants_stream(request):
+            sql, values = build_keyset_query(TRANSACTIONS_SELECT, TRANSACTIONS_ORDER, descending=True,
+                                             filters=filters, params=params,
+                                             after=request.args.get('after'))
+            return stream_response(get_read_pool().acquire, sql, values, ndjson=wants_ndjson(request))
+        
         conn = get_db_connection()
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
         
         # Get transactions with card and passenger details
-        cursor.execute('''
-            SELECT 
-                t.TransactionID,
-                t.TransactionType,
-                t.Amount,
-                t.TransactionDate,
-                c.CardNumber,
-                p.FirstName || ' ' || p.LastName as PassengerName,
-                p.PassengerID
-            FROM [Transaction] t
-            JOIN Card c ON t.CardID = c.CardID
-            JOIN Passenger p ON c.PassengerID = p.PassengerID
-            ORDER BY t.TransactionDate DESC
-        ''')
+        transactions, next_cursor = keyset_page(
+            conn, TRANSACTIONS_SELECT, TRANSACTIONS_ORDER, descending=True,
+            filters=filters, params=params,
+            after=request.args.get('after'), limit=limit)
         
-        transactions = [dict(row) for row in cursor.fetchall()]
         logger.info(f"Fetched {len(transactions)} transactions")
-        return jsonify(transactions), 200
+        return page_response(transactions, next_cursor)
         
+    except PaginationError as e:
+        return jsonify({"error": str(e)}), 400
     except sqlite3.Error as e:
         logger.error(f"Database error in get_transactions: {str(e)}")
         return jsonify({"error": f"Database error: {str(e)}"}), 500
@@ -947,6 +1691,10 @@ def get_transactions():
 @app.route('/fare-rules', methods=['GET'])
 def get_fare_rules():
     """Get all fare rules with station details."""
+    cached, etag = cached_reference_response('fare-rules')
+    if cached is not None:
+        return cached
+    
     conn = None
     try:
         logger.info("Fetching fare rules...")
@@ -971,7 +1719,7 @@ def get_fare_rules():
         
         fare_rules = [dict(row) for row in cursor.fetchall()]
         logger.info(f"Fetched {len(fare_rules)} fare rules")
-        return jsonify(fare_rules), 200
+        return reference_response('fare-rules', etag, fare_rules), 200
         
     except sqlite3.Error as e:
         logger.error(f"Database error in get_fare_rules: {str(e)}")
@@ -986,35 +1734,34 @@ def get_fare_rules():
 @app.route('/fare-rules', methods=['POST'])
 def create_fare_rule():
     """Create a new fare rule."""
-    conn = None
     try:
         data = request.get_json()
         required_fields = ['StartStationID', 'EndStationID', 'FareType', 'FareAmount']
         
         if not all(field in data for field in required_fields):
             return jsonify({"error": "Missing required fields"}), 400
-            
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Check if stations exist
-        cursor.execute('SELECT COUNT(*) FROM Station WHERE StationID IN (?, ?)', 
-                      (data['StartStationID'], data['EndStationID']))
-        if cursor.fetchone()[0] != 2:
-            return jsonify({"error": "One or both stations not found"}), 404
         
-        # Insert new fare rule
-        cursor.execute('''
-            INSERT INTO FareRule (StartStationID, EndStationID, FareType, FareAmount)
-            VALUES (?, ?, ?, ?)
-        ''', (data['StartStationID'], data['EndStationID'], data['FareType'], data['FareAmount']))
-        
-        conn.commit()
-        fare_rule_id = cursor.lastrowid
+        def insert(conn):
+            # Check if stations exist
+            if conn.execute('SELECT COUNT(*) FROM Station WHERE StationID IN (?, ?)',
+                            (data['StartStationID'], data['EndStationID'])).fetchone()[0] != 2:
+                raise TripOpError("One or both stations not found", 404)
+            return conn.execute('''
+                INSERT INTO FareRule (StartStationID, EndStationID, FareType, FareAmount)
+                VALUES (?, ?, ?, ?)
+            ''', (data['StartStationID'], data['EndStationID'], data['FareType'], data['FareAmount'])).lastrowid
+        
+        fare_rule_id = run_write(insert)
         logger.info(f"Created fare rule with ID {fare_rule_id}")
         
         return jsonify({"message": "Fare rule created successfully", "FareRuleID": fare_rule_id}), 201
         
+    except TripOpError as e:
+        return jsonify({"error": e.message}), e.status
+    except WriteQueueFull:
+        return jsonify({"error": "Server busy, retry"}), 503, {'Retry-After': '1'}
+    except FutureTimeout:
+        return jsonify({"error": "Write timed out"}), 504
     except sqlite3.IntegrityError as e:
         if 'UNIQUE constraint failed' in str(e):
             return jsonify({"error": "A fare rule with these parameters already exists"}), 409
@@ -1023,28 +1770,15 @@ def create_fare_rule():
     except Exception as e:
         logger.error(f"Error in create_fare_rule: {str(e)}")
         return jsonify({"error": "Failed to create fare rule"}), 500
-    finally:
-        if conn:
-            conn.close()
 
 @app.route('/fare-rules/<int:fare_rule_id>', methods=['PUT'])
 def update_fare_rule(fare_rule_id: int):
     """Update an existing fare rule."""
-    conn = None
     try:
         data = request.get_json()
         if not data:
             return jsonify({"error": "No data provided"}), 400
-            
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Check if fare rule exists
-        cursor.execute('SELECT * FROM FareRule WHERE FareRuleID = ?', (fare_rule_id,))
-        if not cursor.fetchone():
-            return jsonify({"error": "Fare rule not found"}), 404
         
-        # Update fare rule
         update_fields = []
         params = []
         
@@ -1066,48 +1800,51 @@ def update_fare_rule(fare_rule_id: int):
             WHERE FareRuleID = ?
         """
         
-        cursor.execute(update_query, params)
-        conn.commit()
+        if run_write(lambda c: c.execute(update_query, params).rowcount) == 0:
+            return jsonify({"error": "Fare rule not found"}), 404
         
         return jsonify({"message": "Fare rule updated successfully"}), 200
         
+    except WriteQueueFull:
+        return jsonify({"error": "Server busy, retry"}), 503, {'Retry-After': '1'}
+    except FutureTimeout:
+        return jsonify({"error": "Write timed out"}), 504
     except sqlite3.Error as e:
         logger.error(f"Database error in update_fare_rule: {str(e)}")
         return jsonify({"error": "Failed to update fare rule"}), 500
-    finally:
-        if conn:
-            conn.close()
 
 @app.route('/fare-rules/<int:fare_rule_id>', methods=['DELETE'])
 def delete_fare_rule(fare_rule_id: int):
     """Delete a fare rule."""
-    conn = None
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Check if fare rule exists
-        cursor.execute('SELECT * FROM FareRule WHERE FareRuleID = ?', (fare_rule_id,))
-        if not cursor.fetchone():
+        deleted = run_write(lambda c: c.execute('DELETE FROM FareRule WHERE FareRuleID = ?', (fare_rule_id,)).rowcount)
+        if deleted == 0:
             return jsonify({"error": "Fare rule not found"}), 404
         
-        # Delete fare rule
-        cursor.execute('DELETE FROM FareRule WHERE FareRuleID = ?', (fare_rule_id,))
-        conn.commit()
-        
         return jsonify({"message": "Fare rule deleted successfully"}), 200
         
+    except WriteQueueFull:
+        return jsonify({"error": "Server busy, retry"}), 503, {'Retry-After': '1'}
+    except FutureTimeout:
+        return jsonify({"error": "Write timed out"}), 504
     except sqlite3.Error as e:
         logger.error(f"Database error in delete_fare_rule: {str(e)}")
         return jsonify({"error": "Failed to delete fare rule"}), 500
-    finally:
-        if conn:
-            conn.close()
 
 if __name__ == '__main__':
     # Initialize the database
     initialize_database()
     
+    # Print the storage settings in effect
+    print(f"\n=== SQLite Storage Profile: {DB_STORAGE_PROFILE} ===")
+    conn = get_db_connection()
+    try:
+        for key, value in report_settings(conn).items():
+            print(f"{key}: {value}")
+    finally:
+        conn.close()
+    print("=======================")
+    
     # Print all registered routes
     print("\n=== Registered Routes ===")
     for rule in app.url_map.iter_rules():
@@ -0,0 +1,492 @@
+import argparse
+import heapq
+import itertools
+import json
+import os
+import shutil
+import sqlite3
+import logging
+from datetime import datetime, timedelta
+from operator import itemgetter
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from rollups import FARE_TYPE, TOPUP_TYPES
+
+logger = logging.getLogger(__name__)
+
+# Cold tier for Trip and [Transaction] history.
+#
+# archive() moves closed trips and transactions older than N days out of
+# SQLite into column files under the archive directory:
+#
+#   <root>/<kind>/<YYYY-MM>/part-<first ID>/<Column>.npy   one array per column
+#                                           <Column>.dict.npy  strings of a
+#                                                        dictionary column
+#                                           meta.json    rows, ID and date range
+#
+# Each archive run adds parts (one per month touched per chunk); parts are
+# never rewritten. Readers memory-map the arrays and skip whole months and
+# parts by date range, so a query over recent data does not touch old files.
+#
+# Deleting archived rows must not look like history being undone: the
+# archiver holds a row in ArchiveGuard for the length of its delete, and the
+# delete triggers of DashboardCounters and the rollups (as migration 7
+# recreates them) do nothing while it is there. Totals, /dashboard/stats and
+# /analytics/* therefore keep counting archived rows without reading the
+# cold tier. Recomputing them from
+# scratch (dashboard_counters.rebuild_counters, rollups.backfill) adds the
+# cold tier back with add_cold_counters and add_cold_rollups.
+ARCHIVE_CHUNK_ROWS = 50000
+PENDING_SUFFIX = '.pending'
+NULL_ID = -1
+
+# Column kinds: id (int64, NULL stored as -1), real (float64, NULL as NaN),
+# time (ASCII timestamp bytes), text (int32 codes into a sorted dictionary of
+# distinct strings, NULL as -1).
+Column = Tuple[str, str]
+
+
+class ColdTable(NamedTuple):
+    table: str
+    id_column: str
+    date_column: str     # partitions by month of this column
+    select_sql: str      # columns in the order of `columns` (and of the export)
+    condition: str       # rows old enough to archive; ? is the cutoff timestamp
+    columns: Tuple[Column, ...]
+
+
+COLD_TABLES: Dict[str, ColdTable] = {
+    'trips': ColdTable(
+        'Trip', 'TripID', 'EntryTime',
+        '''
+        SELECT t.TripID, t.EntryTime, t.ExitTime, t.FareAmount, t.CardID,
+               t.EntryStationID, t.ExitStationID
+        FROM Trip t
+        ''',
+        # Open trips stay hot however old; + keeps the scan in TripID order
+        't.ExitTime IS NOT NULL AND +t.ExitTime < ?1',
+        (('TripID', 'id'), ('EntryTime', 'time'), ('ExitTime', 'time'), ('FareAmount', 'real'),
+         ('CardID', 'id'), ('EntryStationID', 'id'), ('ExitStationID', 'id')),
+    ),
+    'transactions': ColdTable(
+        '[Transaction]', 'TransactionID', 'TransactionDate',
+        '''
+        SELECT t.TransactionID, t.TransactionType, t.Amount, t.TransactionDate,
+               t.CardID, c.CardNumber
+        FROM [Transaction] t
+        LEFT JOIN Card c ON t.CardID = c.CardID
+        ''',
+        '+t.TransactionDate < ?1',
+        (('TransactionID', 'id'), ('TransactionType', 'text'), ('Amount', 'real'),
+         ('TransactionDate', 'time'), ('CardID', 'id'), ('CardNumber', 'text')),
+    ),
+}
+
+
+def default_archive_dir(db_path: str) -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(db_path)), 'archive')
+
+
+def hours_of(times: np.ndarray) -> np.ndarray:
+    """Hour of day of 'YYYY-MM-DD HH:MM:SS' byte strings, without parsing them."""
+    digits = times.view(np.uint8).reshape(len(times), times.dtype.itemsize)[:, 11:13].astype(np.int64) - 48
+    return digits[:, 0] * 10 + digits[:, 1]
+
+
+# ---------- writing ----------
+
+def _encode_column(kind: str, values: Tuple[Any, ...]) -> Dict[str, np.ndarray]:
+    if kind == 'id':
+        return {'': np.fromiter((NULL_ID if v is None else v for v in values), np.int64, len(values))}
+    if kind == 'real':
+        return {'': np.fromiter((np.nan if v is None else v for v in values), np.float64, len(values))}
+    if kind == 'time':
+        return {'': np.array([v.encode('ascii') for v in values], dtype=np.bytes_)}
+    strings = sorted({v for v in values if v is not None})
+    code = {value: i for i, value in enumerate(strings)}
+    return {'': np.fromiter((NULL_ID if v is None else code[v] for v in values), np.int32, len(values)),
+            '.dict': np.array(strings, dtype=np.str_)}
+
+
+def write_parts(root: str, kind: str, rows: List[Tuple[Any, ...]]) -> List[str]:
+    """
+    Write a chunk of rows (in ID order) as one pending part per month.
+    :return: paths of the pending part directories
+    """
+    spec = COLD_TABLES[kind]
+    date_index = [name for name, _ in spec.columns].index(spec.date_column)
+    by_month: Dict[str, List[Tuple[Any, ...]]] = {}
+    for row in rows:
+        by_month.setdefault(row[date_index][:7], []).append(row)
+    pending = []
+    for month, month_rows in sorted(by_month.items()):
+        path = os.path.join(root, kind, month, f'part-{month_rows[0][0]:012d}{PENDING_SUFFIX}')
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.makedirs(path)
+        pending.append(path)
+        for (name, column_kind), values in zip(spec.columns, zip(*month_rows)):
+            for suffix, array in _encode_column(column_kind, values).items():
+                np.save(os.path.join(path, f'{name}{suffix}.npy'), array)
+        dates = [row[date_index] for row in month_rows]
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump({'rows': len(month_rows), 'minId': month_rows[0][0], 'maxId': month_rows[-1][0],
+                       'minTime': min(dates), 'maxTime': max(dates)}, f)
+    return pending
+
+
+def finalize_parts(pending: Iterable[str]) -> None:
+    for path in pending:
+        os.replace(path, path[:-len(PENDING_SUFFIX)])
+
+
+def recover(conn: sqlite3.Connection, root: str) -> None:
+    """
+    Settle parts left pending by an interrupted run: the rows were deleted
+    from SQLite (keep the part) or the delete rolled back (drop it).
+    """
+    for kind, spec in COLD_TABLES.items():
+        for path in _part_dirs(os.path.join(root, kind), pending=True):
+            meta_path = os.path.join(path, 'meta.json')
+            if os.path.exists(meta_path):
+                with open(meta_path) as f:
+                    first_id = json.load(f)['minId']
+                hot = conn.execute(f'SELECT 1 FROM {spec.table} WHERE {spec.id_column} = ?', (first_id,)).fetchone()
+            else:
+                hot = True  # interrupted while writing, before the delete
+            if hot:
+                shutil.rmtree(path)
+            else:
+                finalize_parts([path])
+            logger.info(f"Recovered {'dropped' if hot else 'kept'} pending part {path}")
+
+
+def archive(conn: sqlite3.Connection, root: str, days: int, chunk_rows: int = ARCHIVE_CHUNK_ROWS,
+            now: Optional[datetime] = None) -> Dict[str, int]:
+    """
+    Move closed trips and transactions older than `days` to the cold tier.
+
+    Works a chunk at a time: each chunk is read, written as pending parts
+    and deleted in one BEGIN IMMEDIATE transaction (with ArchiveGuard set,
+    so counters and rollups keep the rows), then its parts are made
+    visible. Writers wait at most one chunk; an interrupted run is settled
+    by recover() on the next one.
+    :param root: archive directory
+    :param days: archive rows older than this many days
+    :param now: reference time (default: now)
+    :return: rows archived per kind
+    """
+    cutoff = ((now or datetime.now()) - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+    recover(conn, root)
+    if conn.in_transaction:
+        conn.commit()
+    moved = {}
+    for kind, spec in COLD_TABLES.items():
+        moved[kind], last_id = 0, 0
+        sql = (spec.select_sql + f' WHERE {spec.condition} AND t.{spec.id_column} > ?2'
+               f' ORDER BY t.{spec.id_column} LIMIT ?3')
+        while True:
+            conn.execute('BEGIN IMMEDIATE')
+            pending: List[str] = []
+            try:
+                rows = [tuple(row) for row in conn.execute(sql, (cutoff, last_id, chunk_rows))]
+                if not rows:
+                    conn.rollback()
+                    break
+                pending = write_parts(root, kind, rows)
+                conn.execute('INSERT INTO ArchiveGuard (Active) VALUES (1)')
+                conn.executemany(f'DELETE FROM {spec.table} WHERE {spec.id_column} = ?',
+                                 ((row[0],) for row in rows))
+                conn.execute('DELETE FROM ArchiveGuard')
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                for path in pending:
+                    shutil.rmtree(path, ignore_errors=True)
+                raise
+            finalize_parts(pending)
+            moved[kind] += len(rows)
+            last_id = rows[-1][0]
+            logger.info(f"Archived {moved[kind]} {kind} (through ID {last_id})")
+    return moved
+
+
+# ---------- reading ----------
+
+def _part_dirs(kind_dir: str, pending: bool = False) -> Iterator[str]:
+    if not os.path.isdir(kind_dir):
+        return
+    for month in sorted(os.listdir(kind_dir)):
+        month_dir = os.path.join(kind_dir, month)
+        for name in sorted(os.listdir(month_dir)):
+            if name.endswith(PENDING_SUFFIX) == pending:
+                yield os.path.join(month_dir, name)
+
+
+class ColdPart:
+    """One archived part; columns are memory-mapped on first use."""
+
+    def __init__(self, kind: str, path: str, meta: Dict[str, Any]):
+        self.kind = kind
+        self.path = path
+        self.rows = meta['rows']
+        self.min_id, self.max_id = meta['minId'], meta['maxId']
+        self.min_time, self.max_time = meta['minTime'], meta['maxTime']
+
+    def column(self, name: str) -> np.ndarray:
+        return np.load(os.path.join(self.path, f'{name}.npy'), mmap_mode='r')
+
+    def dictionary(self, name: str) -> List[str]:
+        return np.load(os.path.join(self.path, f'{name}.dict.npy')).tolist()
+
+    def matches(self, date_from: Optional[str] = None, date_to: Optional[str] = None,
+                card_id: Optional[int] = None, after_id: Optional[int] = None) -> np.ndarray:
+        """Boolean mask of rows matching the filters (same meaning as the export filters)."""
+        spec = COLD_TABLES[self.kind]
+        keep = np.ones(self.rows, dtype=bool)
+        if date_from and self.min_time < date_from:
+            keep &= self.column(spec.date_column) >= date_from.encode('ascii')
+        if date_to and self.max_time >= date_to:
+            keep &= self.column(spec.date_column) < date_to.encode('ascii')
+        if card_id is not None:
+            keep &= self.column('CardID') == card_id
+        if after_id is not None and self.min_id <= after_id:
+            keep &= self.column(spec.id_column) > after_id
+        return keep
+
+    def iter_rows(self, positions: np.ndarray, chunk_rows: int) -> Iterator[Tuple[Any, ...]]:
+        """Rows at `positions` as tuples shaped like the export's SQL rows."""
+        columns = []
+        for name, kind in COLD_TABLES[self.kind].columns:
+            columns.append((kind, self.column(name), self.dictionary(name) if kind == 'text' else None))
+        for start in range(0, len(positions), chunk_rows):
+            window = positions[start:start + chunk_rows]
+            values = []
+            for kind, array, strings in columns:
+                chunk = array[window]
+                if kind == 'id':
+                    values.append([None if v == NULL_ID else v for v in chunk.tolist()])
+                elif kind == 'real':
+                    values.append([None if v != v else v for v in chunk.tolist()])
+                elif kind == 'time':
+                    values.append(np.char.decode(chunk, 'ascii').tolist())
+                else:
+                    values.append([None if v == NULL_ID else strings[v] for v in chunk.tolist()])
+            yield from zip(*values)
+
+
+class ColdStore:
+    """The archive directory; parts are listed on each call and their metadata cached."""
+
+    def __init__(self, root: str):
+        self.root = root
+        self._meta: Dict[str, Dict[str, Any]] = {}
+
+    def parts(self, kind: str, date_from: Optional[str] = None, date_to: Optional[str] = None) -> List[ColdPart]:
+        """
+        Parts of `kind` that may hold rows in [date_from, date_to), in ID
+        order. Months outside the range are skipped without being opened.
+        """
+        kind_dir = os.path.join(self.root, kind)
+        if not os.path.isdir(kind_dir):
+            return []
+        parts = []
+        for month in sorted(os.listdir(kind_dir)):
+            if (date_from and month < date_from[:7]) or (date_to and f'{month}-01' >= date_to):
+                continue
+            month_dir = os.path.join(kind_dir, month)
+            for name in os.listdir(month_dir):
+                if name.endswith(PENDING_SUFFIX):
+                    continue
+                path = os.path.join(month_dir, name)
+                meta = self._meta.get(path)
+                if meta is None:
+                    with open(os.path.join(path, 'meta.json')) as f:
+                        meta = self._meta[path] = json.load(f)
+                if (date_from and meta['maxTime'] < date_from) or (date_to and meta['minTime'] >= date_to):
+                    continue
+                parts.append(ColdPart(kind, path, meta))
+        return sorted(parts, key=lambda part: part.min_id)
+
+    def iter_rows(self, kind: str, chunk_rows: int, date_from: Optional[str] = None,
+                  date_to: Optional[str] = None, card_id: Optional[int] = None,
+                  after_id: Optional[int] = None) -> Iterator[Tuple[Any, ...]]:
+        """
+        Matching cold rows in ID order. Parts whose ID ranges overlap are
+        merged; the rest are read one after another, so only one group of
+        parts is open at a time.
+        """
+        groups: List[List[ColdPart]] = []
+        for part in self.parts(kind, date_from, date_to):
+            if after_id is not None and part.max_id <= after_id:
+                continue
+            if groups and part.min_id <= max(p.max_id for p in groups[-1]):
+                groups[-1].append(part)
+            else:
+                groups.append([part])
+
+        def read(part: ColdPart) -> Iterator[Tuple[Any, ...]]:
+            return part.iter_rows(np.flatnonzero(part.matches(date_from, date_to, card_id, after_id)), chunk_rows)
+
+        for group in groups:
+            if len(group) == 1:
+                yield from read(group[0])
+            else:
+                yield from heapq.merge(*(read(part) for part in group), key=itemgetter(0))
+
+
+def merge_chunks(hot: Iterator[List[sqlite3.Row]], cold: Iterator[Tuple[Any, ...]],
+                 chunk_rows: int) -> Iterator[List[Tuple[Any, ...]]]:
+    """Merge hot row chunks and cold rows by primary key (first column) into chunks of tuples."""
+    rows = heapq.merge((tuple(row) for chunk in hot for row in chunk), cold, key=itemgetter(0))
+    while True:
+        chunk = list(itertools.islice(rows, chunk_rows))
+        if not chunk:
+            return
+        yield chunk
+
+
+# ---------- history ----------
+
+def _card_types(conn: sqlite3.Connection) -> np.ndarray:
+    """CardTypeID indexed by CardID (0 for cards without a type), as rollups.py attributes them."""
+    rows = np.array(conn.execute('SELECT CardID, COALESCE(CardTypeID, 0) FROM Card').fetchall(),
+                    dtype=np.int64).reshape(-1, 2)
+    types = np.zeros(int(rows[:, 0].max()) + 1 if len(rows) else 1, dtype=np.int64)
+    types[rows[:, 0]] = rows[:, 1]
+    return types
+
+
+def _lookup(types: np.ndarray, card_ids: np.ndarray) -> np.ndarray:
+    known = (card_ids >= 0) & (card_ids < len(types))
+    return np.where(known, types[np.where(known, card_ids, 0)], 0)
+
+
+def _group(keys: np.ndarray, stations: np.ndarray, *weights: np.ndarray) -> Iterator[Tuple[Any, ...]]:
+    """Sum weights by (byte-string key, integer); yields (key, id, sums...)."""
+    labels, label_index = np.unique(keys, return_inverse=True)
+    pairs, inverse = np.unique(label_index.astype(np.int64) * (int(stations.max()) + 2) + stations + 1,
+                               return_inverse=True)
+    sums = [np.bincount(inverse, weights=w, minlength=len(pairs)) for w in weights]
+    label_ids, station_ids = np.divmod(pairs, int(stations.max()) + 2)
+    for i in range(len(pairs)):
+        yield (labels[label_ids[i]].decode('ascii'), int(station_ids[i]) - 1) + tuple(s[i].item() for s in sums)
+
+
+def archive_dir_for(conn: sqlite3.Connection) -> Optional[str]:
+    """
+    The cold tier of the database conn is open on: ARCHIVE_DIR, else
+    archive/ next to its file; None for an in-memory or temporary database.
+    """
+    path = conn.execute('PRAGMA database_list').fetchone()[2]
+    if not path:
+        return None
+    return os.getenv('ARCHIVE_DIR') or default_archive_dir(path)
+
+
+def add_cold_counters(conn: sqlite3.Connection, root: str) -> Dict[str, int]:
+    """
+    Add archived trips and transactions to DashboardCounters. Only correct
+    straight after REBUILD_SQL, which counts SQLite alone (see
+    dashboard_counters.rebuild_counters). Runs inside the caller's transaction.
+    :return: cold rows counted per kind
+    """
+    store = ColdStore(root)
+    trips = sum(part.rows for part in store.parts('trips'))
+    transactions, revenue = 0, 0.0
+    for part in store.parts('transactions'):
+        transactions += part.rows
+        revenue += float(np.asarray(part.column('Amount')).sum())
+    conn.execute('''UPDATE DashboardCounters SET TotalTrips = TotalTrips + ?,
+                    TotalTransactions = TotalTransactions + ?, TotalRevenue = TotalRevenue + ? WHERE ID = 1''',
+                 (trips, transactions, revenue))
+    return {'trips': trips, 'transactions': transactions}
+
+
+def add_cold_rollups(conn: sqlite3.Connection, root: str) -> Dict[str, int]:
+    """
+    Add archived trips and transactions to the rollups. Only correct
+    straight after rollups.BACKFILL_SQL, which recomputes them from SQLite
+    alone (see rollups.backfill). Runs inside the caller's transaction.
+    :return: cold rows counted per kind
+    """
+    store, types = ColdStore(root), _card_types(conn)
+    station_hour = '''
+        INSERT INTO StationHourlyStats (Hour, StationID, Entries, Exits, FareRevenue) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (Hour, StationID) DO UPDATE SET
+            Entries = Entries + excluded.Entries, Exits = Exits + excluded.Exits,
+            FareRevenue = FareRevenue + excluded.FareRevenue'''
+    card_type_day = '''
+        INSERT INTO CardTypeDailyStats (Day, CardTypeID, Trips, Spend, TopUps, TopUpAmount) VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (Day, CardTypeID) DO UPDATE SET
+            Trips = Trips + excluded.Trips, Spend = Spend + excluded.Spend,
+            TopUps = TopUps + excluded.TopUps, TopUpAmount = TopUpAmount + excluded.TopUpAmount'''
+    counted = {'trips': 0, 'transactions': 0}
+    for part in store.parts('trips'):
+        entry_time, exit_time = part.column('EntryTime'), part.column('ExitTime')
+        entry_station, exit_station = part.column('EntryStationID'), part.column('ExitStationID')
+        fares = np.nan_to_num(np.asarray(part.column('FareAmount')))
+        ones = np.ones(part.rows)
+        conn.executemany(station_hour, ((hour, station, int(n), 0, 0.0) for hour, station, n in
+                                        _group(entry_time.astype('S13'), entry_station, ones)))
+        exited = exit_station != NULL_ID
+        if exited.any():
+            conn.executemany(station_hour, ((hour, station, 0, int(n), fare) for hour, station, n, fare in
+                                            _group(exit_time[exited].astype('S13'), exit_station[exited],
+                                                   ones[exited], fares[exited])))
+        conn.executemany(card_type_day, ((day, card_type, int(n), 0.0, 0, 0.0) for day, card_type, n in
+                                         _group(entry_time.astype('S10'),
+                                                _lookup(types, np.asarray(part.column('CardID'))), ones)))
+        counted['trips'] += part.rows
+    for part in store.parts('transactions'):
+        names = part.dictionary('TransactionType')
+        codes = np.asarray(part.column('TransactionType'))
+        amount = np.asarray(part.column('Amount'))
+        is_fare = np.isin(codes, [i for i, name in enumerate(names) if name == FARE_TYPE])
+        is_topup = np.isin(codes, [i for i, name in enumerate(names) if name in TOPUP_TYPES])
+        relevant = is_fare | is_topup
+        if relevant.any():
+            conn.executemany(card_type_day, (
+                (day, card_type, 0, spend, int(topups), topup_amount)
+                for day, card_type, spend, topups, topup_amount in _group(
+                    part.column('TransactionDate')[relevant].astype('S10'),
+                    _lookup(types, np.asarray(part.column('CardID'))[relevant]),
+                    (amount * is_fare)[relevant], is_topup[relevant].astype(np.float64),
+                    (amount * is_topup)[relevant])))
+        counted['transactions'] += part.rows
+    return counted
+
+
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Move old trips and transactions to the cold tier')
+    parser.add_argument('command', choices=['archive', 'status'])
+    parser.add_argument('--days', type=int, default=365, help='archive rows older than this many days')
+    parser.add_argument('--chunk-rows', type=int, default=ARCHIVE_CHUNK_ROWS)
+    parser.add_argument('--vacuum', action='store_true',
+                        help='VACUUM afterwards to shrink the database file (blocks writers while it runs)')
+    parser.add_argument('--db', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'project.db'),
+                        help='path to the SQLite database')
+    parser.add_argument('--archive-dir', help='cold tier directory (default: ARCHIVE_DIR or archive/ next to the db)')
+    args = parser.parse_args()
+    root = args.archive_dir or os.getenv('ARCHIVE_DIR') or default_archive_dir(args.db)
+
+    conn = sqlite3.connect(args.db)
+    try:
+        if args.command == 'archive':
+            moved = archive(conn, root, args.days, args.chunk_rows)
+            logger.info(f"Archived {moved['trips']} trips and {moved['transactions']} transactions to {root}")
+            if args.vacuum:
+                conn.execute('VACUUM')
+        else:
+            store = ColdStore(root)
+            for kind in COLD_TABLES:
+                parts = store.parts(kind)
+                print(f"{kind}: {sum(p.rows for p in parts)} rows in {len(parts)} parts"
+                      + (f", {parts[0].min_time} .. {max(p.max_time for p in parts)}" if parts else ''))
+    finally:
+        conn.close()
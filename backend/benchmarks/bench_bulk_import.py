@@ -0,0 +1,82 @@
+"""
+Time a bulk import of passengers and cards through bulk_import.run_import.
+
+Generates CSV files with --rows passengers and --rows cards (cards reference
+passengers by email and card types by name, and a small share of rows are
+invalid on purpose), imports both into a fresh database and reports rows per
+second. The target is 1M rows (500k of each) in under a minute.
+
+Usage:
+    python benchmarks/bench_bulk_import.py --rows 500000
+"""
+import argparse
+import csv
+import os
+import sys
+import tempfile
+import time
+import logging
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import app as backend  # noqa: E402
+from bulk_import import run_import  # noqa: E402
+
+CARD_TYPES = ('Regular', 'Student', 'Senior', 'Monthly')
+BAD_EVERY = 997
+
+
+def write_files(tmp: str, rows: int) -> tuple:
+    passengers = os.path.join(tmp, 'passengers.csv')
+    cards = os.path.join(tmp, 'cards.csv')
+    with open(passengers, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['FirstName', 'LastName', 'Email', 'PhoneNumber', 'RegistrationDate'])
+        for i in range(rows):
+            email = '' if i % BAD_EVERY == 1 else f'user{i}@example.com'
+            writer.writerow([f'First{i}', f'Last{i}', email, f'555{i:07d}', '2025-01-01 00:00:00'])
+    with open(cards, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['CardNumber', 'Balance', 'Status', 'PassengerEmail', 'CardType'])
+        for i in range(rows):
+            writer.writerow([f'CARD{i:09d}', f'{i % 500}.00', 'Active', f'user{i}@example.com',
+                             'Unknown' if i % BAD_EVERY == 2 else CARD_TYPES[i % 4]])
+    return passengers, cards
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rows', type=int, default=500_000, help='passengers and cards each')
+    parser.add_argument('--target-seconds', type=float, default=60.0)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    with tempfile.TemporaryDirectory() as tmp:
+        backend.reset_db_pool()
+        backend.DB_PATH = os.path.join(tmp, 'bench.db')
+        backend.initialize_database()
+        passengers, cards = write_files(tmp, args.rows)
+
+        conn = backend.get_db_pool().acquire()
+        total = 0.0
+        try:
+            for entity, path in (('passengers', passengers), ('cards', cards)):
+                start = time.perf_counter()
+                with open(path, newline='') as f:
+                    result = run_import(conn, entity, f, 'csv', source=os.path.basename(path))
+                elapsed = time.perf_counter() - start
+                total += elapsed
+                print(f"{entity:<11}{result['rowsRead']:>10} read{result['rowsInserted']:>10} inserted"
+                      f"{result['rowsRejected']:>8} rejected{elapsed:>8.1f}s{result['rowsRead'] / elapsed:>10.0f} rows/s")
+        finally:
+            conn.close()
+            backend.reset_db_pool()
+
+    print(f"total {2 * args.rows} rows in {total:.1f}s ({2 * args.rows / total:.0f} rows/s)")
+    if total > args.target_seconds:
+        print(f"FAIL (target {args.target_seconds:.0f}s)")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
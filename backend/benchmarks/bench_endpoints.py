@@ -0,0 +1,509 @@
+"""
+Benchmark every API endpoint and compare the results with a stored baseline.
+
+For each database size (synthetic data at --scales, see create_database.py)
+three scenarios are run at --concurrency threads:
+
+  routes     every route in app.url_map on its own, --requests each
+  dashboard  read-heavy mix: dashboard stats, list pages, reference data, quotes
+  tap-storm  write-heavy mix: tap-ins, tap-outs, small tap batches, stats polls
+
+Requests go through the Flask test client, or with --url to a running
+server (which then uses its own database; --scales is ignored). Throughput
+and p50/p95/p99 latency per endpoint (best of --repeat runs) are written
+to --output as JSON. With a baseline (--baseline), a p95 more than
+--max-latency-ratio times the baseline (and at least --noise-ms slower),
+throughput below --min-throughput-ratio of it, or new server errors count
+as a regression and the run exits 1.
+Save a baseline for the current machine with --save-baseline; results are
+only compared with a baseline recorded with the same settings and CPU count,
+and a run with no such baseline exits 2 rather than passing unchecked.
+With more client threads than CPUs, latency tails measure the OS scheduler,
+so the default concurrency is the CPU count (at most 4).
+
+Usage:
+    python benchmarks/bench_endpoints.py --scales 0.01 0.1 --concurrency 4
+    python benchmarks/bench_endpoints.py --save-baseline
+    python benchmarks/bench_endpoints.py --url http://localhost:5000 --scenarios dashboard
+"""
+import argparse
+import json
+import os
+import platform
+import queue
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import logging
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+sys.path.insert(0, os.path.join(HERE, '..', '..'))
+
+import app as backend  # noqa: E402
+from create_database import make_synthetic_database  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(HERE, 'baseline.json')
+SCENARIOS = ('routes', 'dashboard', 'tap-storm')
+SKIPPED_ROUTES = {'/static/<path:filename>'}
+# Run settings that must match the baseline's for latencies to be comparable.
+COMPARABLE_SETTINGS = ('target', 'cpus', 'concurrency', 'requests', 'mixRequests', 'repeat')
+
+# A prepared request: (method, path, json body, raw body, headers)
+Prepared = Tuple[str, str, Any, Optional[bytes], Optional[Dict[str, str]]]
+
+
+# ---------- transports ----------
+
+class TestClientTransport:
+    def __init__(self):
+        self.local = threading.local()
+
+    def request(self, method: str, path: str, json_body: Any = None, data: Optional[bytes] = None,
+                headers: Optional[Dict[str, str]] = None) -> Tuple[int, bytes]:
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = backend.app.test_client()
+        response = client.open(path, method=method, json=json_body, data=data, headers=headers or {})
+        return response.status_code, response.get_data()
+
+
+class HttpTransport:
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip('/')
+
+    def request(self, method: str, path: str, json_body: Any = None, data: Optional[bytes] = None,
+                headers: Optional[Dict[str, str]] = None) -> Tuple[int, bytes]:
+        headers = dict(headers or {})
+        if json_body is not None:
+            data = json.dumps(json_body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        req = urllib.request.Request(self.base_url + path, data=data, method=method, headers=headers)
+        try:
+            with urllib.request.urlopen(req) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+
+# ---------- request factories ----------
+
+class Context:
+    """Shared state the request factories draw IDs from."""
+
+    def __init__(self, transport, seed: int = 1):
+        self.transport = transport
+        self.lock = threading.Lock()
+        self.sequence = 0
+        self.open_trips: 'queue.Queue[int]' = queue.Queue()
+        self.seed = seed
+        status, body = transport.request('GET', '/dashboard/stats')
+        stats = json.loads(body)
+        self.passengers = max(1, stats['totalPassengers'])
+        self.cards = max(1, stats['activeCards'] + stats['blockedCards'])
+        self.stations = max(2, stats['totalStations'])
+        self.trips = max(1, stats['totalTrips'])
+        status, body = transport.request('POST', '/import/passengers?source=bench',
+                                         data=b'FirstName,LastName,Email\n', headers={'Content-Type': 'text/csv'})
+        self.import_job = json.loads(body).get('jobId', 1)
+
+    def unique(self) -> int:
+        with self.lock:
+            self.sequence += 1
+            return self.sequence
+
+    def call(self, method: str, path: str, json_body: Any = None) -> Any:
+        """Untimed setup request; returns the decoded JSON body."""
+        status, body = self.transport.request(method, path, json_body)
+        return json.loads(body) if body else None
+
+
+def _tag(ctx: Context) -> str:
+    return f'{os.getpid()}-{ctx.seed}-{ctx.unique()}'
+
+
+def _new_passenger(ctx: Context) -> int:
+    tag = _tag(ctx)
+    return ctx.call('POST', '/passengers', {'FirstName': 'Bench', 'LastName': tag,
+                                            'Email': f'bench{tag}@example.com'})['PassengerID']
+
+
+def _new_fare_rule_body(ctx: Context, rng: random.Random) -> Dict[str, Any]:
+    # Rules are unique per (start, end, fare type). Start from a new station
+    # rather than inventing fare types: the fare matrix has one plane per type.
+    station_id = ctx.call('POST', '/stations', {'StationName': f'BenchFare {_tag(ctx)}',
+                                                'LineColor': 'Grey'})['StationID']
+    return {'StartStationID': station_id, 'EndStationID': rng.randint(1, ctx.stations),
+            'FareType': 'Peak', 'FareAmount': 20.0}
+
+
+def _tap_in(ctx: Context, rng: random.Random) -> Prepared:
+    return ('POST', '/trips', {'cardId': rng.randint(1, ctx.cards),
+                               'entryStationId': rng.randint(1, ctx.stations)}, None, None)
+
+
+def _tap_out(ctx: Context, rng: random.Random) -> Prepared:
+    try:
+        trip_id = ctx.open_trips.get_nowait()
+    except queue.Empty:
+        trip_id = ctx.call('POST', '/trips', {'cardId': rng.randint(1, ctx.cards),
+                                              'entryStationId': rng.randint(1, ctx.stations)})['id']
+    return ('POST', f'/trips/{trip_id}/exit', {'exitStationId': rng.randint(1, ctx.stations)}, None, None)
+
+
+def _tap_batch(ctx: Context, rng: random.Random) -> Prepared:
+    events = []
+    for _ in range(50):
+        card, entry = rng.randint(1, ctx.cards), rng.randint(1, ctx.stations)
+        events.append({'type': 'entry', 'cardId': card, 'stationId': entry, 'time': '2025-06-02 08:00:00'})
+        events.append({'type': 'exit', 'cardId': card, 'stationId': rng.randint(1, ctx.stations),
+                       'time': '2025-06-02 08:30:00'})
+    return ('POST', '/trips/batch', events, None, None)
+
+
+def _import_csv(ctx: Context, rng: random.Random) -> Prepared:
+    tag = _tag(ctx)
+    body = 'FirstName,LastName,Email\n' + ''.join(f'Bench,{tag},imp{tag}-{i}@example.com\n' for i in range(20))
+    return ('POST', '/import/passengers?source=bench', None, body.encode(), {'Content-Type': 'text/csv'})
+
+
+# Every route, keyed by (method, rule), with a factory for one request.
+ROUTES: Dict[Tuple[str, str], Callable[[Context, random.Random], Prepared]] = {
+    ('GET', '/'): lambda ctx, rng: ('GET', '/', None, None, None),
+    ('GET', '/health'): lambda ctx, rng: ('GET', '/health', None, None, None),
+    ('GET', '/dashboard/stats'): lambda ctx, rng: ('GET', '/dashboard/stats', None, None, None),
+    ('GET', '/metrics'): lambda ctx, rng: ('GET', '/metrics', None, None, None),
+    ('GET', '/debug/slow-queries'): lambda ctx, rng: ('GET', '/debug/slow-queries', None, None, None),
+    ('GET', '/passengers'): lambda ctx, rng: ('GET', '/passengers?limit=50', None, None, None),
+    ('POST', '/passengers'): lambda ctx, rng: (
+        'POST', '/passengers', {'FirstName': 'Bench', 'LastName': 'User',
+                                'Email': f'bench{_tag(ctx)}@example.com'}, None, None),
+    ('PUT', '/passengers/<int:passenger_id>'): lambda ctx, rng: (
+        'PUT', f'/passengers/{rng.randint(1, ctx.passengers)}', {'PhoneNumber': str(rng.randint(10**9, 10**10 - 1))},
+        None, None),
+    ('DELETE', '/passengers/<int:passenger_id>'): lambda ctx, rng: (
+        'DELETE', f'/passengers/{_new_passenger(ctx)}', None, None, None),
+    ('GET', '/cards'): lambda ctx, rng: ('GET', '/cards?limit=50&status=Active', None, None, None),
+    ('POST', '/cards'): lambda ctx, rng: (
+        'POST', '/cards', {'CardNumber': f'BENCH{_tag(ctx)}', 'PassengerID': rng.randint(1, ctx.passengers),
+                           'CardTypeID': 1, 'Balance': 500.0}, None, None),
+    ('PUT', '/cards/<int:card_id>'): lambda ctx, rng: (
+        'PUT', f'/cards/{rng.randint(1, ctx.cards)}', {'Balance': float(rng.randint(100, 900))}, None, None),
+    ('DELETE', '/cards/<int:card_id>'): lambda ctx, rng: (
+        'DELETE', '/cards/{}'.format(ctx.call('POST', '/cards', {
+            'CardNumber': f'BENCHDEL{_tag(ctx)}', 'PassengerID': 1, 'CardTypeID': 1})['CardID']), None, None, None),
+    ('GET', '/stations'): lambda ctx, rng: ('GET', '/stations', None, None, None),
+    ('POST', '/stations'): lambda ctx, rng: (
+        'POST', '/stations', {'StationName': f'Bench {_tag(ctx)}', 'LineColor': 'Grey'}, None, None),
+    ('PUT', '/stations/<int:station_id>'): lambda ctx, rng: (
+        'PUT', f'/stations/{rng.randint(1, ctx.stations)}', {'LineColor': rng.choice(['Red', 'Blue'])}, None, None),
+    ('DELETE', '/stations/<int:station_id>'): lambda ctx, rng: (
+        'DELETE', '/stations/{}'.format(ctx.call('POST', '/stations', {
+            'StationName': f'BenchDel {_tag(ctx)}', 'LineColor': 'Grey'})['StationID']), None, None, None),
+    ('GET', '/search'): lambda ctx, rng: ('GET', '/search?' + rng.choice([
+        'q=priya&limit=20', 'q=ro+sh&limit=20', f'q=passenger{rng.randint(1, ctx.passengers)}',
+        'type=cards&q=MC00000001', 'type=stations&q=cent']), None, None, None),
+    ('GET', '/analytics/ridership'): lambda ctx, rng: ('GET', '/analytics/ridership?' + rng.choice([
+        'bucket=day', 'bucket=hour&from=2025-01-06&to=2025-01-13',
+        f'bucket=week&stationId={rng.randint(1, ctx.stations)}', 'bucket=month&line=Blue']), None, None, None),
+    ('GET', '/analytics/revenue'): lambda ctx, rng: ('GET', '/analytics/revenue?' + rng.choice([
+        'bucket=day', 'bucket=week&cardTypeId=2', 'bucket=month', 'bucket=hour&from=2025-02-01&to=2025-02-02']),
+        None, None, None),
+    ('GET', '/analytics/od-matrix'): lambda ctx, rng: ('GET', '/analytics/od-matrix?' + rng.choice([
+        'from=2025-02-01&to=2025-02-02', 'from=2025-02-01&to=2025-02-08&hours=7-10&format=sparse',
+        'from=2025-02-01&to=2025-02-02&cardTypeId=2']),
+        None, None, None),
+    ('GET', '/card-types'): lambda ctx, rng: ('GET', '/card-types', None, None, None),
+    ('POST', '/card-types'): lambda ctx, rng: (
+        'POST', '/card-types', {'TypeName': f'Bench {_tag(ctx)}', 'BaseFareMultiplier': 1.0}, None, None),
+    ('PUT', '/card-types/<int:card_type_id>'): lambda ctx, rng: (
+        'PUT', '/card-types/1', {'Description': f'Standard fare card {rng.randint(1, 9)}'}, None, None),
+    ('DELETE', '/card-types/<int:card_type_id>'): lambda ctx, rng: (
+        'DELETE', '/card-types/{}'.format(ctx.call('POST', '/card-types', {
+            'TypeName': f'BenchDel {_tag(ctx)}', 'BaseFareMultiplier': 1.0})['CardTypeID']), None, None, None),
+    ('GET', '/trips'): lambda ctx, rng: ('GET', '/trips?limit=50', None, None, None),
+    ('POST', '/trips'): _tap_in,
+    ('POST', '/trips/<int:trip_id>/exit'): _tap_out,
+    ('POST', '/trips/batch'): _tap_batch,
+    ('GET', '/fares/quote'): lambda ctx, rng: (
+        'GET', f'/fares/quote?from={rng.randint(1, ctx.stations)}&to={rng.randint(1, ctx.stations)}'
+               f'&cardTypeId=2', None, None, None),
+    ('POST', '/fares/quote/batch'): lambda ctx, rng: (
+        'POST', '/fares/quote/batch', {'from': [rng.randint(1, ctx.stations) for _ in range(200)],
+                                       'to': [rng.randint(1, ctx.stations) for _ in range(200)],
+                                       'cardTypeId': 1}, None, None),
+    ('POST', '/import/<entity>'): _import_csv,
+    ('GET', '/import/jobs/<int:job_id>'): lambda ctx, rng: ('GET', f'/import/jobs/{ctx.import_job}', None, None, None),
+    ('GET', '/export/<kind>'): lambda ctx, rng: (
+        'GET', f'/export/transactions?cardId={rng.randint(1, ctx.cards)}', None, None, None),
+    ('GET', '/transactions'): lambda ctx, rng: ('GET', '/transactions?limit=50', None, None, None),
+    ('GET', '/fare-rules'): lambda ctx, rng: ('GET', '/fare-rules', None, None, None),
+    ('POST', '/fare-rules'): lambda ctx, rng: ('POST', '/fare-rules', _new_fare_rule_body(ctx, rng), None, None),
+    ('PUT', '/fare-rules/<int:fare_rule_id>'): lambda ctx, rng: (
+        'PUT', f'/fare-rules/{rng.randint(1, 50)}', {'FareAmount': float(rng.randint(15, 60))}, None, None),
+    ('DELETE', '/fare-rules/<int:fare_rule_id>'): lambda ctx, rng: (
+        'DELETE', '/fare-rules/{}'.format(ctx.call('POST', '/fare-rules', _new_fare_rule_body(ctx, rng))['FareRuleID']),
+        None, None, None),
+}
+
+MIXES: Dict[str, List[Tuple[Tuple[str, str], int]]] = {
+    'dashboard': [
+        (('GET', '/dashboard/stats'), 30),
+        (('GET', '/trips'), 15),
+        (('GET', '/transactions'), 15),
+        (('GET', '/cards'), 10),
+        (('GET', '/passengers'), 10),
+        (('GET', '/stations'), 8),
+        (('GET', '/fare-rules'), 4),
+        (('GET', '/card-types'), 3),
+        (('GET', '/fares/quote'), 5),
+    ],
+    'tap-storm': [
+        (('POST', '/trips'), 45),
+        (('POST', '/trips/<int:trip_id>/exit'), 45),
+        (('POST', '/trips/batch'), 3),
+        (('GET', '/dashboard/stats'), 7),
+    ],
+}
+
+
+def check_route_coverage() -> List[Tuple[str, str]]:
+    """Routes in the app that have no request factory."""
+    missing = []
+    for rule in backend.app.url_map.iter_rules():
+        if rule.rule in SKIPPED_ROUTES:
+            continue
+        for method in sorted(rule.methods - {'HEAD', 'OPTIONS'}):
+            if (method, rule.rule) not in ROUTES:
+                missing.append((method, rule.rule))
+    return missing
+
+
+# ---------- running ----------
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run_requests(ctx: Context, plan: List[Tuple[str, str]], concurrency: int, seed: int) -> Tuple[Dict, float]:
+    """Send one request per plan entry across `concurrency` threads; return samples per endpoint."""
+    samples: Dict[str, Dict[str, list]] = {}
+    lock = threading.Lock()
+
+    def worker(items: List[Tuple[str, str]], worker_seed: int) -> None:
+        rng = random.Random(worker_seed)
+        local: Dict[str, Dict[str, list]] = {}
+        for key in items:
+            method, path, json_body, data, headers = ROUTES[key](ctx, rng)
+            start = time.perf_counter()
+            status, body = ctx.transport.request(method, path, json_body, data, headers)
+            elapsed = time.perf_counter() - start
+            entry = local.setdefault(f'{key[0]} {key[1]}', {'latency': [], 'status': []})
+            entry['latency'].append(elapsed)
+            entry['status'].append(status)
+            if key == ('POST', '/trips') and status == 201:
+                ctx.open_trips.put(json.loads(body)['id'])
+        with lock:
+            for name, entry in local.items():
+                merged = samples.setdefault(name, {'latency': [], 'status': []})
+                merged['latency'] += entry['latency']
+                merged['status'] += entry['status']
+
+    threads = [threading.Thread(target=worker, args=(plan[i::concurrency], seed + i)) for i in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return samples, time.perf_counter() - start
+
+
+def summarize(scale: Optional[float], scenario: str, name: str, entry: Dict[str, list], elapsed: float) -> Dict:
+    latency = entry['latency']
+    return {
+        'scale': scale,
+        'scenario': scenario,
+        'endpoint': name,
+        'requests': len(latency),
+        'rps': len(latency) / elapsed,
+        'p50Ms': percentile(latency, 50) * 1000,
+        'p95Ms': percentile(latency, 95) * 1000,
+        'p99Ms': percentile(latency, 99) * 1000,
+        'clientErrors': sum(400 <= s < 500 for s in entry['status']),
+        'serverErrors': sum(s >= 500 for s in entry['status']),
+    }
+
+
+def run_scenario(ctx: Context, scenario: str, scale: Optional[float], args) -> List[Dict]:
+    results = []
+    if scenario == 'routes':
+        for key in ROUTES:
+            samples, elapsed = run_requests(ctx, [key] * args.requests, args.concurrency, args.seed)
+            results += [summarize(scale, scenario, name, entry, elapsed) for name, entry in samples.items()]
+        return results
+
+    rng = random.Random(args.seed)
+    keys, weights = zip(*MIXES[scenario])
+    plan = rng.choices(keys, weights, k=args.mix_requests)
+    samples, elapsed = run_requests(ctx, plan, args.concurrency, args.seed)
+    results = [summarize(scale, scenario, name, entry, elapsed) for name, entry in sorted(samples.items())]
+    everything = {'latency': [x for e in samples.values() for x in e['latency']],
+                  'status': [x for e in samples.values() for x in e['status']]}
+    results.append(summarize(scale, scenario, 'ALL', everything, elapsed))
+    return results
+
+
+def best_of(runs: List[List[Dict]]) -> List[Dict]:
+    """
+    Combine repeated runs of a scenario, keeping each endpoint's best
+    latency and throughput, so one scheduler hiccup does not fail the run.
+    """
+    best: Dict[str, Dict] = {}
+    for run in runs:
+        for r in run:
+            b = best.setdefault(r['endpoint'], dict(r))
+            if b is r:
+                continue
+            for key in ('p50Ms', 'p95Ms', 'p99Ms'):
+                b[key] = min(b[key], r[key])
+            b['rps'] = max(b['rps'], r['rps'])
+            for key in ('requests', 'clientErrors', 'serverErrors'):
+                b[key] += r[key]
+    return list(best.values())
+
+
+def prepare_database(scale: float, data_dir: str, seed: int) -> None:
+    """Build a fresh synthetic database for `scale` and point the app at it."""
+    path = os.path.join(data_dir, f'bench-{scale:g}.db')
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    make_synthetic_database(path, scale, seed)
+    backend.reset_db_pool()
+    backend.DB_PATH = path
+    backend.initialize_database()
+
+
+# ---------- baseline ----------
+
+def compare(results: List[Dict], baseline: List[Dict], args) -> List[str]:
+    """Describe every endpoint that regressed against the baseline."""
+    previous = {(r['scale'], r['scenario'], r['endpoint']): r for r in baseline}
+    regressions = []
+    for r in results:
+        old = previous.get((r['scale'], r['scenario'], r['endpoint']))
+        if old is None:
+            continue
+        label = f"scale {r['scale']} {r['scenario']} {r['endpoint']}"
+        if r['p95Ms'] > old['p95Ms'] * args.max_latency_ratio and r['p95Ms'] - old['p95Ms'] > args.noise_ms:
+            regressions.append(f"{label}: p95 {r['p95Ms']:.2f} ms vs baseline {old['p95Ms']:.2f} ms")
+        if r['rps'] < old['rps'] * args.min_throughput_ratio:
+            regressions.append(f"{label}: {r['rps']:.0f} req/s vs baseline {old['rps']:.0f} req/s")
+        if r['serverErrors'] > old['serverErrors']:
+            regressions.append(f"{label}: {r['serverErrors']} server errors vs baseline {old['serverErrors']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--scales', nargs='+', type=float, default=[0.01, 0.1])
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--concurrency', type=int, default=min(4, os.cpu_count() or 1),
+                        help='client threads (default: CPU count, at most 4)')
+    parser.add_argument('--requests', type=int, default=200, help='requests per route in the routes scenario')
+    parser.add_argument('--mix-requests', type=int, default=4000, help='requests per mixed scenario')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per scenario; the best result is kept')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--url', help='benchmark a running server instead of the test client')
+    parser.add_argument('--data-dir', help='where to build the synthetic databases (default: a temp dir)')
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help='write the results as the new baseline')
+    parser.add_argument('--max-latency-ratio', type=float, default=1.5)
+    parser.add_argument('--min-throughput-ratio', type=float, default=0.8)
+    parser.add_argument('--noise-ms', type=float, default=10.0,
+                        help='ignore p95 changes smaller than this (thread switches add a few ms)')
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    missing = check_route_coverage()
+    if missing:
+        print(f"WARNING: no benchmark request for {', '.join(f'{m} {r}' for m, r in missing)}")
+
+    results: List[Dict] = []
+    if args.url:
+        transport = HttpTransport(args.url)
+        ctx = Context(transport, args.seed)
+        for scenario in args.scenarios:
+            results += best_of([run_scenario(ctx, scenario, None, args) for _ in range(args.repeat)])
+    else:
+        transport = TestClientTransport()
+        # Client and server share one interpreter; a shorter GIL slice keeps
+        # the latency tail from being dominated by thread switch waits.
+        sys.setswitchinterval(0.0005)
+        with tempfile.TemporaryDirectory() as tmp:
+            for scale in args.scales:
+                prepare_database(scale, args.data_dir or tmp, args.seed)
+                ctx = Context(transport, args.seed)
+                for scenario in args.scenarios:
+                    results += best_of([run_scenario(ctx, scenario, scale, args) for _ in range(args.repeat)])
+                backend.reset_db_pool()
+
+    print(f"{'scale':>6} {'scenario':<10} {'endpoint':<40}{'req/s':>9}{'p50':>8}{'p95':>8}{'p99':>8}{'4xx':>6}{'5xx':>6}")
+    for r in results:
+        scale = '-' if r['scale'] is None else f"{r['scale']:g}"
+        print(f"{scale:>6} {r['scenario']:<10} {r['endpoint']:<40}{r['rps']:>9.0f}{r['p50Ms']:>8.2f}"
+              f"{r['p95Ms']:>8.2f}{r['p99Ms']:>8.2f}{r['clientErrors']:>6}{r['serverErrors']:>6}")
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'target': args.url or 'test-client',
+            'concurrency': args.concurrency,
+            'requests': args.requests,
+            'mixRequests': args.mix_requests,
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one")
+        sys.exit(2)
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    different = [key for key in COMPARABLE_SETTINGS if baseline['meta'].get(key) != report['meta'][key]]
+    if different:
+        print(f"Baseline was recorded with different {', '.join(different)}; cannot compare "
+              f"(re-record it with --save-baseline on this machine)")
+        sys.exit(2)
+    regressions = compare(results, baseline['results'], args)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    if regressions:
+        sys.exit(1)
+    print("No regressions against the baseline")
+
+
+if __name__ == '__main__':
+    main()
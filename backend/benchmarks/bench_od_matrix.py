@@ -0,0 +1,85 @@
+"""
+Compare the NumPy origin-destination matrix with the equivalent GROUP BY.
+
+Each slice (all trips, a morning peak, a card type, one month) is counted
+both ways on the same database; the run checks the matrices are identical,
+reports the best of --repeat timings, and records the peak traced heap of
+the NumPy path, which depends on the chunk size and the station count but
+not on the number of trips.
+
+Usage:
+    python benchmarks/bench_od_matrix.py --db /path/to/project.db
+    python benchmarks/bench_od_matrix.py --scale 1      # synthetic, ~1M trips
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+import logging
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+sys.path.insert(0, os.path.join(HERE, '..', '..'))
+
+import od_matrix  # noqa: E402
+
+
+def slices(conn):
+    first, last = conn.execute('SELECT MIN(EntryTime), MAX(EntryTime) FROM Trip').fetchone()
+    month = (last or first or '2025-01-01')[:7] + '-01'
+    yield 'all', {}
+    yield 'hours 7-10', {'hours': (7, 10)}
+    yield 'hours 22-2', {'hours': (22, 2)}
+    yield 'card type 1', {'card_type_id': 1}
+    yield f'from {month}', {'date_from': month}
+
+
+def best_of(repeat: int, fn, *args, **kwargs):
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--db', help='existing database (opened read-only)')
+    parser.add_argument('--scale', type=float, default=0.1, help='synthetic data scale when --db is not given')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.db
+        if path is None:
+            import create_database
+            path = create_database.make_synthetic_database(os.path.join(tmp, 'od.db'), args.scale)
+        conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+        trips = conn.execute('SELECT COUNT(*) FROM Trip').fetchone()[0]
+        print(f"{trips:,} trips, {od_matrix.station_id_bound(conn) - 1} station IDs")
+        print(f"{'slice':>16}{'trips':>12}{'numpy s':>10}{'group by s':>12}{'speedup':>9}{'peak KiB':>10}")
+
+        failed = False
+        for name, params in slices(conn):
+            numpy_s, vectorized = best_of(args.repeat, od_matrix.od_matrix, conn, **params)
+            sql_s, grouped = best_of(args.repeat, od_matrix.od_matrix_sql, conn, **params)
+            tracemalloc.start()
+            od_matrix.od_matrix(conn, **params)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            same = (vectorized.counts == grouped.counts).all()
+            failed |= not same
+            print(f"{name:>16}{vectorized.total:>12,}{numpy_s:>10.3f}{sql_s:>12.3f}"
+                  f"{sql_s / numpy_s:>8.2f}x{peak / 1024:>10.0f}{'' if same else '  MISMATCH'}")
+        conn.close()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""
+Compare SQLite storage profiles on the /trips and /cards workloads.
+
+Each profile gets a fresh database seeded with the same data. Worker threads
+then drive a mix of GET /trips, GET /cards and POST /trips through the Flask
+test client, and the run reports throughput, latency percentiles and any
+"database is locked" failures.
+
+Usage:
+    python benchmarks/bench_storage_profiles.py --threads 8 --requests 200
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import logging
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import app as backend  # noqa: E402
+from storage_profile import PROFILES  # noqa: E402
+
+
+def seed(db_path: str, passengers: int, trips: int) -> None:
+    """Load a deterministic data set through the app's own schema setup."""
+    backend.DB_PATH = db_path
+    backend.initialize_database()
+    rng = random.Random(42)
+    conn = backend.get_db_pool().acquire()
+    try:
+        stations = [row[0] for row in conn.execute('SELECT StationID FROM Station')]
+        conn.executemany(
+            'INSERT INTO Passenger (FirstName, LastName, Email, PhoneNumber, RegistrationDate) '
+            'VALUES (?, ?, ?, ?, ?)',
+            [(f'First{i}', f'Last{i}', f'user{i}@example.com', None, '2025-01-01 00:00:00')
+             for i in range(passengers)])
+        conn.executemany(
+            'INSERT INTO Card (CardNumber, Balance, IssueDate, Status, PassengerID, CardTypeID) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            [(f'CARD{i:08d}', 100.0, '2025-01-01', 'Active', i + 1, 1) for i in range(passengers)])
+        conn.executemany(
+            'INSERT INTO Trip (EntryTime, ExitTime, FareAmount, CardID, EntryStationID, ExitStationID) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            [(f'2025-10-{1 + i % 28:02d} {6 + i % 16:02d}:{i % 60:02d}:00', None, None,
+              rng.randint(1, passengers), rng.choice(stations), None) for i in range(trips)])
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def worker(requests_per_thread: int, passengers: int, latencies: list, errors: list) -> None:
+    client = backend.app.test_client()
+    rng = random.Random(threading.get_ident())
+    for _ in range(requests_per_thread):
+        roll = rng.random()
+        start = time.perf_counter()
+        if roll < 0.4:
+            response = client.get('/trips')
+        elif roll < 0.7:
+            response = client.get('/cards')
+        else:
+            response = client.post('/trips', json={
+                'cardId': rng.randint(1, passengers),
+                'entryStationId': rng.randint(1, 5),
+            })
+        latencies.append(time.perf_counter() - start)
+        if response.status_code >= 500:
+            errors.append(response.get_data(as_text=True))
+
+
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run_profile(name: str, args) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        backend.reset_db_pool()
+        backend.DB_STORAGE_PROFILE = name
+        seed(os.path.join(tmp, 'bench.db'), args.passengers, args.trips)
+
+        latencies, errors = [], []
+        threads = [threading.Thread(target=worker,
+                                    args=(args.requests, args.passengers, latencies, errors))
+                   for _ in range(args.threads)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+        backend.reset_db_pool()
+
+    return {
+        'profile': name,
+        'requests': len(latencies),
+        'rps': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'errors': len(errors),
+        'locked': sum('locked' in e for e in errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--profiles', nargs='+', default=list(PROFILES), choices=list(PROFILES))
+    parser.add_argument('--passengers', type=int, default=500)
+    parser.add_argument('--trips', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=100, help='requests per thread')
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    results = [run_profile(name, args) for name in args.profiles]
+
+    print(f"{'profile':<12}{'requests':>10}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}{'locked':>8}")
+    for r in results:
+        print(f"{r['profile']:<12}{r['requests']:>10}{r['rps']:>10.1f}{r['p50_ms']:>10.2f}"
+              f"{r['p99_ms']:>10.2f}{r['errors']:>8}{r['locked']:>8}")
+
+
+if __name__ == '__main__':
+    main()
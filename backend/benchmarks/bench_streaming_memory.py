@@ -0,0 +1,107 @@
+"""
+Show that streamed /trips responses use flat memory as the table grows.
+
+The Trip table is grown step by step (by default to 1M rows). After each step
+the full table is downloaded with ?stream=1 (JSON array), as NDJSON, and
+through /export/trips as CSV and gzipped CSV, and the peak Python heap allocation while consuming the body is recorded with
+tracemalloc. The peak should stay roughly constant across sizes; the run
+exits non-zero if the largest size peaks more than --max-growth times the
+smallest.
+
+Usage:
+    python benchmarks/bench_streaming_memory.py --sizes 10000 100000 1000000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import logging
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import app as backend  # noqa: E402
+
+CARDS = 1000
+
+
+def seed_base(conn) -> None:
+    conn.executemany(
+        'INSERT INTO Passenger (FirstName, LastName, Email, PhoneNumber, RegistrationDate) '
+        'VALUES (?, ?, ?, ?, ?)',
+        [(f'First{i}', f'Last{i}', f'user{i}@example.com', None, '2025-01-01 00:00:00')
+         for i in range(CARDS)])
+    conn.executemany(
+        'INSERT INTO Card (CardNumber, Balance, IssueDate, Status, PassengerID, CardTypeID) '
+        'VALUES (?, ?, ?, ?, ?, ?)',
+        [(f'CARD{i:08d}', 100.0, '2025-01-01', 'Active', i + 1, 1) for i in range(CARDS)])
+    conn.commit()
+
+
+def grow_trips(conn, start: int, stop: int) -> None:
+    conn.executemany(
+        'INSERT INTO Trip (EntryTime, ExitTime, FareAmount, CardID, EntryStationID, ExitStationID) '
+        'VALUES (?, ?, ?, ?, ?, ?)',
+        ((f'2025-{1 + i % 12:02d}-{1 + i % 28:02d} {i % 24:02d}:{i % 60:02d}:00',
+          None, None, 1 + i % CARDS, 1 + i % 5, None) for i in range(start, stop)))
+    conn.commit()
+
+
+def measure(client, url: str, headers=None) -> tuple:
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    response = client.get(url, headers=headers or {}, buffered=False)
+    size = 0
+    for chunk in response.response:
+        size += len(chunk)
+    response.close()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, size, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', nargs='+', type=int, default=[10000, 100000, 1000000])
+    parser.add_argument('--max-growth', type=float, default=2.0,
+                        help='allowed ratio of peak memory between largest and smallest size')
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        backend.reset_db_pool()
+        backend.DB_PATH = os.path.join(tmp, 'stream.db')
+        backend.initialize_database()
+        conn = backend.get_db_pool().acquire()
+        seed_base(conn)
+        client = backend.app.test_client()
+
+        print(f"{'rows':>10}{'mode':>8}{'peak KiB':>12}{'body MiB':>12}{'seconds':>10}")
+        peaks = {}
+        loaded = 0
+        for size in sorted(args.sizes):
+            grow_trips(conn, loaded, size)
+            loaded = size
+            for mode, url, headers in (('json', '/trips?stream=1', None),
+                                       ('ndjson', '/trips', {'Accept': 'application/x-ndjson'}),
+                                       ('csv', '/export/trips', None),
+                                       ('csv.gz', '/export/trips?compress=gzip', None)):
+                peak, body, elapsed = measure(client, url, headers)
+                peaks.setdefault(mode, []).append(peak)
+                print(f"{size:>10}{mode:>8}{peak / 1024:>12.1f}{body / 2**20:>12.1f}{elapsed:>10.2f}")
+        conn.close()
+        backend.reset_db_pool()
+
+    failed = False
+    for mode, values in peaks.items():
+        growth = values[-1] / values[0]
+        print(f"{mode}: peak memory grew {growth:.2f}x from smallest to largest size")
+        failed |= growth > args.max_growth
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
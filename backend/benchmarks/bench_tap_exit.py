@@ -0,0 +1,166 @@
+"""
+Load-test the tap-out hot path, POST /trips/<id>/exit.
+
+A fresh database is seeded with fare rules for every station pair, funded
+cards and one open trip per request. Worker threads then tap out all of
+those trips concurrently through the Flask test client. The run reports
+throughput, latency percentiles and failures, then checks that every exit
+produced exactly one debit and one 'Fare' transaction.
+
+It exits non-zero if any request failed (including "database is locked"),
+the books do not balance, or p99 latency is above --p99-target-ms.
+
+--write-queue off sends each exit straight to SQLite in its own
+transaction instead of through the group-commit writer, for comparison.
+
+Usage:
+    python benchmarks/bench_tap_exit.py --threads 8 --requests 1000 --p99-target-ms 25
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import logging
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import app as backend  # noqa: E402
+from storage_profile import PROFILES  # noqa: E402
+
+CARDS = 2000
+STARTING_BALANCE = 1_000_000.0
+
+
+def seed(db_path: str, trips: int) -> None:
+    backend.DB_PATH = db_path
+    backend.initialize_database()
+    rng = random.Random(42)
+    conn = backend.get_db_pool().acquire()
+    try:
+        stations = [row[0] for row in conn.execute('SELECT StationID FROM Station')]
+        conn.executemany(
+            'INSERT INTO FareRule (StartStationID, EndStationID, FareType, FareAmount) VALUES (?, ?, ?, ?)',
+            [(a, b, 'Anytime', 10.0 + 5 * abs(a - b)) for a in stations for b in stations])
+        conn.executemany(
+            'INSERT INTO Passenger (FirstName, LastName, Email, PhoneNumber, RegistrationDate) '
+            'VALUES (?, ?, ?, ?, ?)',
+            [(f'First{i}', f'Last{i}', f'user{i}@example.com', None, '2025-01-01 00:00:00')
+             for i in range(CARDS)])
+        conn.executemany(
+            'INSERT INTO Card (CardNumber, Balance, IssueDate, Status, PassengerID, CardTypeID) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            [(f'CARD{i:08d}', STARTING_BALANCE, '2025-01-01', 'Active', i + 1, 1 + i % 4)
+             for i in range(CARDS)])
+        conn.executemany(
+            'INSERT INTO Trip (EntryTime, ExitTime, FareAmount, CardID, EntryStationID, ExitStationID) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            [(f'2025-10-{1 + i % 28:02d} {6 + i % 16:02d}:{i % 60:02d}:00', None, None,
+              1 + i % CARDS, rng.choice(stations), None) for i in range(trips)])
+        conn.commit()
+    finally:
+        conn.close()
+    # Fare rules were written behind the app's back; make the matrix reload.
+    backend.reference_cache.bump('FareRule')
+
+
+def worker(trip_ids: list, latencies: list, errors: list) -> None:
+    client = backend.app.test_client()
+    rng = random.Random(threading.get_ident())
+    for trip_id in trip_ids:
+        start = time.perf_counter()
+        response = client.post(f'/trips/{trip_id}/exit', json={
+            'exitStationId': rng.randint(1, 5),
+            'exitTime': '2025-10-30 12:00:00',
+        })
+        latencies.append(time.perf_counter() - start)
+        if response.status_code != 200:
+            errors.append(f'{response.status_code} {response.get_data(as_text=True)}')
+
+
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def check_books(trips: int) -> list:
+    """Every trip closed once, one Fare transaction each, and debits match."""
+    conn = backend.get_db_pool().acquire()
+    try:
+        open_trips = conn.execute('SELECT COUNT(*) FROM Trip WHERE ExitTime IS NULL').fetchone()[0]
+        fares, fare_sum = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(Amount), 0) FROM [Transaction] WHERE TransactionType = 'Fare'"
+        ).fetchone()
+        trip_sum = conn.execute('SELECT COALESCE(SUM(FareAmount), 0) FROM Trip').fetchone()[0]
+        debited = CARDS * STARTING_BALANCE - conn.execute('SELECT SUM(Balance) FROM Card').fetchone()[0]
+    finally:
+        conn.close()
+    problems = []
+    if open_trips:
+        problems.append(f'{open_trips} trips still open')
+    if fares != trips:
+        problems.append(f'{fares} fare transactions for {trips} exits')
+    if abs(fare_sum - trip_sum) > 0.01 or abs(fare_sum - debited) > 0.01:
+        problems.append(f'fares {fare_sum:.2f}, trip fares {trip_sum:.2f}, debited {debited:.2f}')
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--profile', default='balanced', choices=list(PROFILES))
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=1000, help='exits per thread')
+    parser.add_argument('--p99-target-ms', type=float, default=25.0)
+    parser.add_argument('--write-queue', choices=['on', 'off'], default='on')
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    trips = args.threads * args.requests
+    with tempfile.TemporaryDirectory() as tmp:
+        backend.reset_db_pool()
+        backend.DB_STORAGE_PROFILE = args.profile
+        backend.DB_WRITE_QUEUE = args.write_queue == 'on'
+        seed(os.path.join(tmp, 'bench.db'), trips)
+
+        latencies, errors = [], []
+        trip_ids = list(range(1, trips + 1))
+        random.Random(7).shuffle(trip_ids)
+        threads = [threading.Thread(target=worker, args=(trip_ids[i::args.threads], latencies, errors))
+                   for i in range(args.threads)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+
+        problems = [] if errors else check_books(trips)
+        if backend.DB_WRITE_QUEUE:
+            stats = backend.get_write_queue().stats()
+            print(f"write queue: {stats['batches']} commits, avg group {stats['avgBatch']:.1f}, "
+                  f"largest {stats['largestBatch']}")
+        backend.reset_db_pool()
+
+    p99_ms = percentile(latencies, 99) * 1000
+    print(f"profile {args.profile}, write queue {args.write_queue}, {args.threads} threads, "
+          f"{trips} exits in {elapsed:.2f}s")
+    print(f"  exits/s  {trips / elapsed:10.1f}")
+    for pct in (50, 95, 99):
+        print(f"  p{pct} ms   {percentile(latencies, pct) * 1000:10.2f}")
+    print(f"  max ms   {max(latencies) * 1000:10.2f}")
+    print(f"  errors   {len(errors):10d}  (locked: {sum('locked' in e or 'busy' in e for e in errors)})")
+    for message in errors[:5]:
+        print(f"    {message}")
+    for problem in problems:
+        print(f"  BOOKS    {problem}")
+
+    if errors or problems or p99_ms > args.p99_target_ms:
+        print(f"FAIL (p99 target {args.p99_target_ms:.1f} ms)")
+        sys.exit(1)
+    print(f"OK (p99 {p99_ms:.2f} ms <= {args.p99_target_ms:.1f} ms)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""
+Compare batch tap ingestion (POST /trips/batch) with the one-event-per-request path.
+
+Each mode gets a fresh database with fare rules, funded cards and the same
+stream of entry/exit tap pairs. The single-event mode replays it as
+POST /trips (entries) and POST /trips/<id>/exit (exits), one request per
+event; the batch mode sends it in POST /trips/batch requests of --batch-size
+events. The run reports events per second for each and the speedup.
+
+Usage:
+    python benchmarks/bench_trip_batch.py --single-events 2000 --batch-events 50000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import logging
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import app as backend  # noqa: E402
+
+CARDS = 5000
+
+
+def seed(db_path: str) -> None:
+    backend.DB_PATH = db_path
+    backend.initialize_database()
+    conn = backend.get_db_pool().acquire()
+    try:
+        stations = [row[0] for row in conn.execute('SELECT StationID FROM Station')]
+        conn.executemany(
+            'INSERT INTO FareRule (StartStationID, EndStationID, FareType, FareAmount) VALUES (?, ?, ?, ?)',
+            [(a, b, 'Anytime', 10.0 + 5 * abs(a - b)) for a in stations for b in stations])
+        conn.executemany(
+            'INSERT INTO Passenger (FirstName, LastName, Email, PhoneNumber, RegistrationDate) '
+            'VALUES (?, ?, ?, ?, ?)',
+            [(f'First{i}', f'Last{i}', f'user{i}@example.com', None, '2025-01-01 00:00:00')
+             for i in range(CARDS)])
+        conn.executemany(
+            'INSERT INTO Card (CardNumber, Balance, IssueDate, Status, PassengerID, CardTypeID) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            [(f'CARD{i:08d}', 1_000_000.0, '2025-01-01', 'Active', i + 1, 1 + i % 4) for i in range(CARDS)])
+        conn.commit()
+    finally:
+        conn.close()
+    backend.reference_cache.bump('FareRule')
+
+
+def tap_events(count: int) -> list:
+    """Entry/exit pairs, one journey per card at a time, in time order."""
+    rng = random.Random(42)
+    start = datetime(2025, 10, 1, 6, 0)
+    events = []
+    for n in range(count // 2):
+        card_id = 1 + n % CARDS
+        entry = start + timedelta(seconds=n)
+        events.append({'type': 'entry', 'cardId': card_id, 'stationId': rng.randint(1, 5),
+                       'time': entry.strftime('%Y-%m-%d %H:%M:%S')})
+        events.append({'type': 'exit', 'cardId': card_id, 'stationId': rng.randint(1, 5),
+                       'time': (entry + timedelta(minutes=20)).strftime('%Y-%m-%d %H:%M:%S')})
+    return events
+
+
+def run_single(client, events: list) -> int:
+    failures = 0
+    open_trip = {}
+    for event in events:
+        if event['type'] == 'entry':
+            response = client.post('/trips', json={'cardId': event['cardId'], 'entryStationId': event['stationId'],
+                                                   'entryTime': event['time']})
+            open_trip[event['cardId']] = response.get_json().get('id')
+        else:
+            response = client.post(f"/trips/{open_trip.pop(event['cardId'])}/exit",
+                                   json={'exitStationId': event['stationId'], 'exitTime': event['time']})
+        failures += response.status_code >= 300
+    return failures
+
+
+def run_batch(client, events: list, batch_size: int) -> int:
+    failures = 0
+    for i in range(0, len(events), batch_size):
+        response = client.post('/trips/batch', json=events[i:i + batch_size])
+        failures += response.get_json()['rejected'] if response.status_code == 200 else batch_size
+    return failures
+
+
+def run_mode(name: str, events: list, args) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        backend.reset_db_pool()
+        seed(os.path.join(tmp, 'bench.db'))
+        client = backend.app.test_client()
+        start = time.perf_counter()
+        if name == 'single':
+            failures = run_single(client, events)
+        else:
+            failures = run_batch(client, events, args.batch_size)
+        elapsed = time.perf_counter() - start
+        backend.reset_db_pool()
+    return {'mode': name, 'events': len(events), 'seconds': elapsed,
+            'eps': len(events) / elapsed, 'failures': failures}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--single-events', type=int, default=2000)
+    parser.add_argument('--batch-events', type=int, default=50000)
+    parser.add_argument('--batch-size', type=int, default=50000, help='events per batch request')
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    results = [run_mode('single', tap_events(args.single_events), args),
+               run_mode('batch', tap_events(args.batch_events), args)]
+
+    print(f"{'mode':<8}{'events':>10}{'seconds':>10}{'events/s':>12}{'failures':>10}")
+    for r in results:
+        print(f"{r['mode']:<8}{r['events']:>10}{r['seconds']:>10.2f}{r['eps']:>12.1f}{r['failures']:>10}")
+    print(f"batch speedup: {results[1]['eps'] / results[0]['eps']:.1f}x")
+    if any(r['failures'] for r in results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,358 @@
+import argparse
+import csv
+import functools
+import itertools
+import json
+import os
+import sqlite3
+import sys
+import time
+import logging
+from datetime import datetime
+from typing import Any, Callable, Dict, IO, Iterator, List, Optional
+
+from trip_ops import run_immediate
+from write_queue import WriteOp
+
+logger = logging.getLogger(__name__)
+
+# Streaming bulk loader for passengers and cards.
+#
+# Input is read record by record (CSV with a header row, or NDJSON) and
+# written in chunks of IMPORT_CHUNK_ROWS, one transaction per chunk, with
+# executemany. Foreign keys and uniqueness are checked against in-memory
+# maps loaded once per job, so no per-row SELECTs are issued; rows that
+# fail a check are reported and skipped instead of aborting the load.
+#
+# Progress is tracked in the ImportJob table and committed in the same
+# transaction as each chunk, so after a crash a job can be resumed from the
+# first record of the last uncommitted chunk by re-sending the same file.
+
+IMPORT_CHUNK_ROWS = 50_000
+MAX_REPORTED_REJECTS = 1000
+ENTITIES = ('passengers', 'cards')
+FORMATS = ('csv', 'ndjson')
+CARD_STATUSES = ('Active', 'Inactive', 'Blocked')
+
+IMPORT_JOB_DDL = '''
+    CREATE TABLE IF NOT EXISTS ImportJob (
+        ImportJobID INTEGER PRIMARY KEY AUTOINCREMENT,
+        Entity TEXT NOT NULL,
+        Source TEXT,
+        Format TEXT NOT NULL,
+        Status TEXT NOT NULL CHECK(Status IN ('running', 'completed', 'failed')),
+        RowsRead INTEGER NOT NULL DEFAULT 0,
+        RowsInserted INTEGER NOT NULL DEFAULT 0,
+        RowsRejected INTEGER NOT NULL DEFAULT 0,
+        StartedAt TEXT NOT NULL,
+        UpdatedAt TEXT NOT NULL,
+        Error TEXT
+    );
+'''
+
+
+class ImportJobError(ValueError):
+    """Raised for a job that cannot be started or resumed."""
+
+
+class RowRejected(ValueError):
+    """A single input row failed validation."""
+
+
+def _now() -> str:
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+# ---------- reading ----------
+
+def iter_records(stream: IO[str], fmt: str) -> Iterator[Dict[str, Any]]:
+    """
+    Yield one dict per input record with lower-cased keys.
+    Malformed NDJSON lines are yielded as {'__error__': message}.
+    """
+    if fmt == 'csv':
+        for row in csv.DictReader(stream):
+            yield {(k or '').strip().lower(): v for k, v in row.items()}
+    elif fmt == 'ndjson':
+        for line in stream:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield {'__error__': f"Invalid JSON: {e}"}
+                continue
+            if not isinstance(record, dict):
+                yield {'__error__': "Expected a JSON object"}
+                continue
+            yield {k.lower(): v for k, v in record.items()}
+    else:
+        raise ImportJobError(f"Unknown format '{fmt}'; expected one of {', '.join(FORMATS)}")
+
+
+def _text(record: Dict[str, Any], key: str, required: bool = False) -> Optional[str]:
+    value = record.get(key)
+    if value is None or (isinstance(value, str) and not value.strip()):
+        if required:
+            raise RowRejected(f"{key} is required")
+        return None
+    return str(value).strip()
+
+
+# ---------- per-entity row builders ----------
+
+class PassengerLoader:
+    """Validates passenger records; Email and PhoneNumber (when given) must be unique."""
+
+    insert_sql = ('INSERT INTO Passenger (FirstName, LastName, Email, PhoneNumber, RegistrationDate) '
+                  'VALUES (?, ?, ?, ?, ?)')
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.emails = {row[0].lower() for row in conn.execute('SELECT Email FROM Passenger')}
+        self.phones = {row[0] for row in conn.execute('SELECT PhoneNumber FROM Passenger WHERE PhoneNumber IS NOT NULL')}
+        self.now = _now()
+
+    def build(self, record: Dict[str, Any]) -> tuple:
+        email = _text(record, 'email', required=True)
+        key = email.lower()
+        if key in self.emails:
+            raise RowRejected(f"Email already exists: {email}")
+        phone = _text(record, 'phonenumber')
+        if phone is not None and phone in self.phones:
+            raise RowRejected(f"Phone number already exists: {phone}")
+        row = (_text(record, 'firstname', required=True), _text(record, 'lastname', required=True),
+               email, phone, _text(record, 'registrationdate') or self.now)
+        self.emails.add(key)
+        if phone is not None:
+            self.phones.add(phone)
+        return row
+
+
+class CardLoader:
+    """
+    Validates card records; CardNumber must be unique. The passenger is given
+    by PassengerID or PassengerEmail, the card type by CardTypeID or CardType
+    (TypeName).
+    """
+
+    insert_sql = ('INSERT INTO Card (CardNumber, Balance, IssueDate, Status, PassengerID, CardTypeID) '
+                  'VALUES (?, ?, ?, ?, ?, ?)')
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.card_numbers = {row[0] for row in conn.execute('SELECT CardNumber FROM Card')}
+        self.passengers_by_email = {row[0].lower(): row[1] for row in
+                                    conn.execute('SELECT Email, PassengerID FROM Passenger')}
+        self.passenger_ids = set(self.passengers_by_email.values())
+        card_types = conn.execute('SELECT CardTypeID, TypeName FROM CardType').fetchall()
+        self.card_type_ids = {row[0] for row in card_types}
+        self.card_types_by_name = {row[1].lower(): row[0] for row in card_types}
+        self.today = datetime.now().strftime('%Y-%m-%d')
+
+    def _passenger_id(self, record: Dict[str, Any]) -> int:
+        if _text(record, 'passengerid') is not None:
+            passenger_id = int(record['passengerid'])
+            if passenger_id not in self.passenger_ids:
+                raise RowRejected(f"Passenger not found: {passenger_id}")
+            return passenger_id
+        email = _text(record, 'passengeremail', required=True)
+        passenger_id = self.passengers_by_email.get(email.lower())
+        if passenger_id is None:
+            raise RowRejected(f"Passenger not found: {email}")
+        return passenger_id
+
+    def _card_type_id(self, record: Dict[str, Any]) -> int:
+        if _text(record, 'cardtypeid') is not None:
+            card_type_id = int(record['cardtypeid'])
+            if card_type_id not in self.card_type_ids:
+                raise RowRejected(f"Card type not found: {card_type_id}")
+            return card_type_id
+        name = _text(record, 'cardtype', required=True)
+        card_type_id = self.card_types_by_name.get(name.lower())
+        if card_type_id is None:
+            raise RowRejected(f"Card type not found: {name}")
+        return card_type_id
+
+    def build(self, record: Dict[str, Any]) -> tuple:
+        card_number = _text(record, 'cardnumber', required=True)
+        if card_number in self.card_numbers:
+            raise RowRejected(f"Card number already exists: {card_number}")
+        status = _text(record, 'status') or 'Active'
+        if status not in CARD_STATUSES:
+            raise RowRejected(f"Status must be one of {', '.join(CARD_STATUSES)}")
+        balance = float(_text(record, 'balance') or 0.0)
+        if balance < 0:
+            raise RowRejected("Balance must not be negative")
+        row = (card_number, balance, _text(record, 'issuedate') or self.today, status,
+               self._passenger_id(record), self._card_type_id(record))
+        self.card_numbers.add(card_number)
+        return row
+
+
+LOADERS = {'passengers': PassengerLoader, 'cards': CardLoader}
+
+
+# ---------- jobs ----------
+
+def get_job(conn: sqlite3.Connection, job_id: int) -> Optional[Dict[str, Any]]:
+    """Return an ImportJob row as a dict, or None."""
+    row = conn.execute('''
+        SELECT ImportJobID, Entity, Source, Format, Status, RowsRead, RowsInserted,
+               RowsRejected, StartedAt, UpdatedAt, Error
+        FROM ImportJob WHERE ImportJobID = ?
+    ''', (job_id,)).fetchone()
+    if row is None:
+        return None
+    keys = ('jobId', 'entity', 'source', 'format', 'status', 'rowsRead', 'rowsInserted',
+            'rowsRejected', 'startedAt', 'updatedAt', 'error')
+    return dict(zip(keys, tuple(row)))
+
+
+def _start_job(conn: sqlite3.Connection, write: Callable[[WriteOp], Any], entity: str, fmt: str,
+               source: Optional[str], resume_job_id: Optional[int]) -> Dict[str, Any]:
+    if resume_job_id is None:
+        now = _now()
+        job_id = write(lambda c: c.execute('''
+            INSERT INTO ImportJob (Entity, Source, Format, Status, StartedAt, UpdatedAt)
+            VALUES (?, ?, ?, 'running', ?, ?)
+        ''', (entity, source, fmt, now, now)).lastrowid)
+        return get_job(conn, job_id)
+
+    job = get_job(conn, resume_job_id)
+    if job is None:
+        raise ImportJobError(f"Import job {resume_job_id} not found")
+    if job['entity'] != entity or job['format'] != fmt:
+        raise ImportJobError(f"Import job {resume_job_id} is a {job['format']} import of {job['entity']}")
+    if job['status'] != 'completed':
+        write(lambda c: c.execute(
+            "UPDATE ImportJob SET Status = 'running', Error = NULL, UpdatedAt = ? WHERE ImportJobID = ?",
+            (_now(), resume_job_id)))
+    return get_job(conn, resume_job_id)
+
+
+def _write_chunk(insert_sql: str, rows: List[tuple], job_id: int, position: int, rejected: int,
+                 conn: sqlite3.Connection) -> None:
+    """Insert a chunk and record the job's progress in the same transaction."""
+    conn.executemany(insert_sql, rows)
+    conn.execute('''
+        UPDATE ImportJob SET RowsRead = ?, RowsInserted = RowsInserted + ?,
+            RowsRejected = RowsRejected + ?, UpdatedAt = ?
+        WHERE ImportJobID = ?
+    ''', (position, len(rows), rejected, _now(), job_id))
+
+
+def run_import(conn: sqlite3.Connection, entity: str, stream: IO[str], fmt: str,
+               source: Optional[str] = None, resume_job_id: Optional[int] = None,
+               chunk_rows: int = IMPORT_CHUNK_ROWS,
+               on_reject: Optional[Callable[[int, str], None]] = None,
+               write: Optional[Callable[[WriteOp], Any]] = None) -> Dict[str, Any]:
+    """
+    Stream an import of passengers or cards into the database.
+
+    When resuming, the same input must be sent again; the records the job
+    already committed are skipped.
+    :param conn: Connection object (not in a transaction) for the reads
+    :param entity: 'passengers' or 'cards'
+    :param stream: text stream of CSV (with header) or NDJSON
+    :param fmt: 'csv' or 'ndjson'
+    :param source: file name or other label stored with the job
+    :param resume_job_id: ImportJobID to continue
+    :param chunk_rows: records per transaction
+    :param on_reject: called with (record number, error) for every rejected row
+    :param write: runs op(conn) in its own write transaction and returns its
+        result (app.run_write); default run_immediate on conn. Each chunk
+        is one call, so other writes get in between chunks.
+    :return: the job summary, plus the first MAX_REPORTED_REJECTS rejects of this run
+    """
+    if entity not in LOADERS:
+        raise ImportJobError(f"Unknown entity '{entity}'; expected one of {', '.join(ENTITIES)}")
+    if conn.in_transaction:
+        conn.commit()
+    if write is None:
+        write = functools.partial(run_immediate, conn)
+    job = _start_job(conn, write, entity, fmt, source, resume_job_id)
+    if job['status'] == 'completed':
+        return {**job, 'rejects': []}
+
+    job_id = job['jobId']
+    loader = LOADERS[entity](conn)
+    records = iter_records(stream, fmt)
+    # Records 1..RowsRead were committed by an earlier run of this job.
+    position = job['rowsRead']
+    for _ in itertools.islice(records, position):
+        pass
+
+    rejects: List[Dict[str, Any]] = []
+    started = time.perf_counter()
+    try:
+        while True:
+            chunk = list(itertools.islice(records, chunk_rows))
+            if not chunk:
+                break
+            rows, rejected = [], 0
+            for record in chunk:
+                position += 1
+                try:
+                    if '__error__' in record:
+                        raise RowRejected(record['__error__'])
+                    rows.append(loader.build(record))
+                except (RowRejected, ValueError, TypeError) as e:
+                    rejected += 1
+                    if len(rejects) < MAX_REPORTED_REJECTS:
+                        rejects.append({'record': position, 'error': str(e)})
+                    if on_reject:
+                        on_reject(position, str(e))
+
+            write(functools.partial(_write_chunk, loader.insert_sql, rows, job_id, position, rejected))
+            logger.info(f"Import job {job_id}: {position} records read")
+    except Exception as e:
+        e.job_id = job_id  # so callers can tell the client which job to resume
+        write(lambda c: c.execute(
+            "UPDATE ImportJob SET Status = 'failed', Error = ?, UpdatedAt = ? WHERE ImportJobID = ?",
+            (str(e), _now(), job_id)))
+        raise
+
+    write(lambda c: c.execute("UPDATE ImportJob SET Status = 'completed', UpdatedAt = ? WHERE ImportJobID = ?",
+                              (_now(), job_id)))
+    job = get_job(conn, job_id)
+    logger.info(f"Import job {job_id} completed: {job['rowsInserted']} inserted, "
+                f"{job['rowsRejected']} rejected in {time.perf_counter() - started:.1f}s")
+    return {**job, 'rejects': rejects}
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Bulk import passengers or cards from CSV or NDJSON')
+    parser.add_argument('entity', choices=ENTITIES)
+    parser.add_argument('file', help="input file ('-' for stdin)")
+    parser.add_argument('--format', choices=FORMATS,
+                        help='input format (default: from the file extension, else csv)')
+    parser.add_argument('--resume', type=int, metavar='JOB_ID', help='continue an interrupted import job')
+    parser.add_argument('--rejects', help='write rejected records (record number, error) to this CSV file')
+    parser.add_argument('--chunk-rows', type=int, default=IMPORT_CHUNK_ROWS)
+    parser.add_argument('--db', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'project.db'),
+                        help='path to the SQLite database')
+    args = parser.parse_args()
+
+    fmt = args.format or ('ndjson' if args.file.endswith(('.ndjson', '.jsonl')) else 'csv')
+    from migrations import migrate  # imported here: migrations imports this module
+    from storage_profile import resolve_profile, apply_connection_settings
+
+    conn = sqlite3.connect(args.db)
+    rejects_file = open(args.rejects, 'a', newline='') if args.rejects else None
+    stream = sys.stdin if args.file == '-' else open(args.file, newline='', encoding='utf-8')
+    try:
+        apply_connection_settings(conn, resolve_profile(os.environ.get('DB_STORAGE_PROFILE')))
+        migrate(conn)
+        writer = csv.writer(rejects_file) if rejects_file else None
+        result = run_import(conn, args.entity, stream, fmt, source=os.path.basename(args.file),
+                            resume_job_id=args.resume, chunk_rows=args.chunk_rows,
+                            on_reject=(lambda n, e: writer.writerow((n, e))) if writer else None)
+        result.pop('rejects')
+        for key, value in result.items():
+            print(f"{key}: {value}")
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+        if rejects_file:
+            rejects_file.close()
+        conn.close()
@@ -0,0 +1,34 @@
+"""
+EXPLAIN QUERY PLAN regression check for the SQL behind each endpoint.
+
+Runs tests/test_query_plans.py, which fails any endpoint query whose plan
+contains a full table SCAN of Trip, Transaction, Card or Passenger. The
+checks run on a fresh scratch database with the managed index set, or on
+--db.
+
+Usage:
+    python check_query_plans.py            # exit status 1 on any regression
+    python check_query_plans.py --verbose  # list every query checked
+"""
+import argparse
+import os
+import sys
+
+import pytest
+
+TESTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tests', 'test_query_plans.py')
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--db', help='existing database to check (default: fresh scratch database)')
+    parser.add_argument('--verbose', action='store_true', help='list every query checked')
+    args = parser.parse_args()
+
+    if args.db:
+        os.environ['QUERY_PLAN_DB'] = os.path.abspath(args.db)
+    return pytest.main([TESTS, '-v' if args.verbose else '-q', '-p', 'no:cacheprovider'])
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,222 @@
+import argparse
+import os
+import sqlite3
+import logging
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# One-row summary table behind GET /dashboard/stats. The triggers below keep
+# every counter current as rows are written, so the endpoint reads a single
+# row instead of running full-table aggregates. Installed by migrations.py.
+COUNTERS_DDL = '''
+    CREATE TABLE IF NOT EXISTS DashboardCounters (
+        ID INTEGER PRIMARY KEY CHECK (ID = 1),
+        TotalPassengers INTEGER NOT NULL DEFAULT 0,
+        ActiveCards INTEGER NOT NULL DEFAULT 0,
+        BlockedCards INTEGER NOT NULL DEFAULT 0,
+        TotalBalance REAL NOT NULL DEFAULT 0.0,
+        TotalTrips INTEGER NOT NULL DEFAULT 0,
+        ActiveTrips INTEGER NOT NULL DEFAULT 0,
+        TotalStations INTEGER NOT NULL DEFAULT 0,
+        FareRuleCount INTEGER NOT NULL DEFAULT 0,
+        FareAmountSum REAL NOT NULL DEFAULT 0.0,
+        TotalTransactions INTEGER NOT NULL DEFAULT 0,
+        TotalRevenue REAL NOT NULL DEFAULT 0.0
+    );
+
+    -- Passenger
+    CREATE TRIGGER IF NOT EXISTS trg_counters_passenger_insert AFTER INSERT ON Passenger
+    BEGIN
+        UPDATE DashboardCounters SET TotalPassengers = TotalPassengers + 1 WHERE ID = 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_counters_passenger_delete AFTER DELETE ON Passenger
+    BEGIN
+        UPDATE DashboardCounters SET TotalPassengers = TotalPassengers - 1 WHERE ID = 1;
+    END;
+
+    -- Station
+    CREATE TRIGGER IF NOT EXISTS trg_counters_station_insert AFTER INSERT ON Station
+    BEGIN
+        UPDATE DashboardCounters SET TotalStations = TotalStations + 1 WHERE ID = 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_counters_station_delete AFTER DELETE ON Station
+    BEGIN
+        UPDATE DashboardCounters SET TotalStations = TotalStations - 1 WHERE ID = 1;
+    END;
+
+    -- Card
+    CREATE TRIGGER IF NOT EXISTS trg_counters_card_insert AFTER INSERT ON Card
+    BEGIN
+        UPDATE DashboardCounters SET
+            ActiveCards = ActiveCards + (NEW.Status = 'Active'),
+            BlockedCards = BlockedCards + (NEW.Status = 'Blocked'),
+            TotalBalance = TotalBalance + NEW.Balance
+        WHERE ID = 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_counters_card_delete AFTER DELETE ON Card
+    BEGIN
+        UPDATE DashboardCounters SET
+            ActiveCards = ActiveCards - (OLD.Status = 'Active'),
+            BlockedCards = BlockedCards - (OLD.Status = 'Blocked'),
+            TotalBalance = TotalBalance - OLD.Balance
+        WHERE ID = 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_counters_card_update AFTER UPDATE OF Status, Balance ON Card
+    BEGIN
+        UPDATE DashboardCounters SET
+            ActiveCards = ActiveCards + (NEW.Status = 'Active') - (OLD.Status = 'Active'),
+            BlockedCards = BlockedCards + (NEW.Status = 'Blocked') - (OLD.Status = 'Blocked'),
+            TotalBalance = TotalBalance + NEW.Balance - OLD.Balance
+        WHERE ID = 1;
+    END;
+
+    -- Trip (a trip without ExitTime is still in progress)
+    CREATE TRIGGER IF NOT EXISTS trg_counters_trip_insert AFTER INSERT ON Trip
+    BEGIN
+        UPDATE DashboardCounters SET
+            TotalTrips = TotalTrips + 1,
+            ActiveTrips = ActiveTrips + (NEW.ExitTime IS NULL)
+        WHERE ID = 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_counters_trip_delete AFTER DELETE ON Trip
+    BEGIN
+        UPDATE DashboardCounters SET
+            TotalTrips = TotalTrips - 1,
+            ActiveTrips = ActiveTrips - (OLD.ExitTime IS NULL)
+        WHERE ID = 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_counters_trip_update AFTER UPDATE OF ExitTime ON Trip
+    BEGIN
+        UPDATE DashboardCounters SET
+            ActiveTrips = ActiveTrips + (NEW.ExitTime IS NULL) - (OLD.ExitTime IS NULL)
+        WHERE ID = 1;
+    END;
+
+    -- FareRule (average fare = FareAmountSum / FareRuleCount)
+    CREATE TRIGGER IF NOT EXISTS trg_counters_farerule_insert AFTER INSERT ON FareRule
+    BEGIN
+        UPDATE DashboardCounters SET
+            FareRuleCount = FareRuleCount + 1,
+            FareAmountSum = FareAmountSum + NEW.FareAmount
+        WHERE ID = 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_counters_farerule_delete AFTER DELETE ON FareRule
+    BEGIN
+        UPDATE DashboardCounters SET
+            FareRuleCount = FareRuleCount - 1,
+            FareAmountSum = FareAmountSum - OLD.FareAmount
+        WHERE ID = 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_counters_farerule_update AFTER UPDATE OF FareAmount ON FareRule
+    BEGIN
+        UPDATE DashboardCounters SET
+            FareAmountSum = FareAmountSum + NEW.FareAmount - OLD.FareAmount
+        WHERE ID = 1;
+    END;
+
+    -- Transaction
+    CREATE TRIGGER IF NOT EXISTS trg_counters_transaction_insert AFTER INSERT ON [Transaction]
+    BEGIN
+        UPDATE DashboardCounters SET
+            TotalTransactions = TotalTransactions + 1,
+            TotalRevenue = TotalRevenue + NEW.Amount
+        WHERE ID = 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_counters_transaction_delete AFTER DELETE ON [Transaction]
+    BEGIN
+        UPDATE DashboardCounters SET
+            TotalTransactions = TotalTransactions - 1,
+            TotalRevenue = TotalRevenue - OLD.Amount
+        WHERE ID = 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_counters_transaction_update AFTER UPDATE OF Amount ON [Transaction]
+    BEGIN
+        UPDATE DashboardCounters SET
+            TotalRevenue = TotalRevenue + NEW.Amount - OLD.Amount
+        WHERE ID = 1;
+    END;
+'''
+
+REBUILD_SQL = '''
+    INSERT OR REPLACE INTO DashboardCounters (
+        ID, TotalPassengers, ActiveCards, BlockedCards, TotalBalance,
+        TotalTrips, ActiveTrips, TotalStations, FareRuleCount, FareAmountSum,
+        TotalTransactions, TotalRevenue
+    ) VALUES (
+        1,
+        (SELECT COUNT(*) FROM Passenger),
+        (SELECT COUNT(*) FROM Card WHERE Status = 'Active'),
+        (SELECT COUNT(*) FROM Card WHERE Status = 'Blocked'),
+        (SELECT COALESCE(SUM(Balance), 0) FROM Card),
+        (SELECT COUNT(*) FROM Trip),
+        (SELECT COUNT(*) FROM Trip WHERE ExitTime IS NULL),
+        (SELECT COUNT(*) FROM Station),
+        (SELECT COUNT(*) FROM FareRule),
+        (SELECT COALESCE(SUM(FareAmount), 0) FROM FareRule),
+        (SELECT COUNT(*) FROM [Transaction]),
+        (SELECT COALESCE(SUM(Amount), 0) FROM [Transaction])
+    )
+'''
+
+
+def rebuild_counters(conn: sqlite3.Connection, archive_root: Optional[str] = None) -> None:
+    """
+    Recompute every counter from scratch (use when they have drifted),
+    including the trips and transactions moved to the cold tier.
+    :param conn: Connection object
+    :param archive_root: cold tier directory (default: archive.archive_dir_for)
+    :return: None
+    """
+    # archive.py imports this module
+    from archive import add_cold_counters, archive_dir_for
+
+    conn.execute(REBUILD_SQL)
+    archive_root = archive_root or archive_dir_for(conn)
+    if archive_root:
+        add_cold_counters(conn, archive_root)
+    conn.commit()
+    logger.info("Dashboard counters rebuilt")
+
+
+def read_counters(conn: sqlite3.Connection) -> Dict[str, Any]:
+    """
+    Read the counter row in the shape returned by /dashboard/stats.
+    :param conn: Connection object
+    :return: dict of dashboard totals
+    """
+    row = conn.execute('SELECT * FROM DashboardCounters WHERE ID = 1').fetchone()
+    if row is None:
+        raise sqlite3.OperationalError("DashboardCounters has not been initialized")
+    fare_rule_count = row[8]
+    return {
+        'totalPassengers': row[1],
+        'activeCards': row[2],
+        'blockedCards': row[3],
+        'totalBalance': float(row[4]),
+        'totalTrips': row[5],
+        'activeTrips': row[6],
+        'totalStations': row[7],
+        'averageFare': float(row[9]) / fare_rule_count if fare_rule_count else 0.0,
+        'totalTransactions': row[10],
+        'totalRevenue': float(row[11]),
+    }
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Maintain the DashboardCounters summary table')
+    parser.add_argument('command', choices=['rebuild', 'show'])
+    parser.add_argument('--db', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'project.db'),
+                        help='path to the SQLite database')
+    parser.add_argument('--archive-dir', help='cold tier directory (default: ARCHIVE_DIR or archive/ next to the db)')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    try:
+        if args.command == 'rebuild':
+            rebuild_counters(conn, args.archive_dir)
+        for key, value in read_counters(conn).items():
+            print(f"{key}: {value}")
+    finally:
+        conn.close()
@@ -0,0 +1,236 @@
+import sqlite3
+import threading
+import time
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(sqlite3.OperationalError):
+    """Raised when no pooled connection becomes free within the wait timeout."""
+
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection that hands itself back to its pool on close()."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool: Optional['ConnectionPool'] = None
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.leased_at = self.created_at
+        self.uses = 0
+        self.lease = 0
+        self.checked_out = False
+        self.owner_thread: Optional[int] = None
+        self.trace = None  # per-lease instrumentation, see request_trace.RequestTrace
+        self.slow_log = None  # see slow_query.SlowQueryLog.attach
+        self.deadline = None  # per-lease, see deadlines.Deadline
+
+    def close(self):
+        """Return the connection to its pool (or really close it if unpooled)."""
+        if self.pool is not None:
+            self.pool.release(self)
+        else:
+            super().close()
+
+    def discard(self):
+        """Close the underlying SQLite handle for good."""
+        self.pool = None
+        sqlite3.Connection.close(self)
+
+
+class ConnectionPool:
+    """
+    Fixed-size pool of SQLite connections.
+
+    Connections are handed out LIFO, preferring the one the calling thread
+    used last so its page and statement caches stay warm. Idle connections
+    are health-checked before reuse and recycled after max_lifetime seconds
+    or max_uses checkouts.
+    """
+
+    def __init__(self, db_path: str, size: int = 8, timeout: float = 10.0,
+                 max_lifetime: float = 3600.0, max_uses: int = 10000,
+                 health_check_after: float = 30.0,
+                 on_connect: Optional[Callable[[sqlite3.Connection], None]] = None,
+                 connect_kwargs: Optional[Dict[str, Any]] = None):
+        if size < 1:
+            raise ValueError("Pool size must be at least 1")
+        self.db_path = db_path
+        self.size = size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.max_uses = max_uses
+        self.health_check_after = health_check_after
+        self.on_connect = on_connect
+        self.connect_kwargs = connect_kwargs or {}
+
+        self._idle: List[PooledConnection] = []
+        self._open = 0
+        self._closed = False
+        self._cond = threading.Condition(threading.Lock())
+
+        self._hits = 0
+        self._misses = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._timeouts = 0
+        self._recycled = 0
+        self._health_check_failures = 0
+        self._busy_time = 0.0
+
+    # ---------- connection lifecycle ----------
+
+    def _connect(self) -> PooledConnection:
+        conn = sqlite3.connect(self.db_path, factory=PooledConnection,
+                               check_same_thread=False, **self.connect_kwargs)
+        try:
+            conn.row_factory = sqlite3.Row
+            if self.on_connect:
+                self.on_connect(conn)
+        except Exception:
+            conn.discard()
+            raise
+        conn.pool = self
+        return conn
+
+    def _is_stale(self, conn: PooledConnection, now: float) -> bool:
+        return (now - conn.created_at > self.max_lifetime
+                or conn.uses >= self.max_uses)
+
+    def _is_healthy(self, conn: PooledConnection, now: float) -> bool:
+        if now - conn.last_used < self.health_check_after:
+            return True
+        try:
+            conn.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error as e:
+            logger.warning(f"Discarding unhealthy pooled connection: {e}")
+            return False
+
+    def _take_idle(self) -> Optional[PooledConnection]:
+        """Pop the calling thread's previous connection if idle, else the most recent one."""
+        if not self._idle:
+            return None
+        me = threading.get_ident()
+        for i in range(len(self._idle) - 1, -1, -1):
+            if self._idle[i].owner_thread == me:
+                return self._idle.pop(i)
+        return self._idle.pop()
+
+    def acquire(self) -> PooledConnection:
+        """Check a connection out of the pool, waiting up to `timeout` seconds."""
+        deadline = None
+        waited_since = None
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise sqlite3.ProgrammingError("Connection pool is closed")
+                conn = self._take_idle()
+                if conn is not None or self._open < self.size:
+                    break
+                if waited_since is None:
+                    waited_since = time.monotonic()
+                    deadline = waited_since + self.timeout
+                    self._waits += 1
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    self._wait_time += time.monotonic() - waited_since
+                    raise PoolTimeout(f"No database connection available after {self.timeout:.1f}s")
+                self._cond.wait(remaining)
+            if waited_since is not None:
+                self._wait_time += time.monotonic() - waited_since
+            if conn is None:
+                self._open += 1
+                self._misses += 1
+            else:
+                self._hits += 1
+
+        # Health checks and reconnects happen outside the pool lock.
+        now = time.monotonic()
+        if conn is not None and self._is_stale(conn, now):
+            conn.discard()
+            conn = None
+            with self._cond:
+                self._recycled += 1
+        elif conn is not None and not self._is_healthy(conn, now):
+            conn.discard()
+            conn = None
+            with self._cond:
+                self._health_check_failures += 1
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._open -= 1
+                    self._cond.notify()
+                raise
+
+        conn.checked_out = True
+        conn.leased_at = time.monotonic()
+        conn.lease += 1
+        conn.uses += 1
+        conn.owner_thread = threading.get_ident()
+        return conn
+
+    def release(self, conn: PooledConnection) -> None:
+        """Return a checked-out connection, rolling back any open transaction."""
+        if not conn.checked_out:
+            return
+        conn.checked_out = False
+        conn.last_used = time.monotonic()
+        healthy = True
+        try:
+            if conn.trace is not None:
+                conn.trace.detach(conn)
+            if conn.deadline is not None:
+                conn.deadline.detach(conn)
+            if conn.in_transaction:
+                conn.rollback()
+            conn.row_factory = sqlite3.Row
+        except sqlite3.Error as e:
+            logger.warning(f"Dropping pooled connection that failed to reset: {e}")
+            healthy = False
+
+        with self._cond:
+            self._busy_time += conn.last_used - conn.leased_at
+            if healthy and not self._closed:
+                self._idle.append(conn)
+                conn = None
+            else:
+                self._open -= 1
+            self._cond.notify()
+        if conn is not None:
+            conn.discard()
+
+    def close_all(self) -> None:
+        """Close idle connections and refuse further checkouts."""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+            self._cond.notify_all()
+        for conn in idle:
+            conn.discard()
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of pool occupancy and hit/miss/wait counters."""
+        with self._cond:
+            return {
+                'size': self.size,
+                'open': self._open,
+                'idle': len(self._idle),
+                'inUse': self._open - len(self._idle),
+                'hits': self._hits,
+                'misses': self._misses,
+                'waits': self._waits,
+                'waitTimeMs': round(self._wait_time * 1000, 3),
+                'timeouts': self._timeouts,
+                'recycled': self._recycled,
+                'healthCheckFailures': self._health_check_failures,
+                'busyTimeMs': round(self._busy_time * 1000, 3),
+            }
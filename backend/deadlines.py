@@ -0,0 +1,87 @@
+import sqlite3
+import time
+import logging
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# SQLite virtual machine instructions between deadline checks. A check is
+# one Python call; 1000 instructions take a few microseconds to run.
+PROGRESS_STEPS = 1000
+
+# Budgets that differ from DB_DEADLINE_MS unless overridden by
+# DB_ROUTE_DEADLINES. Keys are "METHOD rule" or a bare rule (any method);
+# 0 means no limit.
+DEFAULT_ROUTE_DEADLINES_MS: Dict[str, float] = {
+    # Analyst-facing list pages: keep them from holding workers gates need.
+    'GET /passengers': 2000,
+    'GET /cards': 2000,
+    'GET /trips': 2000,
+    'GET /transactions': 2000,
+    'GET /search': 2000,
+    # Scans every matching trip; bounded memory, not bounded time.
+    'GET /analytics/od-matrix': 60000,
+    # Bulk jobs are long by design and resumable.
+    '/import/<entity>': 0,
+    '/export/<kind>': 0,
+}
+
+
+class Deadline:
+    """
+    SQL time budget for one request, enforced with a progress handler.
+
+    Once the budget is spent, the running statement (and any later one on
+    the same connection) fails with sqlite3.OperationalError('interrupted')
+    and `expired` is set so the response can be turned into a 503.
+    """
+
+    def __init__(self, budget_ms: float):
+        self.budget_ms = budget_ms
+        self.expires = time.monotonic() + budget_ms / 1000.0
+        self.expired = False
+
+    def __call__(self) -> int:
+        """Progress handler: non-zero interrupts the statement."""
+        if time.monotonic() >= self.expires:
+            self.expired = True
+            return 1
+        return 0
+
+    def attach(self, conn: sqlite3.Connection) -> None:
+        """Apply the deadline to a pooled connection for the rest of its lease."""
+        conn.deadline = self
+        conn.set_progress_handler(self, PROGRESS_STEPS)
+
+    @staticmethod
+    def detach(conn: sqlite3.Connection) -> None:
+        conn.deadline = None
+        conn.set_progress_handler(None, 0)
+
+
+def parse_route_deadlines(spec: str) -> Dict[str, float]:
+    """
+    Parse DB_ROUTE_DEADLINES: comma-separated "route=ms" pairs, where route
+    is a Flask rule optionally prefixed by a method, e.g.
+    "GET /trips=500,/fares/quote=200,/export/<kind>=0".
+    """
+    budgets: Dict[str, float] = {}
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        route, sep, value = item.rpartition('=')
+        if not sep or not route.strip():
+            raise ValueError(f"Bad DB_ROUTE_DEADLINES entry '{item}'; expected route=ms")
+        budgets[' '.join(route.split())] = float(value)
+    return budgets
+
+
+def budget_for(method: str, rule: Optional[str], budgets: Dict[str, float], default_ms: float) -> float:
+    """Budget in ms for a request: "METHOD rule", then the bare rule, then the default."""
+    if rule is None:
+        return default_ms
+    for key in (f'{method} {rule}', rule):
+        if key in budgets:
+            return budgets[key]
+    return default_ms
@@ -0,0 +1,224 @@
+import argparse
+import csv
+import io
+import json
+import os
+import sqlite3
+import sys
+import zlib
+import logging
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from archive import ColdStore, default_archive_dir, merge_chunks
+from streaming import NDJSON_MIMETYPE, iter_row_chunks, iter_ndjson
+
+logger = logging.getLogger(__name__)
+
+# Full-history exports for reconciliation.
+#
+# Rows are read through a server-side cursor (fetchmany) in primary key order
+# and encoded chunk by chunk, so memory use does not depend on the size of
+# the export. Because the order is the primary key, an interrupted download
+# resumes with afterId=<last ID received>; HTTP Range is not supported.
+# Rows archived to the cold tier (archive.py) are merged in by primary key,
+# so an export covers the full history wherever its rows are stored.
+
+EXPORT_CHUNK_ROWS = 5000
+FORMATS = ('csv', 'ndjson')
+
+
+class ExportSpec(NamedTuple):
+    select_sql: str
+    id_column: str
+    date_column: str
+    columns: Tuple[str, ...]
+
+
+EXPORTS: Dict[str, ExportSpec] = {
+    'transactions': ExportSpec(
+        '''
+        SELECT t.TransactionID, t.TransactionType, t.Amount, t.TransactionDate,
+               t.CardID, c.CardNumber
+        FROM [Transaction] t
+        LEFT JOIN Card c ON t.CardID = c.CardID
+        ''',
+        't.TransactionID', 't.TransactionDate',
+        ('TransactionID', 'TransactionType', 'Amount', 'TransactionDate', 'CardID', 'CardNumber'),
+    ),
+    'trips': ExportSpec(
+        '''
+        SELECT t.TripID, t.EntryTime, t.ExitTime, t.FareAmount, t.CardID,
+               t.EntryStationID, t.ExitStationID
+        FROM Trip t
+        ''',
+        't.TripID', 't.EntryTime',
+        ('TripID', 'EntryTime', 'ExitTime', 'FareAmount', 'CardID', 'EntryStationID', 'ExitStationID'),
+    ),
+}
+
+
+def build_export_query(kind: str, date_from: Optional[str] = None, date_to: Optional[str] = None,
+                       card_id: Optional[int] = None, after_id: Optional[int] = None) -> Tuple[str, List[Any]]:
+    """
+    Build the export query for `kind`, ordered by primary key.
+
+    The date bounds are written as +column so SQLite walks the table in
+    rowid order instead of using the date index and sorting the whole range.
+    :param date_from: inclusive lower bound on the date column
+    :param date_to: exclusive upper bound on the date column
+    :param card_id: only this card's rows (uses the CardID index)
+    :param after_id: resume after this primary key
+    :return: (sql, params)
+    """
+    spec = EXPORTS[kind]
+    filters, params = [], []
+    if after_id is not None:
+        filters.append(f'{spec.id_column} > ?')
+        params.append(after_id)
+    if date_from:
+        filters.append(f'+{spec.date_column} >= ?')
+        params.append(date_from)
+    if date_to:
+        filters.append(f'+{spec.date_column} < ?')
+        params.append(date_to)
+    if card_id is not None:
+        filters.append('t.CardID = ?')
+        params.append(card_id)
+    sql = spec.select_sql
+    if filters:
+        sql += ' WHERE ' + ' AND '.join(filters)
+    sql += f' ORDER BY {spec.id_column}'
+    return sql, params
+
+
+def iter_csv(chunks: Iterator[List[sqlite3.Row]], columns: Optional[Tuple[str, ...]]) -> Iterator[bytes]:
+    """Encode row chunks as CSV, with a header row if `columns` is given."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if columns:
+        writer.writerow(columns)
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def iter_gzip(body: Iterator[bytes]) -> Iterator[bytes]:
+    """Gzip a byte stream on the fly (a complete .gz file)."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for data in body:
+        compressed = compressor.compress(data)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def iter_export(acquire: Callable[[], sqlite3.Connection], kind: str, fmt: str = 'csv',
+                compress: bool = False, chunk_rows: int = EXPORT_CHUNK_ROWS, cold: Optional[ColdStore] = None,
+                **filters) -> Iterator[bytes]:
+    """
+    Stream an export as bytes.
+    :param acquire: callable returning a connection; close() hands it back
+    :param kind: 'transactions' or 'trips'
+    :param fmt: 'csv' or 'ndjson'
+    :param compress: gzip the output
+    :param cold: archived rows to merge in (see archive.py)
+    :param filters: date_from, date_to, card_id, after_id (see build_export_query);
+                    a resumed CSV export (after_id set) has no header row, so it
+                    can be appended to the part already received
+    """
+    if kind not in EXPORTS:
+        raise ValueError(f"Unknown export '{kind}'; expected one of {', '.join(EXPORTS)}")
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format '{fmt}'; expected one of {', '.join(FORMATS)}")
+    sql, params = build_export_query(kind, **filters)
+    chunks = iter_row_chunks(acquire, sql, params, chunk_rows)
+    columns = EXPORTS[kind].columns
+    if cold is not None and cold.parts(kind, filters.get('date_from'), filters.get('date_to')):
+        chunks = merge_chunks(chunks, cold.iter_rows(kind, chunk_rows, **filters), chunk_rows)
+        if fmt == 'ndjson':
+            chunks = ([dict(zip(columns, row)) for row in rows] for rows in chunks)
+    header = columns if filters.get('after_id') is None else None
+    body = iter_csv(chunks, header) if fmt == 'csv' else iter_ndjson(chunks)
+    return iter_gzip(body) if compress else body
+
+
+def export_headers(kind: str, fmt: str, compress: bool) -> Tuple[str, Dict[str, str]]:
+    """Mimetype and download headers for an export response."""
+    filename = f'{kind}.{fmt}' + ('.gz' if compress else '')
+    mimetype = 'application/gzip' if compress else ('text/csv' if fmt == 'csv' else NDJSON_MIMETYPE)
+    return mimetype, {'Content-Disposition': f'attachment; filename="{filename}"',
+                      'Accept-Ranges': 'none'}
+
+
+def last_exported_id(path: str, kind: str, fmt: str) -> Optional[int]:
+    """
+    Find the last complete row of an uncompressed export file and drop any
+    partial line after it, so the file can be resumed in place.
+    :return: primary key of the last complete row, or None if there is none
+    """
+    id_key = EXPORTS[kind].columns[0]
+    with open(path, 'rb+') as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        f.seek(max(0, size - 65536))
+        tail = f.read()
+        end = tail.rfind(b'\n')
+        if end < 0:
+            return None
+        f.truncate(size - len(tail) + end + 1)
+        line = tail[:end].rsplit(b'\n', 1)[-1].decode('utf-8')
+    if fmt == 'ndjson':
+        return json.loads(line)[id_key]
+    value = next(csv.reader([line]))[0]
+    return None if value == id_key else int(value)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Export trip or transaction history to a file')
+    parser.add_argument('kind', choices=list(EXPORTS))
+    parser.add_argument('-o', '--output', required=True, help="output file ('-' for stdout)")
+    parser.add_argument('--format', choices=FORMATS, default='csv')
+    parser.add_argument('--gzip', action='store_true', help='gzip the output')
+    parser.add_argument('--from', dest='date_from', help='inclusive start date, e.g. 2025-01-01')
+    parser.add_argument('--to', dest='date_to', help='exclusive end date')
+    parser.add_argument('--card-id', type=int)
+    parser.add_argument('--after-id', type=int, help='start after this TransactionID/TripID')
+    parser.add_argument('--resume', action='store_true',
+                        help='continue an interrupted uncompressed export in the output file')
+    parser.add_argument('--db', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'project.db'),
+                        help='path to the SQLite database')
+    parser.add_argument('--archive-dir', help='cold tier directory (default: ARCHIVE_DIR or archive/ next to the db)')
+    args = parser.parse_args()
+
+    def acquire() -> sqlite3.Connection:
+        conn = sqlite3.connect(args.db)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    mode = 'wb'
+    if args.resume:
+        if args.gzip or args.output == '-':
+            parser.error('--resume needs an uncompressed output file')
+        if os.path.exists(args.output):
+            args.after_id = last_exported_id(args.output, args.kind, args.format)
+            mode = 'ab' if args.after_id is not None else 'wb'
+            logger.info(f"Resuming after ID {args.after_id}")
+    out = sys.stdout.buffer if args.output == '-' else open(args.output, mode)
+    written = 0
+    try:
+        for data in iter_export(acquire, args.kind, args.format, args.gzip,
+                                date_from=args.date_from, date_to=args.date_to,
+                                cold=ColdStore(args.archive_dir or os.getenv('ARCHIVE_DIR')
+                                               or default_archive_dir(args.db)),
+                                card_id=args.card_id, after_id=args.after_id):
+            out.write(data)
+            written += len(data)
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+    logger.info(f"Wrote {written} bytes to {args.output}")
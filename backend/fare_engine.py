@@ -0,0 +1,208 @@
+import sqlite3
+import threading
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+import numpy as np
+
+from ref_cache import read_versions
+
+logger = logging.getLogger(__name__)
+
+# Weekday hours (inclusive start, exclusive end) priced with 'Peak' rules.
+PEAK_HOURS = ((7, 10), (17, 20))
+
+# For each period, the FareRule.FareType values tried in order. A station
+# pair without a rule of the period's own type falls back to 'Anytime', then
+# to the other period's fare. A NULL FareType counts as 'Anytime'.
+FARE_TYPE_FALLBACKS = {
+    'Peak': ('Peak', 'Anytime', 'Off-Peak'),
+    'Off-Peak': ('Off-Peak', 'Anytime', 'Peak'),
+}
+PERIODS = ('Peak', 'Off-Peak')
+
+TimeLike = Union[str, datetime, None]
+
+
+def parse_times(at: Union[TimeLike, Sequence[TimeLike]], count: int) -> np.ndarray:
+    """
+    Parse one timestamp or a sequence of them into datetime64[m].
+    None means now. Strings use the database format ('YYYY-MM-DD HH:MM:SS') or ISO 8601.
+    """
+    if at is None or isinstance(at, (str, datetime)):
+        at = [at] * count
+    values = [datetime.now() if t is None else t for t in at]
+    try:
+        return np.array(values, dtype='datetime64[m]')
+    except ValueError:
+        raise ValueError("Invalid timestamp; expected 'YYYY-MM-DD HH:MM:SS'")
+
+
+def peak_mask(times: np.ndarray) -> np.ndarray:
+    """True where a timestamp falls in weekday peak hours."""
+    days = times.astype('datetime64[D]')
+    hours = (times.astype('datetime64[h]') - days).astype(np.int64)
+    weekday = (days.astype(np.int64) + 3) % 7          # 1970-01-01 was a Thursday
+    mask = np.zeros(times.shape, dtype=bool)
+    for start, end in PEAK_HOURS:
+        mask |= (hours >= start) & (hours < end)
+    return mask & (weekday < 5)
+
+
+class FareEngine:
+    """
+    In-memory fare matrix for O(1) journey pricing.
+
+    Fare rules are held in a dense float array indexed as
+    [fare type, StartStationID, EndStationID] (NaN = no rule) and card type
+    multipliers in an array indexed by CardTypeID. Every quote is a handful
+    of array lookups, and quote_many() prices whole batches with vectorized
+    indexing.
+
+    The arrays are rebuilt lazily: refresh() reads the data versions of
+    FareRule, Station and CardType from RefVersion (see ref_cache.py), which
+    triggers bump on every change by any process, compares them with those
+    seen at the last load and reloads only the part whose table changed.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._fare_versions: Optional[tuple] = None
+        self._multiplier_version: Optional[int] = None
+        self.fare_types: List[str] = []
+        self.fares = np.full((0, 1, 1), np.nan)
+        self.multipliers = np.full(1, np.nan)
+        self._chains: Dict[str, List[int]] = {}
+
+    # ---------- loading ----------
+
+    def refresh(self, conn: sqlite3.Connection) -> None:
+        """
+        Reload whatever changed since the last load.
+        :param conn: connection to read the versions and any reload on
+        """
+        versions = read_versions(conn)
+        fare_versions = (versions.get('FareRule'), versions.get('Station'))
+        multiplier_version = versions.get('CardType')
+        if fare_versions == self._fare_versions and multiplier_version == self._multiplier_version:
+            return
+        with self._lock:
+            if fare_versions != self._fare_versions:
+                self._load_fares(conn)
+                self._fare_versions = fare_versions
+            if multiplier_version != self._multiplier_version:
+                self._load_multipliers(conn)
+                self._multiplier_version = multiplier_version
+
+    def _load_fares(self, conn: sqlite3.Connection) -> None:
+        max_station = conn.execute('SELECT COALESCE(MAX(StationID), 0) FROM Station').fetchone()[0]
+        rules = conn.execute(
+            'SELECT StartStationID, EndStationID, FareType, FareAmount FROM FareRule').fetchall()
+        fare_types = sorted({rule[2] or 'Anytime' for rule in rules})
+        type_index = {name: i for i, name in enumerate(fare_types)}
+
+        size = max_station + 1
+        fares = np.full((len(fare_types), size, size), np.nan)
+        for start, end, fare_type, amount in rules:
+            if start is not None and end is not None and 0 <= start < size and 0 <= end < size:
+                fares[type_index[fare_type or 'Anytime'], start, end] = amount
+
+        chains = {period: [type_index[t] for t in FARE_TYPE_FALLBACKS[period] if t in type_index]
+                  for period in PERIODS}
+        # Swap in the new arrays in one step so concurrent quotes see a consistent set.
+        self.fare_types, self.fares, self._chains = fare_types, fares, chains
+        logger.info(f"Fare matrix loaded: {len(rules)} rules, {size - 1} stations, "
+                    f"fare types {fare_types}")
+
+    def _load_multipliers(self, conn: sqlite3.Connection) -> None:
+        rows = conn.execute('SELECT CardTypeID, BaseFareMultiplier FROM CardType').fetchall()
+        size = max((row[0] for row in rows), default=0) + 1
+        multipliers = np.full(size, np.nan)
+        for card_type_id, multiplier in rows:
+            multipliers[card_type_id] = multiplier
+        self.multipliers = multipliers
+
+    # ---------- pricing ----------
+
+    def has_card_type(self, card_type_id: int) -> bool:
+        """True if the card type exists (as of the last load)."""
+        multipliers = self.multipliers
+        return 0 <= card_type_id < multipliers.shape[0] and not np.isnan(multipliers[card_type_id])
+
+    def quote_many(self, from_ids: Sequence[int], to_ids: Sequence[int],
+                   card_type_ids: Optional[Sequence[Optional[int]]] = None,
+                   at: Union[TimeLike, Sequence[TimeLike]] = None) -> Dict[str, Any]:
+        """
+        Price many journeys in one vectorized pass.
+        :param from_ids: entry StationIDs
+        :param to_ids: exit StationIDs
+        :param card_type_ids: CardTypeIDs (None entries or None = no discount)
+        :param at: travel time(s); decides peak vs off-peak
+        :return: dict of numpy arrays: fare, baseFare, multiplier (NaN where
+                 no price exists) and fareType (None where no rule matched)
+        """
+        fares, multipliers, chains, fare_types = self.fares, self.multipliers, self._chains, self.fare_types
+        origin = np.asarray(from_ids, dtype=np.int64)
+        destination = np.asarray(to_ids, dtype=np.int64)
+        if origin.shape != destination.shape or origin.ndim != 1:
+            raise ValueError("from and to must be equal-length lists")
+        count = origin.shape[0]
+        peak = peak_mask(parse_times(at, count))
+
+        size = fares.shape[1]
+        known = (origin >= 0) & (origin < size) & (destination >= 0) & (destination < size)
+        o = np.where(known, origin, 0)
+        d = np.where(known, destination, 0)
+
+        base = np.full(count, np.nan)
+        chosen = np.full(count, -1, dtype=np.int64)
+        for period, in_period in (('Peak', peak), ('Off-Peak', ~peak)):
+            # Same direction first, then the reverse journey, for each fare type in turn.
+            for fare_type in chains[period]:
+                for a, b in ((o, d), (d, o)):
+                    candidate = fares[fare_type, a, b]
+                    fill = in_period & known & np.isnan(base) & ~np.isnan(candidate)
+                    base[fill] = candidate[fill]
+                    chosen[fill] = fare_type
+
+        if card_type_ids is None:
+            multiplier = np.ones(count)
+        else:
+            ids = np.array([-1 if c is None else c for c in card_type_ids], dtype=np.int64)
+            if ids.shape != origin.shape:
+                raise ValueError("cardTypeId must be a single value or match the length of from/to")
+            valid = (ids >= 0) & (ids < multipliers.shape[0])
+            multiplier = np.where(valid, multipliers[np.where(valid, ids, 0)], np.nan)
+            multiplier[ids == -1] = 1.0
+
+        return {
+            'fare': np.round(base * multiplier, 2),
+            'baseFare': base,
+            'multiplier': multiplier,
+            'fareType': [fare_types[i] if i >= 0 else None for i in chosen],
+        }
+
+    def quote(self, from_id: int, to_id: int, card_type_id: Optional[int] = None,
+              at: TimeLike = None) -> Optional[Dict[str, Any]]:
+        """
+        Price a single journey.
+        :return: dict with fare, baseFare, multiplier and fareType, or None if
+                 there is no rule for the pair or the card type is unknown
+        """
+        result = self.quote_many([from_id], [to_id],
+                                 None if card_type_id is None else [card_type_id], at)
+        fare = result['fare'][0]
+        if np.isnan(fare):
+            return None
+        return {
+            'fare': float(fare),
+            'baseFare': float(result['baseFare'][0]),
+            'multiplier': float(result['multiplier'][0]),
+            'fareType': result['fareType'][0],
+        }
+
+
+def to_json_list(values: np.ndarray) -> List[Optional[float]]:
+    """Convert a float array to a JSON-ready list with NaN as None."""
+    return [None if v != v else v for v in values.tolist()]
@@ -0,0 +1,71 @@
+import sqlite3
+import logging
+from typing import List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Secondary indexes backing the queries in app.py. Every index named with the
+# idx_ prefix is managed here: ensure_indexes() creates the missing ones and
+# drops idx_ indexes that are no longer listed. It runs as a schema migration,
+# so after editing this list append a migration step that calls it again.
+#
+# An index on (X) also stores the rowid, so ORDER BY X, <primary key> is
+# served straight from the index without a sort.
+INDEXES: List[Tuple[str, str]] = [
+    # /trips: newest first, keyset on (EntryTime, TripID)
+    ('idx_trip_entry_time', 'CREATE INDEX IF NOT EXISTS idx_trip_entry_time ON Trip (EntryTime)'),
+    # /trips?cardId=, Trip JOIN Card on CardID
+    ('idx_trip_card', 'CREATE INDEX IF NOT EXISTS idx_trip_card ON Trip (CardID, EntryTime)'),
+    # /trips?stationId= (entry OR exit station)
+    ('idx_trip_entry_station',
+     'CREATE INDEX IF NOT EXISTS idx_trip_entry_station ON Trip (EntryStationID, EntryTime)'),
+    ('idx_trip_exit_station',
+     'CREATE INDEX IF NOT EXISTS idx_trip_exit_station ON Trip (ExitStationID, EntryTime)'),
+    # Trips still in progress: /trips?status=open, active-trip counts and
+    # per-card open-trip lookups. Partial, so it stays small.
+    ('idx_trip_open',
+     'CREATE INDEX IF NOT EXISTS idx_trip_open ON Trip (CardID, EntryTime) WHERE ExitTime IS NULL'),
+    ('idx_trip_open_entry_time',
+     'CREATE INDEX IF NOT EXISTS idx_trip_open_entry_time ON Trip (EntryTime) WHERE ExitTime IS NULL'),
+
+    # /transactions and the dashboard's recent transactions: newest first
+    ('idx_transaction_date',
+     'CREATE INDEX IF NOT EXISTS idx_transaction_date ON [Transaction] (TransactionDate)'),
+    # /transactions?cardId=, [Transaction] JOIN Card on CardID
+    ('idx_transaction_card',
+     'CREATE INDEX IF NOT EXISTS idx_transaction_card ON [Transaction] (CardID, TransactionDate)'),
+
+    # /cards?passengerId=, Card JOIN Passenger, ?passengerId= on trips/transactions
+    ('idx_card_passenger', 'CREATE INDEX IF NOT EXISTS idx_card_passenger ON Card (PassengerID)'),
+    # /cards?status=, Card WHERE Status = ?
+    ('idx_card_status', 'CREATE INDEX IF NOT EXISTS idx_card_status ON Card (Status)'),
+    # /cards?cardTypeId=
+    ('idx_card_type', 'CREATE INDEX IF NOT EXISTS idx_card_type ON Card (CardTypeID)'),
+
+    # /passengers?from=&to=
+    ('idx_passenger_registration',
+     'CREATE INDEX IF NOT EXISTS idx_passenger_registration ON Passenger (RegistrationDate)'),
+
+    # FareRule lookups by destination (the UNIQUE constraint covers StartStationID)
+    ('idx_farerule_end_station', 'CREATE INDEX IF NOT EXISTS idx_farerule_end_station ON FareRule (EndStationID)'),
+]
+
+
+def ensure_indexes(conn: sqlite3.Connection) -> None:
+    """
+    Create missing managed indexes and drop retired ones.
+    Runs inside the caller's transaction; the caller commits.
+    :param conn: Connection object
+    :return: None
+    """
+    wanted = {name for name, _ in INDEXES}
+    existing = {row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx\\_%' ESCAPE '\\'")}
+
+    for name in sorted(existing - wanted):
+        conn.execute(f'DROP INDEX IF EXISTS {name}')
+        logger.info(f"Dropped retired index {name}")
+    for name, ddl in INDEXES:
+        if name not in existing:
+            conn.execute(ddl)
+            logger.info(f"Created index {name}")
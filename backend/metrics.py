@@ -0,0 +1,198 @@
+import bisect
+import os
+import threading
+import logging
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+PROMETHEUS_MIMETYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+Labels = Tuple[Tuple[str, str], ...]
+# (name, type, help, [(labels, value)]) produced by a collector at scrape time
+Family = Tuple[str, str, str, List[Tuple[Labels, float]]]
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROW_BUCKETS = (0, 1, 10, 50, 100, 250, 500, 1000)
+
+
+class _Shard:
+    """One thread's counters and histograms; only that thread writes to it."""
+
+    __slots__ = ('thread', 'counters', 'histograms')
+
+    def __init__(self, thread: Optional[threading.Thread]):
+        self.thread = thread
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        # (name, labels) -> [bucket counts..., +Inf count, sum]
+        self.histograms: Dict[Tuple[str, Labels], List[float]] = {}
+
+    def merge(self, other: '_Shard') -> None:
+        for key, value in list(other.counters.items()):
+            self.counters[key] = self.counters.get(key, 0) + value
+        for key, values in list(other.histograms.items()):
+            mine = self.histograms.get(key)
+            if mine is None:
+                self.histograms[key] = list(values)
+            else:
+                for i, value in enumerate(values):
+                    mine[i] += value
+
+
+class MetricsRegistry:
+    """
+    Counters and histograms in Prometheus text format.
+
+    Every thread records into its own shard, so the request path takes no
+    lock (except once, when a thread records its first value). A scrape adds
+    the shards up; shards of threads that have exited are folded into one
+    so thread-per-request servers do not grow the list. Gauges that are
+    cheap to read at scrape time (pool occupancy, WAL size, memory) come
+    from collector callbacks instead.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards: List[_Shard] = []
+        self._retired = _Shard(None)
+        self._lock = threading.Lock()
+        self._meta: Dict[str, Tuple[str, str]] = {}
+        self._buckets: Dict[str, Sequence[float]] = {}
+        self._collectors: List[Callable[[], Iterable[Family]]] = []
+        self._unlabeled = set()
+
+    # ---------- declaration ----------
+
+    def counter(self, name: str, help_text: str, labeled: bool = True) -> None:
+        """Declare a counter; an unlabeled one is exported as 0 until first incremented."""
+        self._meta[name] = ('counter', help_text)
+        if not labeled:
+            self._unlabeled.add(name)
+
+    def histogram(self, name: str, help_text: str, buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+        self._meta[name] = ('histogram', help_text)
+        self._buckets[name] = tuple(buckets)
+
+    def add_collector(self, collector: Callable[[], Iterable[Family]]) -> None:
+        """Register a callable returning metric families to add to each scrape."""
+        self._collectors.append(collector)
+
+    # ---------- recording ----------
+
+    def _shard(self) -> _Shard:
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = _Shard(threading.current_thread())
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def inc(self, name: str, labels: Labels = (), amount: float = 1) -> None:
+        counters = self._shard().counters
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + amount
+
+    def observe(self, name: str, labels: Labels, value: float) -> None:
+        histograms = self._shard().histograms
+        key = (name, labels)
+        values = histograms.get(key)
+        buckets = self._buckets[name]
+        if values is None:
+            values = histograms[key] = [0] * (len(buckets) + 2)
+        values[bisect.bisect_left(buckets, value)] += 1
+        values[-1] += value
+
+    # ---------- exposition ----------
+
+    def _snapshot(self) -> _Shard:
+        with self._lock:
+            live = []
+            for shard in self._shards:
+                if shard.thread.is_alive():
+                    live.append(shard)
+                else:
+                    self._retired.merge(shard)
+            self._shards = live
+            total = _Shard(None)
+            total.merge(self._retired)
+        for shard in live:
+            total.merge(shard)
+        return total
+
+    def render(self) -> str:
+        """All metrics in Prometheus text exposition format."""
+        total = self._snapshot()
+        samples: Dict[str, List[str]] = {name: [] for name in self._meta}
+        for (name, labels), value in sorted(total.counters.items()):
+            samples[name].append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        for (name, labels), values in sorted(total.histograms.items()):
+            lines = samples[name]
+            cumulative = 0
+            for bound, count in zip(self._buckets[name], values):
+                cumulative += count
+                lines.append(f'{name}_bucket{_format_labels(labels + (("le", _format_value(bound)),))} {cumulative}')
+            cumulative += values[-2]
+            lines.append(f'{name}_bucket{_format_labels(labels + (("le", "+Inf"),))} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(values[-1])}')
+            lines.append(f'{name}_count{_format_labels(labels)} {cumulative}')
+
+        out = []
+        for name, (kind, help_text) in self._meta.items():
+            out.append(f'# HELP {name} {help_text}')
+            out.append(f'# TYPE {name} {kind}')
+            out.extend(samples[name] or ([f'{name} 0'] if name in self._unlabeled else []))
+        for collector in self._collectors:
+            try:
+                families = list(collector())
+            except Exception as e:
+                logger.warning(f"Metrics collector {getattr(collector, '__name__', collector)} failed: {e}")
+                continue
+            for name, kind, help_text, values in families:
+                out.append(f'# HELP {name} {help_text}')
+                out.append(f'# TYPE {name} {kind}')
+                out.extend(f'{name}{_format_labels(labels)} {_format_value(value)}' for labels, value in values)
+        return '\n'.join(out) + '\n'
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(str(value))}"' for key, value in labels) + '}'
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def process_memory_family() -> Iterable[Family]:
+    """Resident and peak memory of this process."""
+    rss = None
+    try:
+        with open('/proc/self/statm') as f:
+            rss = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak *= 1 if os.uname().sysname == 'Darwin' else 1024
+    except (ImportError, AttributeError):
+        peak = None
+    if rss is not None:
+        yield ('process_resident_memory_bytes', 'gauge', 'Resident memory size in bytes.', [((), rss)])
+    if peak is not None:
+        yield ('process_max_resident_memory_bytes', 'gauge', 'Peak resident memory size in bytes.', [((), peak)])
+
+
+def file_size(path: str) -> int:
+    """Size of a file, 0 if it does not exist (e.g. no WAL yet)."""
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
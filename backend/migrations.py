@@ -0,0 +1,328 @@
+import argparse
+import os
+import sqlite3
+import logging
+from typing import Callable, List, NamedTuple, Optional
+
+from dashboard_counters import COUNTERS_DDL, REBUILD_SQL
+from indexes import ensure_indexes
+from bulk_import import IMPORT_JOB_DDL
+from search import SEARCH_DDL, rebuild_search
+from rollups import ROLLUPS_DDL, backfill as backfill_rollups
+from ref_cache import REF_VERSION_DDL
+
+logger = logging.getLogger(__name__)
+
+# Single source of truth for the database schema.
+#
+# The schema version lives in PRAGMA user_version. migrate() applies every
+# step newer than that version inside one transaction and bumps the version,
+# so an up-to-date database costs a single pragma read at startup.
+#
+# To change the schema, append a Migration with the next version number;
+# never edit a step that has shipped. SQLite can add tables, indexes,
+# triggers and columns in place, so steps should stick to those (see
+# add_column) rather than rebuilding tables.
+
+BASE_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS CardType (
+        CardTypeID INTEGER PRIMARY KEY AUTOINCREMENT,
+        TypeName TEXT NOT NULL UNIQUE,
+        BaseFareMultiplier REAL NOT NULL DEFAULT 1.0,
+        Description TEXT
+    );
+
+    CREATE TABLE IF NOT EXISTS Passenger (
+        PassengerID INTEGER PRIMARY KEY AUTOINCREMENT,
+        FirstName TEXT NOT NULL,
+        LastName TEXT NOT NULL,
+        Email TEXT UNIQUE NOT NULL,
+        PhoneNumber TEXT UNIQUE,
+        RegistrationDate TEXT NOT NULL
+    );
+
+    CREATE TABLE IF NOT EXISTS Station (
+        StationID INTEGER PRIMARY KEY AUTOINCREMENT,
+        StationName TEXT NOT NULL UNIQUE,
+        LineColor TEXT
+    );
+
+    CREATE TABLE IF NOT EXISTS Card (
+        CardID INTEGER PRIMARY KEY AUTOINCREMENT,
+        CardNumber TEXT UNIQUE NOT NULL,
+        Balance REAL NOT NULL DEFAULT 0.0,
+        IssueDate TEXT NOT NULL,
+        Status TEXT NOT NULL CHECK(Status IN ('Active', 'Inactive', 'Blocked')),
+        PassengerID INTEGER,
+        CardTypeID INTEGER,
+        FOREIGN KEY (PassengerID) REFERENCES Passenger(PassengerID),
+        FOREIGN KEY (CardTypeID) REFERENCES CardType(CardTypeID)
+    );
+
+    CREATE TABLE IF NOT EXISTS [Transaction] (
+        TransactionID INTEGER PRIMARY KEY AUTOINCREMENT,
+        TransactionType TEXT NOT NULL,
+        Amount REAL NOT NULL,
+        TransactionDate TEXT NOT NULL,
+        CardID INTEGER,
+        FOREIGN KEY (CardID) REFERENCES Card(CardID)
+    );
+
+    CREATE TABLE IF NOT EXISTS FareRule (
+        FareRuleID INTEGER PRIMARY KEY AUTOINCREMENT,
+        StartStationID INTEGER NOT NULL,
+        EndStationID INTEGER NOT NULL,
+        FareType TEXT,
+        FareAmount REAL NOT NULL,
+        FOREIGN KEY (StartStationID) REFERENCES Station(StationID),
+        FOREIGN KEY (EndStationID) REFERENCES Station(StationID),
+        UNIQUE (StartStationID, EndStationID, FareType)
+    );
+
+    CREATE TABLE IF NOT EXISTS Trip (
+        TripID INTEGER PRIMARY KEY AUTOINCREMENT,
+        EntryTime TEXT NOT NULL,
+        ExitTime TEXT,
+        FareAmount REAL,
+        CardID INTEGER NOT NULL,
+        EntryStationID INTEGER NOT NULL,
+        ExitStationID INTEGER,
+        FOREIGN KEY (CardID) REFERENCES Card(CardID),
+        FOREIGN KEY (EntryStationID) REFERENCES Station(StationID),
+        FOREIGN KEY (ExitStationID) REFERENCES Station(StationID)
+    );
+'''
+
+DEFAULT_CARD_TYPES = [
+    ('Regular', 1.0, 'Standard fare card'),
+    ('Student', 0.5, 'Discounted fare for students'),
+    ('Senior', 0.7, 'Discounted fare for senior citizens'),
+    ('Monthly', 0.9, 'Monthly subscription card'),
+]
+
+DEFAULT_STATIONS = [
+    ('Central Station', 'Blue'),
+    ('Downtown', 'Blue'),
+    ('University', 'Red'),
+    ('City Park', 'Green'),
+    ('Terminal', 'Red'),
+]
+
+# Migration 7: the history delete triggers of DashboardCounters and the
+# rollups, recreated to do nothing while ArchiveGuard holds a row (see
+# archive.py). Written out in full so the step stays fixed if
+# COUNTERS_DDL or ROLLUPS_DDL change later.
+ARCHIVE_GUARDED_TRIGGERS = ('trg_counters_trip_delete', 'trg_counters_transaction_delete',
+                            'trg_rollup_trip_delete', 'trg_rollup_transaction_delete')
+
+ARCHIVE_GUARD_DDL = '''
+    CREATE TABLE IF NOT EXISTS ArchiveGuard (Active INTEGER NOT NULL);
+
+    CREATE TRIGGER IF NOT EXISTS trg_counters_trip_delete AFTER DELETE ON Trip
+    WHEN NOT EXISTS (SELECT 1 FROM ArchiveGuard)
+    BEGIN
+        UPDATE DashboardCounters SET
+            TotalTrips = TotalTrips - 1,
+            ActiveTrips = ActiveTrips - (OLD.ExitTime IS NULL)
+        WHERE ID = 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_counters_transaction_delete AFTER DELETE ON [Transaction]
+    WHEN NOT EXISTS (SELECT 1 FROM ArchiveGuard)
+    BEGIN
+        UPDATE DashboardCounters SET
+            TotalTransactions = TotalTransactions - 1,
+            TotalRevenue = TotalRevenue - OLD.Amount
+        WHERE ID = 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_rollup_trip_delete AFTER DELETE ON Trip
+    WHEN NOT EXISTS (SELECT 1 FROM ArchiveGuard)
+    BEGIN
+        INSERT INTO StationHourlyStats (Hour, StationID, Entries, Exits, FareRevenue)
+        SELECT substr(OLD.EntryTime, 1, 13), OLD.EntryStationID, -1, 0, 0 WHERE 1
+        ON CONFLICT (Hour, StationID) DO UPDATE SET
+            Entries = Entries + excluded.Entries,
+            Exits = Exits + excluded.Exits,
+            FareRevenue = FareRevenue + excluded.FareRevenue;
+        INSERT INTO CardTypeDailyStats (Day, CardTypeID, Trips, Spend, TopUps, TopUpAmount)
+        SELECT substr(OLD.EntryTime, 1, 10), COALESCE((SELECT CardTypeID FROM Card WHERE CardID = OLD.CardID), 0),
+               -1, 0, 0, 0 WHERE 1
+        ON CONFLICT (Day, CardTypeID) DO UPDATE SET
+            Trips = Trips + excluded.Trips,
+            Spend = Spend + excluded.Spend,
+            TopUps = TopUps + excluded.TopUps,
+            TopUpAmount = TopUpAmount + excluded.TopUpAmount;
+        INSERT INTO StationHourlyStats (Hour, StationID, Entries, Exits, FareRevenue)
+        SELECT substr(OLD.ExitTime, 1, 13), OLD.ExitStationID, 0, -1, -1 * COALESCE(OLD.FareAmount, 0) WHERE OLD.ExitTime IS NOT NULL AND OLD.ExitStationID IS NOT NULL
+        ON CONFLICT (Hour, StationID) DO UPDATE SET
+            Entries = Entries + excluded.Entries,
+            Exits = Exits + excluded.Exits,
+            FareRevenue = FareRevenue + excluded.FareRevenue;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_rollup_transaction_delete AFTER DELETE ON [Transaction]
+    WHEN NOT EXISTS (SELECT 1 FROM ArchiveGuard)
+    BEGIN
+        INSERT INTO CardTypeDailyStats (Day, CardTypeID, Trips, Spend, TopUps, TopUpAmount)
+        SELECT substr(OLD.TransactionDate, 1, 10), COALESCE((SELECT CardTypeID FROM Card WHERE CardID = OLD.CardID), 0),
+               0, -1 * (OLD.TransactionType = 'Fare') * OLD.Amount, -1 * (OLD.TransactionType IN ('Top-up', 'Recharge')), -1 * (OLD.TransactionType IN ('Top-up', 'Recharge')) * OLD.Amount WHERE OLD.TransactionType = 'Fare' OR OLD.TransactionType IN ('Top-up', 'Recharge')
+        ON CONFLICT (Day, CardTypeID) DO UPDATE SET
+            Trips = Trips + excluded.Trips,
+            Spend = Spend + excluded.Spend,
+            TopUps = TopUps + excluded.TopUps,
+            TopUpAmount = TopUpAmount + excluded.TopUpAmount;
+    END;
+'''
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    apply: Callable[[sqlite3.Connection], None]
+
+
+def execute_script(conn: sqlite3.Connection, script: str) -> None:
+    """
+    Run a multi-statement SQL script inside the current transaction.
+    Unlike executescript(), this does not COMMIT before running.
+    """
+    statement = ''
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            conn.execute(statement)
+            statement = ''
+    if statement.strip():
+        raise sqlite3.ProgrammingError(f"Incomplete SQL statement: {statement.strip()[:80]}")
+
+
+def add_column(conn: sqlite3.Connection, table: str, column_def: str) -> None:
+    """Add a column in place (ALTER TABLE ... ADD COLUMN) unless it already exists."""
+    column = column_def.split()[0]
+    existing = {row[1] for row in conn.execute(f'PRAGMA table_info([{table}])')}
+    if column not in existing:
+        conn.execute(f'ALTER TABLE [{table}] ADD COLUMN {column_def}')
+
+
+def _base_schema(conn: sqlite3.Connection) -> None:
+    execute_script(conn, BASE_SCHEMA)
+    if conn.execute('SELECT COUNT(*) FROM CardType').fetchone()[0] == 0:
+        conn.executemany(
+            'INSERT INTO CardType (TypeName, BaseFareMultiplier, Description) VALUES (?, ?, ?)',
+            DEFAULT_CARD_TYPES)
+    if conn.execute('SELECT COUNT(*) FROM Station').fetchone()[0] == 0:
+        conn.executemany('INSERT INTO Station (StationName, LineColor) VALUES (?, ?)',
+                         DEFAULT_STATIONS)
+
+
+def _dashboard_counters(conn: sqlite3.Connection) -> None:
+    execute_script(conn, COUNTERS_DDL)
+    conn.execute(REBUILD_SQL)
+
+
+def _search_indexes(conn: sqlite3.Connection) -> None:
+    execute_script(conn, SEARCH_DDL)
+    rebuild_search(conn)
+
+
+def _rollups(conn: sqlite3.Connection) -> None:
+    execute_script(conn, ROLLUPS_DDL)
+    backfill_rollups(conn)
+
+
+def _archive_guard(conn: sqlite3.Connection) -> None:
+    # Replace the history delete triggers with their ArchiveGuard versions
+    for trigger in ARCHIVE_GUARDED_TRIGGERS:
+        conn.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+    execute_script(conn, ARCHIVE_GUARD_DDL)
+
+
+def _unique_phone_numbers(conn: sqlite3.Connection) -> None:
+    # Databases built by step 1 before it carried UNIQUE on PhoneNumber get a
+    # unique index instead; blank numbers become NULL so they do not collide.
+    for index in conn.execute('PRAGMA index_list(Passenger)').fetchall():
+        columns = [row[2] for row in conn.execute(f'PRAGMA index_info([{index[1]}])')]
+        if index[2] and columns == ['PhoneNumber']:
+            return
+    conn.execute("UPDATE Passenger SET PhoneNumber = NULL WHERE PhoneNumber = ''")
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS uq_passenger_phone ON Passenger (PhoneNumber)')
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, 'Base schema and default card types/stations', _base_schema),
+    Migration(2, 'DashboardCounters summary table and triggers', _dashboard_counters),
+    Migration(3, 'Managed secondary indexes', ensure_indexes),
+    Migration(4, 'ImportJob table for resumable bulk imports', lambda conn: execute_script(conn, IMPORT_JOB_DDL)),
+    Migration(5, 'FTS5 search indexes over passengers, cards and stations', _search_indexes),
+    Migration(6, 'Station-hour and card-type-day ridership and revenue rollups', _rollups),
+    Migration(7, 'ArchiveGuard for cold-tier archival of trips and transactions', _archive_guard),
+    Migration(8, 'UNIQUE PhoneNumber on Passenger', _unique_phone_numbers),
+    Migration(9, 'RefVersion data versions for stations, card types and fare rules',
+              lambda conn: execute_script(conn, REF_VERSION_DDL)),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    """Return the schema version recorded in PRAGMA user_version."""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection, target: Optional[int] = None) -> int:
+    """
+    Bring the database schema up to `target` (default: latest).
+
+    All pending steps run in one BEGIN IMMEDIATE transaction, so a failure
+    leaves the database at its previous version and concurrent starters
+    cannot apply the same step twice.
+    :param conn: Connection object
+    :param target: version to migrate to
+    :return: the schema version after migrating
+    """
+    target = LATEST_VERSION if target is None else target
+    if schema_version(conn) >= target:
+        return schema_version(conn)
+
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        # Re-read under the write lock in case another process just migrated.
+        current = schema_version(conn)
+        for migration in MIGRATIONS:
+            if current < migration.version <= target:
+                logger.info(f"Applying migration {migration.version}: {migration.description}")
+                migration.apply(conn)
+                conn.execute(f'PRAGMA user_version = {migration.version}')
+                current = migration.version
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        logger.error("Migration failed; schema left at its previous version")
+        raise
+    logger.info(f"Database schema at version {current}")
+    return current
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Apply or inspect schema migrations')
+    parser.add_argument('command', choices=['status', 'upgrade'])
+    parser.add_argument('--to', type=int, help='target version (default: latest)')
+    parser.add_argument('--db', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'project.db'),
+                        help='path to the SQLite database')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    try:
+        if args.command == 'upgrade':
+            migrate(conn, args.to)
+        version = schema_version(conn)
+        print(f"Schema version: {version} (latest: {LATEST_VERSION})")
+        for migration in MIGRATIONS:
+            state = 'applied' if migration.version <= version else 'pending'
+            print(f"  {migration.version:>3}  {state:<8} {migration.description}")
+    finally:
+        conn.close()
@@ -0,0 +1,285 @@
+import argparse
+import csv
+import os
+import sqlite3
+import sys
+import time
+import logging
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from archive import NULL_ID, ColdStore, default_archive_dir, hours_of
+
+logger = logging.getLogger(__name__)
+
+# Trips fetched per round trip to SQLite; with the int64 key array and the
+# bincount this keeps the working set at a few MB however many trips match.
+CHUNK_ROWS = 65536
+FORMATS = ('dense', 'sparse')
+
+
+class ODQueryError(ValueError):
+    """Raised for unusable origin-destination parameters."""
+
+
+def parse_hours(value: Optional[str]) -> Optional[Tuple[int, int]]:
+    """
+    Parse a time-of-day slice "start-end" (hours, end exclusive); a slice
+    that wraps midnight such as "22-2" is allowed.
+    """
+    if not value:
+        return None
+    try:
+        start, end = (int(part) for part in value.split('-'))
+    except ValueError:
+        raise ODQueryError("hours must look like 7-10")
+    if not (0 <= start <= 23 and 1 <= end <= 24) or start == end:
+        raise ODQueryError("hours must be start-end with 0 <= start <= 23, 1 <= end <= 24")
+    return start, end
+
+
+class ODMatrix:
+    """
+    Trip counts by entry (rows) and exit (columns) station, indexed by
+    StationID. Counts are added a chunk at a time from arrays of station
+    IDs, so any source of trips (SQLite, archived partitions) can feed it.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.counts = np.zeros(size * size, dtype=np.int64)
+
+    def _grow(self, size: int) -> None:
+        grown = np.zeros((size, size), dtype=np.int64)
+        grown[:self.size, :self.size] = self.counts.reshape(self.size, self.size)
+        self.size, self.counts = size, grown.ravel()
+
+    def add_keys(self, keys: np.ndarray) -> None:
+        """Add trips given as entry * size + exit keys (see sql_key)."""
+        if len(keys):
+            self.counts += np.bincount(keys, minlength=self.size * self.size)
+
+    def add(self, entry: np.ndarray, exit_: np.ndarray) -> None:
+        """Add trips given as parallel arrays of entry and exit StationIDs."""
+        if not len(entry):
+            return
+        largest = int(max(entry.max(), exit_.max()))
+        if largest >= self.size:
+            self._grow(largest + 1)
+        self.add_keys(entry.astype(np.int64) * self.size + exit_)
+
+    def sql_key(self, entry: str, exit_: str) -> str:
+        """SQL expression computing the key add_keys expects."""
+        return f'{entry} * {self.size} + {exit_}'
+
+    @property
+    def total(self) -> int:
+        return int(self.counts.sum())
+
+    def to_json(self, station_ids: List[int], fmt: str = 'dense') -> Dict[str, Any]:
+        """
+        Dense: {"stations": [...], "matrix": [[...]]} with a row and column
+        per station (matrix[i][j] trips from stations[i] to stations[j]).
+        Sparse: parallel "from", "to" and "trips" arrays of the non-zero
+        pairs, busiest first.
+        """
+        matrix = self.counts.reshape(self.size, self.size)
+        # Stations that have been deleted still show up if trips reference them.
+        used = np.flatnonzero(matrix.any(axis=0) | matrix.any(axis=1))
+        ids = np.union1d(np.asarray(station_ids, dtype=np.int64), used)
+        ids = ids[ids < self.size]
+        if fmt == 'dense':
+            return {'format': fmt, 'stations': ids.tolist(), 'total': self.total,
+                    'matrix': matrix[np.ix_(ids, ids)].tolist()}
+        entry, exit_ = np.nonzero(matrix)
+        trips = matrix[entry, exit_]
+        order = np.argsort(-trips, kind='stable')
+        return {'format': fmt, 'stations': ids.tolist(), 'total': self.total,
+                'from': entry[order].tolist(), 'to': exit_[order].tolist(), 'trips': trips[order].tolist()}
+
+
+def station_id_bound(conn: sqlite3.Connection) -> int:
+    """One more than the largest StationID in Station or Trip (index lookups only)."""
+    largest = conn.execute('''
+        SELECT MAX(COALESCE((SELECT MAX(StationID) FROM Station), 0),
+                   COALESCE((SELECT MAX(EntryStationID) FROM Trip), 0),
+                   COALESCE((SELECT MAX(ExitStationID) FROM Trip), 0))
+    ''').fetchone()[0]
+    return largest + 1
+
+
+@contextmanager
+def read_snapshot(conn: sqlite3.Connection) -> Iterator[None]:
+    """
+    Run the enclosed reads in one transaction, so the station ID bound and
+    the trip scan see the same snapshot: a trip committed in between with a
+    new StationID would otherwise produce keys past the matrix.
+    """
+    if conn.in_transaction:
+        yield
+        return
+    conn.execute('BEGIN')
+    try:
+        yield
+    finally:
+        conn.commit()
+
+
+def trip_filters(date_from: Optional[str] = None, date_to: Optional[str] = None,
+                 hours: Optional[Tuple[int, int]] = None,
+                 card_type_id: Optional[int] = None) -> Tuple[str, List[str], List[Any]]:
+    """
+    Joins, conditions and parameters selecting completed trips on alias t.
+    Date ranges are on EntryTime (to exclusive); hours slices by entry hour.
+    """
+    joins, filters, params = '', ['t.ExitStationID IS NOT NULL'], []
+    if date_from:
+        filters.append('t.EntryTime >= ?')
+        params.append(date_from)
+    if date_to:
+        filters.append('t.EntryTime < ?')
+        params.append(date_to)
+    if hours is not None:
+        start, end = hours
+        hour = 'CAST(substr(t.EntryTime, 12, 2) AS INTEGER)'
+        filters.append(f'({hour} >= ? AND {hour} < ?)' if start < end else f'({hour} >= ? OR {hour} < ?)')
+        params.extend([start, end])
+    if card_type_id is not None:
+        joins = ' JOIN Card c ON c.CardID = t.CardID'
+        filters.append('c.CardTypeID = ?')
+        params.append(card_type_id)
+    return joins, filters, params
+
+
+def card_type_mask(conn: sqlite3.Connection, card_type_id: int) -> np.ndarray:
+    """Boolean array indexed by CardID: True for cards of the given type."""
+    mask = np.zeros(conn.execute('SELECT COALESCE(MAX(CardID), 0) + 1 FROM Card').fetchone()[0], dtype=bool)
+    ids = np.array(conn.execute('SELECT CardID FROM Card WHERE CardTypeID = ?', (card_type_id,)).fetchall(),
+                   dtype=np.int64).ravel()
+    mask[ids] = True
+    return mask
+
+
+def od_matrix(conn: sqlite3.Connection, date_from: Optional[str] = None, date_to: Optional[str] = None,
+              hours: Optional[Tuple[int, int]] = None, card_type_id: Optional[int] = None,
+              cold: Optional[ColdStore] = None, chunk_rows: int = CHUNK_ROWS) -> ODMatrix:
+    """
+    Count completed trips by entry and exit station.
+
+    SQLite computes one integer key per trip (entry * size + exit); the keys
+    are fetched CHUNK_ROWS at a time into a NumPy array and counted with
+    bincount, so no Python code runs per trip and memory is bounded by the
+    chunk and the size x size matrix, not by the number of trips. A card
+    type is applied as a mask over CardID rather than a join: probing Card
+    (or idx_trip_card) once per trip is slower than scanning Trip.
+    :param date_from: first EntryTime included
+    :param date_to: EntryTime upper bound, exclusive
+    :param hours: (start, end) entry hour slice, see parse_hours
+    :param card_type_id: only trips on cards of this type
+    :param cold: archived trips to count as well (see archive.py)
+    :return: the accumulated matrix
+    """
+    with read_snapshot(conn):
+        matrix = ODMatrix(station_id_bound(conn))
+        _, filters, params = trip_filters(date_from, date_to, hours)
+        columns = matrix.sql_key('t.EntryStationID', 't.ExitStationID')
+        mask = None
+        if card_type_id is not None:
+            mask = card_type_mask(conn, card_type_id)
+            columns += ', t.CardID'
+            # Unary + keeps the planner off idx_trip_card
+            filters.append('+t.CardID < ?')
+            params.append(len(mask))
+        cursor = conn.execute(f'SELECT {columns} FROM Trip t WHERE {" AND ".join(filters)}', params)
+        try:
+            while True:
+                rows = cursor.fetchmany(chunk_rows)
+                if not rows:
+                    break
+                chunk = np.array(rows, dtype=np.int64)
+                if mask is None:
+                    matrix.add_keys(chunk.ravel())
+                else:
+                    matrix.add_keys(chunk[mask[chunk[:, 1]], 0])
+        finally:
+            cursor.close()
+    if cold is not None:
+        add_cold(matrix, cold, date_from, date_to, hours, mask)
+    return matrix
+
+
+def add_cold(matrix: ODMatrix, cold: ColdStore, date_from: Optional[str] = None, date_to: Optional[str] = None,
+             hours: Optional[Tuple[int, int]] = None, card_mask: Optional[np.ndarray] = None) -> None:
+    """
+    Add archived trips, one memory-mapped part at a time; parts outside the
+    date range are not opened.
+    """
+    for part in cold.parts('trips', date_from, date_to):
+        keep = part.matches(date_from, date_to)
+        entry, exit_ = part.column('EntryStationID'), part.column('ExitStationID')
+        keep &= exit_ != NULL_ID
+        if hours is not None:
+            start, end = hours
+            hour = hours_of(part.column('EntryTime'))
+            keep &= ((hour >= start) & (hour < end)) if start < end else ((hour >= start) | (hour < end))
+        if card_mask is not None:
+            cards = np.asarray(part.column('CardID'))
+            known = (cards >= 0) & (cards < len(card_mask))
+            keep &= known & card_mask[np.where(known, cards, 0)]
+        matrix.add(np.asarray(entry)[keep], np.asarray(exit_)[keep])
+
+
+def od_matrix_sql(conn: sqlite3.Connection, date_from: Optional[str] = None, date_to: Optional[str] = None,
+                  hours: Optional[Tuple[int, int]] = None, card_type_id: Optional[int] = None) -> ODMatrix:
+    """The same counts with GROUP BY in SQLite, for comparison (see benchmarks/bench_od_matrix.py)."""
+    with read_snapshot(conn):
+        matrix = ODMatrix(station_id_bound(conn))
+        joins, filters, params = trip_filters(date_from, date_to, hours, card_type_id)
+        rows = conn.execute(f'''
+            SELECT t.EntryStationID, t.ExitStationID, COUNT(*) FROM Trip t{joins}
+            WHERE {' AND '.join(filters)} GROUP BY 1, 2
+        ''', params).fetchall()
+    if rows:
+        entry, exit_, count = np.array(rows, dtype=np.int64).T
+        matrix.counts.reshape(matrix.size, matrix.size)[entry, exit_] = count
+    return matrix
+
+
+def station_ids(conn: sqlite3.Connection) -> List[int]:
+    return [row[0] for row in conn.execute('SELECT StationID FROM Station ORDER BY StationID')]
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Origin-destination trip matrix')
+    parser.add_argument('--db', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'project.db'),
+                        help='path to the SQLite database')
+    parser.add_argument('--archive-dir', help='cold tier directory (default: ARCHIVE_DIR or archive/ next to the db)')
+    parser.add_argument('--from', dest='date_from', help='first EntryTime included')
+    parser.add_argument('--to', dest='date_to', help='EntryTime upper bound (exclusive)')
+    parser.add_argument('--hours', help='entry hour slice, e.g. 7-10 or 22-2')
+    parser.add_argument('--card-type', type=int, help='only cards of this CardTypeID')
+    parser.add_argument('--format', choices=('csv', 'sparse'), default='csv',
+                        help='csv: dense matrix with station headers; sparse: from,to,trips lines')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(f'file:{args.db}?mode=ro', uri=True)
+    try:
+        started = time.perf_counter()
+        cold = ColdStore(args.archive_dir or os.getenv('ARCHIVE_DIR') or default_archive_dir(args.db))
+        result = od_matrix(conn, args.date_from, args.date_to, parse_hours(args.hours), args.card_type, cold)
+        body = result.to_json(station_ids(conn), 'dense' if args.format == 'csv' else 'sparse')
+        logger.info(f"{result.total:,} trips counted in {time.perf_counter() - started:.2f}s")
+    finally:
+        conn.close()
+
+    writer = csv.writer(sys.stdout)
+    if args.format == 'csv':
+        writer.writerow(['from/to'] + body['stations'])
+        for station, row in zip(body['stations'], body['matrix']):
+            writer.writerow([station] + row)
+    else:
+        writer.writerow(['from', 'to', 'trips'])
+        writer.writerows(zip(body['from'], body['to'], body['trips']))
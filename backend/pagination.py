@@ -0,0 +1,117 @@
+import base64
+import json
+import sqlite3
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+class PaginationError(ValueError):
+    """Raised for malformed limit/after query parameters."""
+
+
+def parse_limit(value: Optional[str], default: int = DEFAULT_PAGE_SIZE,
+                maximum: int = MAX_PAGE_SIZE) -> int:
+    """
+    Parse the ?limit= query parameter.
+    :param value: raw parameter value (None when absent)
+    :return: page size between 1 and `maximum`
+    """
+    if value is None or value == '':
+        return default
+    try:
+        limit = int(value)
+    except ValueError:
+        raise PaginationError("limit must be an integer")
+    if limit < 1:
+        raise PaginationError("limit must be at least 1")
+    return min(limit, maximum)
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """Encode the sort-key values of the last row of a page as an opaque token."""
+    raw = json.dumps(list(values), separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token: str, width: int) -> List[Any]:
+    """
+    Decode a token produced by encode_cursor.
+    :param width: number of sort-key values the endpoint expects
+    """
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, UnicodeError):
+        raise PaginationError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != width:
+        raise PaginationError("Invalid cursor")
+    # Values are bound as SQL parameters; anything else would fail in sqlite3
+    if not all(value is None or isinstance(value, (str, int, float)) for value in values):
+        raise PaginationError("Invalid cursor")
+    return values
+
+
+def build_keyset_query(select_sql: str, order_by: Sequence[Tuple[str, str]],
+                       descending: bool = False, filters: Optional[List[str]] = None,
+                       params: Optional[List[Any]] = None, after: Optional[str] = None,
+                       limit: Optional[int] = None) -> Tuple[str, List[Any]]:
+    """
+    Build the SQL for a keyset-ordered query.
+
+    Rather than OFFSET, results start strictly after the sort key carried in
+    the cursor, so every page costs the same index seek however deep it is.
+    :param select_sql: SELECT ... FROM ... JOIN ... without WHERE/ORDER BY
+    :param order_by: (sql expression, result column) pairs forming a unique sort key
+    :param descending: sort newest/highest first
+    :param filters: SQL conditions ANDed into the WHERE clause
+    :param params: parameters for `filters`, in order
+    :param after: cursor returned as nextCursor by the previous page
+    :param limit: maximum number of rows, or None for no LIMIT clause
+    :return: (sql, parameters)
+    """
+    conditions = list(filters or [])
+    values = list(params or [])
+    exprs = [expr for expr, _ in order_by]
+    direction = 'DESC' if descending else 'ASC'
+
+    if after:
+        key = decode_cursor(after, len(order_by))
+        placeholders = ', '.join('?' for _ in key)
+        comparison = '<' if descending else '>'
+        if len(exprs) == 1:
+            conditions.append(f"{exprs[0]} {comparison} ?")
+        else:
+            conditions.append(f"({', '.join(exprs)}) {comparison} ({placeholders})")
+        values.extend(key)
+
+    sql = select_sql
+    if conditions:
+        sql += ' WHERE ' + ' AND '.join(conditions)
+    sql += ' ORDER BY ' + ', '.join(f'{expr} {direction}' for expr in exprs)
+    if limit is not None:
+        sql += ' LIMIT ?'
+        values.append(limit)
+    return sql, values
+
+
+def keyset_page(conn: sqlite3.Connection, select_sql: str,
+                order_by: Sequence[Tuple[str, str]], descending: bool = False,
+                filters: Optional[List[str]] = None, params: Optional[List[Any]] = None,
+                after: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE
+                ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Fetch one page of rows using keyset (seek) pagination.
+    Arguments are as for build_keyset_query.
+    :return: (rows as dicts, cursor for the next page or None on the last page)
+    """
+    sql, values = build_keyset_query(select_sql, order_by, descending, filters,
+                                     params, after, limit + 1)
+    rows = conn.execute(sql, values).fetchall()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor([last[column] for _, column in order_by])
+    return [dict(row) for row in rows], next_cursor
@@ -0,0 +1,81 @@
+import sqlite3
+from typing import Dict, Optional, Tuple
+
+# Which tables each cached reference endpoint reads.
+DEPENDENCIES: Dict[str, Tuple[str, ...]] = {
+    'stations': ('Station',),
+    'card-types': ('CardType',),
+    'fare-rules': ('FareRule', 'Station'),
+}
+
+VERSIONED_TABLES = ('Station', 'CardType', 'FareRule')
+
+
+def _bump_triggers(table: str) -> str:
+    return ''.join(f'''
+    CREATE TRIGGER IF NOT EXISTS trg_refversion_{table.lower()}_{event.lower()} AFTER {event} ON {table}
+    BEGIN
+        UPDATE RefVersion SET Version = Version + 1 WHERE TableName = '{table}';
+    END;
+''' for event in ('INSERT', 'UPDATE', 'DELETE'))
+
+
+# One data version per reference table, bumped by triggers on every change
+# whichever process or script makes it. Versions start at random values so a
+# recreated database never reproduces an ETag of the old one.
+REF_VERSION_DDL = '''
+    CREATE TABLE IF NOT EXISTS RefVersion (
+        TableName TEXT PRIMARY KEY,
+        Version INTEGER NOT NULL
+    ) WITHOUT ROWID;
+''' + ''.join(f'''
+    INSERT OR IGNORE INTO RefVersion (TableName, Version) VALUES ('{table}', abs(random() % 1000000000));
+''' for table in VERSIONED_TABLES) + ''.join(_bump_triggers(table) for table in VERSIONED_TABLES)
+
+
+def read_versions(conn: sqlite3.Connection) -> Dict[str, int]:
+    """Current data version of each reference table."""
+    return dict(conn.execute('SELECT TableName, Version FROM RefVersion').fetchall())
+
+
+class ReferenceCache:
+    """
+    Per-table data versions and version-stamped response bodies.
+
+    The versions are the RefVersion rows, which triggers bump on every
+    insert, update or delete of a reference table, so writes from other
+    server processes and from scripts count as well. sync() reads them (one
+    small primary-key table) before each cached response; the ETag of a
+    cached endpoint is derived from the versions of the tables it reads, and
+    revalidation (If-None-Match) and cache hits cost that read and
+    dictionary lookups.
+    """
+
+    def __init__(self, dependencies: Dict[str, Tuple[str, ...]] = DEPENDENCIES):
+        self.dependencies = dependencies
+        self._versions: Dict[str, int] = {}
+        self._bodies: Dict[str, Tuple[str, bytes]] = {}
+
+    def sync(self, conn: sqlite3.Connection) -> None:
+        """Load the current versions from RefVersion."""
+        self._versions = read_versions(conn)
+
+    def etag(self, key: str) -> str:
+        """ETag for an endpoint at the current versions of its tables."""
+        versions = '.'.join(str(self._versions.get(t, 0)) for t in self.dependencies[key])
+        return f'{key}-{versions}'
+
+    def get(self, key: str, etag: str) -> Optional[bytes]:
+        """Serialized body cached for this ETag, or None."""
+        entry = self._bodies.get(key)
+        if entry is not None and entry[0] == etag:
+            return entry[1]
+        return None
+
+    def put(self, key: str, etag: str, body: bytes) -> None:
+        """
+        Cache a body under the ETag that was current before it was queried.
+        A write that lands during the query bumps the version, so a body
+        stored under the old ETag is simply never served.
+        """
+        self._bodies[key] = (etag, body)
@@ -0,0 +1,222 @@
+import json
+import sqlite3
+import time
+import logging
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+from flask import g, has_app_context
+from flask.json.provider import DefaultJSONProvider
+
+logger = logging.getLogger(__name__)
+
+# Timing buckets, in Server-Timing order.
+#   connect    waiting for a pooled connection
+#   sql        executing statements and fetching rows on the request's connection
+#   write      queued writes, from submit to commit (see write_queue)
+#   serialize  JSON encoding of the response body
+SPANS = ('connect', 'sql', 'write', 'serialize')
+SQL_TEXT_LIMIT = 200
+
+
+class RequestTrace:
+    """
+    SQL and timing figures for one sampled request.
+
+    attach() instruments a connection for the rest of its lease: SQLite's
+    trace callback counts every statement it runs (including trigger
+    bodies and implicit BEGIN/COMMIT), and cursors handed out by the
+    connection time execute and fetch calls. Unsampled requests never create
+    a trace, so their connections run uninstrumented.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.statements = 0
+        self.timings: Dict[str, float] = dict.fromkeys(SPANS, 0.0)
+        self.slowest_sql: Optional[str] = None
+        self.slowest_time = 0.0
+
+    # ---------- recording ----------
+
+    def on_statement(self, sql: str) -> None:
+        """sqlite3 trace callback (trigger bodies are reported under the firing statement)."""
+        self.statements += 1
+
+    def add_sql(self, sql: str, elapsed: float, statement_total: float) -> None:
+        """
+        Count time spent in a cursor call.
+        :param statement_total: time spent on this statement so far (execute plus fetches)
+        """
+        self.timings['sql'] += elapsed
+        if statement_total > self.slowest_time:
+            self.slowest_time = statement_total
+            self.slowest_sql = sql
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] += time.perf_counter() - start
+
+    # ---------- connection instrumentation ----------
+
+    def attach(self, conn: sqlite3.Connection) -> None:
+        """Instrument a pooled connection until detach()."""
+        conn.trace = self
+        instrument(conn)
+        conn.set_trace_callback(self.on_statement)
+
+    @staticmethod
+    def detach(conn: sqlite3.Connection) -> None:
+        """Remove the instrumentation added by attach()."""
+        conn.trace = None
+        conn.set_trace_callback(None)
+        if conn.slow_log is None:
+            uninstrument(conn)
+
+    # ---------- reporting ----------
+
+    def server_timing(self, total: float) -> str:
+        """Server-Timing header value (durations in ms)."""
+        parts = [f'{name};dur={self.timings[name] * 1000:.2f}' for name in SPANS if self.timings[name]]
+        parts.append(f'db;desc="{self.statements} statements"')
+        parts.append(f'total;dur={total * 1000:.2f}')
+        return ', '.join(parts)
+
+    def record(self, method: str, path: str, status: int, total: float) -> Dict[str, Any]:
+        """Fields for the structured log line."""
+        record = {
+            'method': method,
+            'path': path,
+            'status': status,
+            'totalMs': round(total * 1000, 3),
+            'statements': self.statements,
+        }
+        for name in SPANS:
+            record[f'{name}Ms'] = round(self.timings[name] * 1000, 3)
+        if self.slowest_sql is not None:
+            record['slowestSqlMs'] = round(self.slowest_time * 1000, 3)
+            record['slowestSql'] = ' '.join(self.slowest_sql.split())[:SQL_TEXT_LIMIT]
+        return record
+
+    def finish(self, response, method: str, path: str) -> None:
+        """Add the Server-Timing header and write the log line."""
+        total = time.perf_counter() - self.started
+        response.headers['Server-Timing'] = self.server_timing(total)
+        logger.info(json.dumps(self.record(method, path, response.status_code, total)))
+
+
+def instrument(conn: sqlite3.Connection) -> None:
+    """
+    Hand out timing cursors from a pooled connection, reporting to its
+    current trace and slow-query log (conn.trace, conn.slow_log). The
+    overrides live in the instance __dict__, so other connections and
+    uninstrumented ones run the C methods directly.
+    """
+    if 'cursor' in conn.__dict__:
+        return
+
+    def cursor(factory=None):
+        cur = sqlite3.Connection.cursor(conn, factory or (TimedCursor if conn.trace is None else TracedCursor))
+        if isinstance(cur, TimedCursor):
+            cur.trace = conn.trace
+            cur.slow_log = conn.slow_log
+        return cur
+
+    conn.cursor = cursor
+    conn.execute = lambda sql, parameters=(): cursor().execute(sql, parameters)
+    conn.executemany = lambda sql, seq_of_parameters: cursor().executemany(sql, seq_of_parameters)
+    conn.executescript = lambda script: cursor().executescript(script)
+
+
+def uninstrument(conn: sqlite3.Connection) -> None:
+    """Undo instrument()."""
+    for name in ('cursor', 'execute', 'executemany', 'executescript'):
+        conn.__dict__.pop(name, None)
+
+
+class TimedCursor(sqlite3.Cursor):
+    """
+    Cursor that times its execute and fetch calls, for the request's trace
+    and for the slow-query log (see slow_query.SlowQueryLog).
+
+    Iterating row by row is not timed here: a Python __next__ would cost
+    more than SQLite's own per-row work on large scans. TracedCursor adds
+    it for sampled requests.
+    """
+
+    trace: Optional[RequestTrace] = None
+    slow_log = None
+    _sql = ''
+    _params: Any = None
+    _statement_time = 0.0
+    _slow_key: Optional[str] = None
+
+    def _timed(self, method, *args):
+        start = time.perf_counter()
+        try:
+            return method(self, *args)
+        finally:
+            elapsed = time.perf_counter() - start
+            self._statement_time += elapsed
+            if self.trace is not None:
+                self.trace.add_sql(self._sql, elapsed, self._statement_time)
+            if self.slow_log is not None and self._statement_time >= self.slow_log.threshold:
+                if self._slow_key is None:
+                    self._slow_key = self.slow_log.record(self.connection, self._sql, self._params,
+                                                          self._statement_time)
+                else:
+                    self.slow_log.extend(self._slow_key, elapsed, self._statement_time)
+
+    def _begin(self, sql: str, params: Any) -> None:
+        self._sql = sql
+        self._params = params
+        self._statement_time = 0.0
+        self._slow_key = None
+
+    def execute(self, sql, parameters=()):
+        self._begin(sql, parameters)
+        return self._timed(sqlite3.Cursor.execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._begin(sql, None)
+        return self._timed(sqlite3.Cursor.executemany, sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        self._begin(sql_script, None)
+        return self._timed(sqlite3.Cursor.executescript, sql_script)
+
+    def fetchone(self):
+        return self._timed(sqlite3.Cursor.fetchone)
+
+    def fetchmany(self, size=None):
+        return self._timed(sqlite3.Cursor.fetchmany, size or self.arraysize)
+
+    def fetchall(self):
+        return self._timed(sqlite3.Cursor.fetchall)
+
+
+class TracedCursor(TimedCursor):
+    """TimedCursor that also times row-by-row iteration."""
+
+    def __next__(self):
+        return self._timed(sqlite3.Cursor.__next__)
+
+
+def current_trace() -> Optional[RequestTrace]:
+    """The trace of the request being handled, if it was sampled."""
+    return g.get('request_trace') if has_app_context() else None
+
+
+class TracingJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that counts encoding time toward the request's trace."""
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        trace = current_trace()
+        if trace is None:
+            return super().dumps(obj, **kwargs)
+        with trace.span('serialize'):
+            return super().dumps(obj, **kwargs)
@@ -0,0 +1,295 @@
+import argparse
+import os
+import sqlite3
+import logging
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Time-bucketed summary tables behind /analytics/ridership and
+# /analytics/revenue, kept current by the triggers below as trips and
+# transactions are written, so the endpoints read a handful of rows per
+# bucket instead of scanning Trip and [Transaction].
+#
+#   StationHourlyStats   per station and hour: entries (by entry station and
+#                        time), exits and fare revenue (by exit station and
+#                        time, from Trip.FareAmount)
+#   CardTypeDailyStats   per card type and day: trips started, fare spend
+#                        and top-ups (from [Transaction])
+#
+# Buckets are the leading characters of the ISO timestamps ('YYYY-MM-DD HH'
+# and 'YYYY-MM-DD'). Card-type figures use the card's type when the row is
+# written; changing a card's type later does not move its history. Cards
+# without a type are counted under CardTypeID 0. Installed by migrations.py;
+# backfill() recomputes everything from the base tables and the cold tier.
+TOPUP_TYPES = ('Top-up', 'Recharge')
+FARE_TYPE = 'Fare'
+
+_TOPUP_SQL = '(' + ', '.join(f"'{name}'" for name in TOPUP_TYPES) + ')'
+_CARD_TYPE = "COALESCE((SELECT CardTypeID FROM Card WHERE CardID = {card}), 0)"
+
+
+def _station_hour(station: str, time: str, entries: str, exits: str, revenue: str, condition: str) -> str:
+    return f'''
+        INSERT INTO StationHourlyStats (Hour, StationID, Entries, Exits, FareRevenue)
+        SELECT substr({time}, 1, 13), {station}, {entries}, {exits}, {revenue} WHERE {condition}
+        ON CONFLICT (Hour, StationID) DO UPDATE SET
+            Entries = Entries + excluded.Entries,
+            Exits = Exits + excluded.Exits,
+            FareRevenue = FareRevenue + excluded.FareRevenue;'''
+
+
+def _card_type_day(row: str, time: str, trips: str, spend: str, topups: str, topup_amount: str,
+                   condition: str) -> str:
+    return f'''
+        INSERT INTO CardTypeDailyStats (Day, CardTypeID, Trips, Spend, TopUps, TopUpAmount)
+        SELECT substr({time}, 1, 10), {_CARD_TYPE.format(card=row + '.CardID')},
+               {trips}, {spend}, {topups}, {topup_amount} WHERE {condition}
+        ON CONFLICT (Day, CardTypeID) DO UPDATE SET
+            Trips = Trips + excluded.Trips,
+            Spend = Spend + excluded.Spend,
+            TopUps = TopUps + excluded.TopUps,
+            TopUpAmount = TopUpAmount + excluded.TopUpAmount;'''
+
+
+def _trip_entry(row: str, sign: str) -> str:
+    return (_station_hour(f'{row}.EntryStationID', f'{row}.EntryTime', sign, '0', '0', '1')
+            + _card_type_day(row, f'{row}.EntryTime', sign, '0', '0', '0', '1'))
+
+
+def _trip_exit(row: str, sign: str) -> str:
+    return _station_hour(f'{row}.ExitStationID', f'{row}.ExitTime', '0', sign,
+                         f'{sign} * COALESCE({row}.FareAmount, 0)',
+                         f'{row}.ExitTime IS NOT NULL AND {row}.ExitStationID IS NOT NULL')
+
+
+def _transaction(row: str, sign: str) -> str:
+    return _card_type_day(
+        row, f'{row}.TransactionDate', '0',
+        f"{sign} * ({row}.TransactionType = '{FARE_TYPE}') * {row}.Amount",
+        f"{sign} * ({row}.TransactionType IN {_TOPUP_SQL})",
+        f"{sign} * ({row}.TransactionType IN {_TOPUP_SQL}) * {row}.Amount",
+        f"{row}.TransactionType = '{FARE_TYPE}' OR {row}.TransactionType IN {_TOPUP_SQL}")
+
+
+ROLLUPS_DDL = f'''
+    CREATE TABLE IF NOT EXISTS StationHourlyStats (
+        Hour TEXT NOT NULL,
+        StationID INTEGER NOT NULL,
+        Entries INTEGER NOT NULL DEFAULT 0,
+        Exits INTEGER NOT NULL DEFAULT 0,
+        FareRevenue REAL NOT NULL DEFAULT 0.0,
+        PRIMARY KEY (Hour, StationID)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS CardTypeDailyStats (
+        Day TEXT NOT NULL,
+        CardTypeID INTEGER NOT NULL,
+        Trips INTEGER NOT NULL DEFAULT 0,
+        Spend REAL NOT NULL DEFAULT 0.0,
+        TopUps INTEGER NOT NULL DEFAULT 0,
+        TopUpAmount REAL NOT NULL DEFAULT 0.0,
+        PRIMARY KEY (Day, CardTypeID)
+    ) WITHOUT ROWID;
+
+    -- Trip. Tap-out only updates the exit columns, so it fires just the exit trigger.
+    CREATE TRIGGER IF NOT EXISTS trg_rollup_trip_insert AFTER INSERT ON Trip
+    BEGIN{_trip_entry('NEW', '1')}{_trip_exit('NEW', '1')}
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_rollup_trip_delete AFTER DELETE ON Trip
+    BEGIN{_trip_entry('OLD', '-1')}{_trip_exit('OLD', '-1')}
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_rollup_trip_entry AFTER UPDATE OF EntryTime, EntryStationID, CardID ON Trip
+    BEGIN{_trip_entry('OLD', '-1')}{_trip_entry('NEW', '1')}
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_rollup_trip_exit AFTER UPDATE OF ExitTime, ExitStationID, FareAmount ON Trip
+    BEGIN{_trip_exit('OLD', '-1')}{_trip_exit('NEW', '1')}
+    END;
+
+    -- Transaction
+    CREATE TRIGGER IF NOT EXISTS trg_rollup_transaction_insert AFTER INSERT ON [Transaction]
+    BEGIN{_transaction('NEW', '1')}
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_rollup_transaction_delete AFTER DELETE ON [Transaction]
+    BEGIN{_transaction('OLD', '-1')}
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_rollup_transaction_update
+    AFTER UPDATE OF TransactionType, Amount, TransactionDate, CardID ON [Transaction]
+    BEGIN{_transaction('OLD', '-1')}{_transaction('NEW', '1')}
+    END;
+'''
+
+BACKFILL_SQL = [
+    'DELETE FROM StationHourlyStats',
+    'DELETE FROM CardTypeDailyStats',
+    '''
+    INSERT INTO StationHourlyStats (Hour, StationID, Entries, Exits, FareRevenue)
+    SELECT Hour, StationID, SUM(Entries), SUM(Exits), SUM(FareRevenue) FROM (
+        SELECT substr(EntryTime, 1, 13) AS Hour, EntryStationID AS StationID,
+               COUNT(*) AS Entries, 0 AS Exits, 0.0 AS FareRevenue
+        FROM Trip GROUP BY 1, 2
+        UNION ALL
+        SELECT substr(ExitTime, 1, 13), ExitStationID, 0, COUNT(*), COALESCE(SUM(FareAmount), 0)
+        FROM Trip WHERE ExitTime IS NOT NULL AND ExitStationID IS NOT NULL GROUP BY 1, 2
+    ) GROUP BY Hour, StationID
+    ''',
+    f'''
+    INSERT INTO CardTypeDailyStats (Day, CardTypeID, Trips, Spend, TopUps, TopUpAmount)
+    SELECT Day, CardTypeID, SUM(Trips), SUM(Spend), SUM(TopUps), SUM(TopUpAmount) FROM (
+        SELECT substr(t.EntryTime, 1, 10) AS Day, COALESCE(c.CardTypeID, 0) AS CardTypeID,
+               COUNT(*) AS Trips, 0.0 AS Spend, 0 AS TopUps, 0.0 AS TopUpAmount
+        FROM Trip t LEFT JOIN Card c ON c.CardID = t.CardID GROUP BY 1, 2
+        UNION ALL
+        SELECT substr(x.TransactionDate, 1, 10), COALESCE(c.CardTypeID, 0), 0,
+               SUM((x.TransactionType = '{FARE_TYPE}') * x.Amount),
+               SUM(x.TransactionType IN {_TOPUP_SQL}),
+               SUM((x.TransactionType IN {_TOPUP_SQL}) * x.Amount)
+        FROM [Transaction] x LEFT JOIN Card c ON c.CardID = x.CardID
+        WHERE x.TransactionType = '{FARE_TYPE}' OR x.TransactionType IN {_TOPUP_SQL}
+        GROUP BY 1, 2
+    ) GROUP BY Day, CardTypeID
+    ''',
+]
+
+
+def backfill(conn: sqlite3.Connection, archive_root: Optional[str] = None) -> None:
+    """
+    Recompute both rollups from Trip and [Transaction] and the rows moved
+    to the cold tier (after a bulk load that ran without the triggers, or
+    if they have drifted). Runs inside the caller's transaction.
+    :param conn: Connection object
+    :param archive_root: cold tier directory (default: archive.archive_dir_for)
+    :return: None
+    """
+    # archive.py imports this module
+    from archive import add_cold_rollups, archive_dir_for
+
+    for sql in BACKFILL_SQL:
+        conn.execute(sql)
+    archive_root = archive_root or archive_dir_for(conn)
+    if archive_root:
+        add_cold_rollups(conn, archive_root)
+
+
+# ---------- queries ----------
+
+# Bucket expressions over the 'YYYY-MM-DD HH' hour key; weeks start on Monday.
+BUCKETS = {
+    'hour': "{col} || ':00'",
+    'day': 'substr({col}, 1, 10)',
+    'week': "date(substr({col}, 1, 10), '-6 days', 'weekday 1')",
+    'month': 'substr({col}, 1, 7)',
+}
+
+
+class RollupQueryError(ValueError):
+    """Raised for unusable analytics parameters."""
+
+
+def _bucket(bucket: str, column: str) -> str:
+    if bucket not in BUCKETS:
+        raise RollupQueryError(f"bucket must be one of {', '.join(BUCKETS)}")
+    return BUCKETS[bucket].format(col=column)
+
+
+def _range(column: str, length: int, date_from: Optional[str], date_to: Optional[str],
+           filters: List[str], params: List[Any]) -> None:
+    """
+    Bound a bucket key column by from (inclusive) and to (exclusive), both
+    truncated to the key's precision (the hour or the day).
+    """
+    if date_from:
+        filters.append(f'{column} >= ?')
+        params.append(date_from[:length])
+    if date_to:
+        filters.append(f'{column} < ?')
+        params.append(date_to[:length])
+
+
+def ridership(conn: sqlite3.Connection, bucket: str = 'day', date_from: Optional[str] = None,
+              date_to: Optional[str] = None, station_id: Optional[int] = None,
+              line: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Entries, exits and fare revenue per time bucket from StationHourlyStats.
+    :param bucket: hour, day, week or month
+    :param date_from: first timestamp included (any precision down to the hour)
+    :param date_to: end of the range, exclusive
+    :param station_id: only this station
+    :param line: only stations with this LineColor
+    :return: one dict per non-empty bucket, oldest first
+    """
+    filters, params = [], []
+    _range('s.Hour', 13, date_from, date_to, filters, params)
+    sql = f'''SELECT {_bucket(bucket, 's.Hour')} AS bucket, SUM(s.Entries) AS entries,
+                     SUM(s.Exits) AS exits, ROUND(SUM(s.FareRevenue), 2) AS fareRevenue
+              FROM StationHourlyStats s'''
+    if station_id is not None:
+        filters.append('s.StationID = ?')
+        params.append(station_id)
+    if line:
+        sql += ' JOIN Station st ON st.StationID = s.StationID'
+        filters.append('st.LineColor = ?')
+        params.append(line)
+    if filters:
+        sql += ' WHERE ' + ' AND '.join(filters)
+    sql += ' GROUP BY 1 ORDER BY 1'
+    return [dict(row) for row in conn.execute(sql, params)]
+
+
+def revenue(conn: sqlite3.Connection, bucket: str = 'day', date_from: Optional[str] = None,
+            date_to: Optional[str] = None, station_id: Optional[int] = None,
+            line: Optional[str] = None, card_type_id: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Revenue per time bucket: fare revenue at exit stations (StationHourlyStats,
+    filtered by station and line) alongside fare spend, top-ups and trips by
+    card type (CardTypeDailyStats, filtered by card type). The card-type
+    figures are daily and not tied to stations, so they are None for hourly
+    buckets and when a station or line filter is given; fareRevenue is None
+    when filtering by card type.
+    :return: one dict per non-empty bucket, oldest first
+    """
+    by_card_type = bucket != 'hour' and station_id is None and not line
+    if card_type_id is not None and not by_card_type:
+        raise RollupQueryError("cardTypeId needs a day, week or month bucket and no stationId or line")
+    series: Dict[str, Dict[str, Any]] = {}
+    if card_type_id is None:
+        for row in ridership(conn, bucket, date_from, date_to, station_id, line):
+            series[row['bucket']] = {'bucket': row['bucket'], 'fareRevenue': row['fareRevenue'],
+                                     'trips': None, 'spend': None, 'topUps': None, 'topUpAmount': None}
+    if by_card_type:
+        filters, params = [], []
+        _range('Day', 10, date_from, date_to, filters, params)
+        if card_type_id is not None:
+            filters.append('CardTypeID = ?')
+            params.append(card_type_id)
+        sql = f'''SELECT {_bucket(bucket, 'Day')} AS bucket, SUM(Trips) AS trips, ROUND(SUM(Spend), 2) AS spend,
+                         SUM(TopUps) AS topUps, ROUND(SUM(TopUpAmount), 2) AS topUpAmount
+                  FROM CardTypeDailyStats'''
+        if filters:
+            sql += ' WHERE ' + ' AND '.join(filters)
+        sql += ' GROUP BY 1'
+        for row in conn.execute(sql, params):
+            entry = series.setdefault(row['bucket'], {'bucket': row['bucket'], 'fareRevenue': None})
+            entry.update(trips=row['trips'], spend=row['spend'], topUps=row['topUps'],
+                         topUpAmount=row['topUpAmount'])
+    return [series[key] for key in sorted(series)]
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Maintain the ridership and revenue rollups')
+    parser.add_argument('command', choices=['backfill'])
+    parser.add_argument('--db', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'project.db'),
+                        help='path to the SQLite database')
+    parser.add_argument('--archive-dir', help='cold tier directory (default: ARCHIVE_DIR or archive/ next to the db)')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    try:
+        backfill(conn, args.archive_dir)
+        conn.commit()
+        hours, days = (conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                       for table in ('StationHourlyStats', 'CardTypeDailyStats'))
+        logger.info(f"Rollups backfilled: {hours} station-hours, {days} card-type-days")
+    finally:
+        conn.close()
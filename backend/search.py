@@ -0,0 +1,195 @@
+import argparse
+import os
+import re
+import sqlite3
+import logging
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from pagination import DEFAULT_PAGE_SIZE, encode_cursor, decode_cursor
+
+logger = logging.getLogger(__name__)
+
+# FTS5 indexes behind GET /search. They are external-content tables: the
+# text lives only in the base tables and the index stores tokens, so each
+# costs a fraction of the table it covers. The triggers below keep them in
+# step with inserts, deletes and updates of the indexed columns (only those:
+# balance updates on every tap-out do not touch CardSearch). prefix= adds
+# prefix indexes so "pri*" style queries do not scan the whole term list.
+# Installed by migrations.py.
+SEARCH_DDL = '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS PassengerSearch USING fts5(
+        FirstName, LastName, Email, PhoneNumber,
+        content='Passenger', content_rowid='PassengerID', prefix='2 3'
+    );
+    CREATE VIRTUAL TABLE IF NOT EXISTS CardSearch USING fts5(
+        CardNumber, content='Card', content_rowid='CardID', prefix='2 3'
+    );
+    CREATE VIRTUAL TABLE IF NOT EXISTS StationSearch USING fts5(
+        StationName, content='Station', content_rowid='StationID', prefix='2 3'
+    );
+
+    -- Names count for more than contact details when ranking
+    INSERT INTO PassengerSearch (PassengerSearch, rank) VALUES ('rank', 'bm25(10.0, 10.0, 2.0, 1.0)');
+
+    -- Passenger
+    CREATE TRIGGER IF NOT EXISTS trg_search_passenger_insert AFTER INSERT ON Passenger
+    BEGIN
+        INSERT INTO PassengerSearch (rowid, FirstName, LastName, Email, PhoneNumber)
+        VALUES (NEW.PassengerID, NEW.FirstName, NEW.LastName, NEW.Email, NEW.PhoneNumber);
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_search_passenger_delete AFTER DELETE ON Passenger
+    BEGIN
+        INSERT INTO PassengerSearch (PassengerSearch, rowid, FirstName, LastName, Email, PhoneNumber)
+        VALUES ('delete', OLD.PassengerID, OLD.FirstName, OLD.LastName, OLD.Email, OLD.PhoneNumber);
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_search_passenger_update
+    AFTER UPDATE OF FirstName, LastName, Email, PhoneNumber ON Passenger
+    BEGIN
+        INSERT INTO PassengerSearch (PassengerSearch, rowid, FirstName, LastName, Email, PhoneNumber)
+        VALUES ('delete', OLD.PassengerID, OLD.FirstName, OLD.LastName, OLD.Email, OLD.PhoneNumber);
+        INSERT INTO PassengerSearch (rowid, FirstName, LastName, Email, PhoneNumber)
+        VALUES (NEW.PassengerID, NEW.FirstName, NEW.LastName, NEW.Email, NEW.PhoneNumber);
+    END;
+
+    -- Card
+    CREATE TRIGGER IF NOT EXISTS trg_search_card_insert AFTER INSERT ON Card
+    BEGIN
+        INSERT INTO CardSearch (rowid, CardNumber) VALUES (NEW.CardID, NEW.CardNumber);
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_search_card_delete AFTER DELETE ON Card
+    BEGIN
+        INSERT INTO CardSearch (CardSearch, rowid, CardNumber) VALUES ('delete', OLD.CardID, OLD.CardNumber);
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_search_card_update AFTER UPDATE OF CardNumber ON Card
+    BEGIN
+        INSERT INTO CardSearch (CardSearch, rowid, CardNumber) VALUES ('delete', OLD.CardID, OLD.CardNumber);
+        INSERT INTO CardSearch (rowid, CardNumber) VALUES (NEW.CardID, NEW.CardNumber);
+    END;
+
+    -- Station
+    CREATE TRIGGER IF NOT EXISTS trg_search_station_insert AFTER INSERT ON Station
+    BEGIN
+        INSERT INTO StationSearch (rowid, StationName) VALUES (NEW.StationID, NEW.StationName);
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_search_station_delete AFTER DELETE ON Station
+    BEGIN
+        INSERT INTO StationSearch (StationSearch, rowid, StationName)
+        VALUES ('delete', OLD.StationID, OLD.StationName);
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_search_station_update AFTER UPDATE OF StationName ON Station
+    BEGIN
+        INSERT INTO StationSearch (StationSearch, rowid, StationName)
+        VALUES ('delete', OLD.StationID, OLD.StationName);
+        INSERT INTO StationSearch (rowid, StationName) VALUES (NEW.StationID, NEW.StationName);
+    END;
+'''
+
+
+class SearchTarget(NamedTuple):
+    index: str
+    select_sql: str  # rows in the shape of the matching list endpoint, plus _rank
+    id_column: str
+
+
+TARGETS: Dict[str, SearchTarget] = {
+    'passengers': SearchTarget('PassengerSearch', '''
+        SELECT s.rank AS _rank, p.* FROM PassengerSearch s
+        JOIN Passenger p ON p.PassengerID = s.rowid
+    ''', 'PassengerID'),
+    'cards': SearchTarget('CardSearch', '''
+        SELECT s.rank AS _rank, c.*, p.FirstName, p.LastName, ct.TypeName FROM CardSearch s
+        JOIN Card c ON c.CardID = s.rowid
+        LEFT JOIN Passenger p ON c.PassengerID = p.PassengerID
+        LEFT JOIN CardType ct ON c.CardTypeID = ct.CardTypeID
+    ''', 'CardID'),
+    'stations': SearchTarget('StationSearch', '''
+        SELECT s.rank AS _rank, st.* FROM StationSearch s
+        JOIN Station st ON st.StationID = s.rowid
+    ''', 'StationID'),
+}
+
+MAX_TERMS = 8
+_TERM = re.compile(r'\w+')
+
+
+class SearchError(ValueError):
+    """Raised for an unusable search request (bad type or query)."""
+
+
+def match_expression(query: str) -> str:
+    """
+    Turn free text into an FTS5 query: every word must match as a prefix,
+    in any column. Words are quoted, so FTS5 operators typed by the user
+    are treated as text.
+    """
+    terms = _TERM.findall(query)[:MAX_TERMS]
+    if not terms:
+        raise SearchError("q must contain at least one letter or digit")
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def search(conn: sqlite3.Connection, kind: str, query: str, after: Optional[str] = None,
+           limit: int = DEFAULT_PAGE_SIZE) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    One page of search results, best match first.
+
+    Pages are keyed on (rank, rowid) like the keyset list endpoints, so a
+    cursor stays valid as long as the ranking inputs do not change; writes
+    between pages can shift scores slightly.
+    :param kind: passengers, cards or stations
+    :param query: free text, see match_expression
+    :param after: cursor returned as nextCursor by the previous page
+    :return: (rows as dicts, cursor for the next page or None on the last page)
+    """
+    target = TARGETS.get(kind)
+    if target is None:
+        raise SearchError(f"type must be one of {', '.join(TARGETS)}")
+    sql = target.select_sql + f' WHERE {target.index} MATCH ?'
+    params: List[Any] = [match_expression(query)]
+    if after:
+        params.extend(decode_cursor(after, 2))
+        sql += ' AND (s.rank, s.rowid) > (?, ?)'
+    sql += ' ORDER BY s.rank, s.rowid LIMIT ?'
+    params.append(limit + 1)
+    rows = conn.execute(sql, params).fetchall()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([rows[-1]['_rank'], rows[-1][target.id_column]])
+    items = [dict(row) for row in rows]
+    for item in items:
+        del item['_rank']
+    return items, next_cursor
+
+
+def rebuild_search(conn: sqlite3.Connection) -> None:
+    """
+    Re-index every search table from its base table (after a bulk load
+    that ran without the triggers). Runs inside the caller's transaction.
+    :param conn: Connection object
+    :return: None
+    """
+    for target in TARGETS.values():
+        conn.execute(f"INSERT INTO {target.index} ({target.index}) VALUES ('rebuild')")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Maintain the full-text search indexes')
+    parser.add_argument('command', choices=['rebuild', 'optimize'])
+    parser.add_argument('--db', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'project.db'),
+                        help='path to the SQLite database')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    try:
+        if args.command == 'rebuild':
+            rebuild_search(conn)
+        else:
+            # Merge index segments; worthwhile after large imports
+            for target in TARGETS.values():
+                conn.execute(f"INSERT INTO {target.index} ({target.index}) VALUES ('optimize')")
+        conn.commit()
+        logger.info(f"Search indexes: {args.command} done")
+    finally:
+        conn.close()
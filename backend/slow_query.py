@@ -0,0 +1,158 @@
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from request_trace import instrument
+
+logger = logging.getLogger(__name__)
+
+MAX_SHAPES = 500
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?(?![\w.])')
+_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_SPACE = re.compile(r'\s+')
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    Reduce a statement to its shape: literals become ?, IN lists collapse
+    to (?...), whitespace is squeezed. Statements that differ only in their
+    values share a shape.
+    """
+    shape = _STRING.sub('?', sql)
+    shape = _NUMBER.sub('?', shape)
+    shape = _IN_LIST.sub('(?...)', shape)
+    return _SPACE.sub(' ', shape).strip()
+
+
+def redact(params: Any) -> Any:
+    """
+    Parameters reduced to their types and lengths ('str[12]', 'int', None)
+    so neither the log nor the debug endpoint carries emails, phone or card
+    numbers.
+    """
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {key: redact(value) for key, value in params.items()}
+    if isinstance(params, (list, tuple)):
+        return [redact(value) for value in params]
+    if isinstance(params, (str, bytes, memoryview)):
+        return f'{type(params).__name__}[{len(params)}]'
+    return type(params).__name__
+
+
+class SlowQueryLog:
+    """
+    Statements slower than a threshold, grouped by normalized shape.
+
+    attach() instruments a pooled connection (see request_trace.instrument)
+    so every statement is timed across its execute and fetch calls. The
+    first time a statement crosses the threshold it is logged with its
+    redacted parameters (see redact), elapsed time and EXPLAIN QUERY PLAN;
+    the plan is captured once per shape. Fetches after that add to the
+    shape's totals. The aggregates back GET /debug/slow-queries.
+    Only the slow path takes the lock.
+    """
+
+    def __init__(self, threshold_ms: float, max_shapes: int = MAX_SHAPES):
+        self.threshold = threshold_ms / 1000.0
+        self.max_shapes = max_shapes
+        self._shapes: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def attach(self, conn: sqlite3.Connection) -> None:
+        """Time every statement run on a pooled connection."""
+        conn.slow_log = self
+        instrument(conn)
+
+    # ---------- recording ----------
+
+    def record(self, conn: sqlite3.Connection, sql: str, params: Any, elapsed: float) -> str:
+        """
+        Log a statement that just crossed the threshold.
+        :return: the shape key, for extend()
+        """
+        shape = normalize_sql(sql)
+        key = hashlib.sha1(shape.encode('utf-8')).hexdigest()[:12]
+        with self._lock:
+            entry = self._shapes.get(key)
+            new_shape = entry is None
+            if new_shape:
+                if len(self._shapes) >= self.max_shapes:
+                    self._evict()
+                entry = self._shapes[key] = {
+                    'id': key, 'sql': shape, 'count': 0, 'totalMs': 0.0, 'maxMs': 0.0,
+                    'plan': None, 'firstSeen': datetime.now().isoformat(timespec='seconds'),
+                }
+            entry['count'] += 1
+            entry['totalMs'] += elapsed * 1000
+            entry['maxMs'] = max(entry['maxMs'], elapsed * 1000)
+            entry['lastParams'] = redact(params)
+            entry['lastSeen'] = datetime.now().isoformat(timespec='seconds')
+        if new_shape:
+            entry['plan'] = explain(conn, sql, params)
+        logger.warning(json.dumps({
+            'slowQuery': key,
+            'elapsedMs': round(elapsed * 1000, 3),
+            'sql': shape,
+            'params': redact(params),
+            **({'plan': entry['plan']} if new_shape else {}),
+        }))
+        return key
+
+    def extend(self, key: str, elapsed: float, statement_total: float) -> None:
+        """Add fetch time spent on a statement after it was recorded."""
+        with self._lock:
+            entry = self._shapes.get(key)
+            if entry is not None:
+                entry['totalMs'] += elapsed * 1000
+                entry['maxMs'] = max(entry['maxMs'], statement_total * 1000)
+
+    def _evict(self) -> None:
+        """Drop the shape with the least total time."""
+        victim = min(self._shapes.values(), key=lambda e: e['totalMs'])
+        del self._shapes[victim['id']]
+
+    # ---------- reporting ----------
+
+    def top(self, limit: int = 20, sort: str = 'totalMs') -> List[Dict[str, Any]]:
+        """Shapes ordered by totalMs, maxMs or count, with their average."""
+        with self._lock:
+            entries = [dict(entry) for entry in self._shapes.values()]
+        for entry in entries:
+            entry['avgMs'] = entry['totalMs'] / entry['count']
+        entries.sort(key=lambda e: e[sort], reverse=True)
+        return entries[:limit]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._shapes.clear()
+
+
+def explain(conn: sqlite3.Connection, sql: str, params: Any) -> Optional[List[str]]:
+    """
+    EXPLAIN QUERY PLAN for a statement, as indented lines, or None if it
+    cannot be explained (scripts, executemany, bad parameters).
+    """
+    if params is None:
+        return None
+    try:
+        # The base-class method, so the EXPLAIN itself is not timed.
+        rows = sqlite3.Connection.execute(conn, 'EXPLAIN QUERY PLAN ' + sql, params).fetchall()
+    except sqlite3.Error as e:
+        logger.debug(f"Could not explain slow query: {e}")
+        return None
+    depth = {0: 0}
+    lines = []
+    for row in rows:
+        node, parent, detail = row[0], row[1], row[3]
+        depth[node] = depth.get(parent, 0) + 1
+        lines.append('  ' * (depth[node] - 1) + detail)
+    return lines
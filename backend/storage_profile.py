@@ -0,0 +1,126 @@
+import os
+import sqlite3
+import logging
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Named SQLite storage presets. All of them run in WAL mode so readers never
+# block the writer; they differ in how hard commits are flushed to disk and
+# how much memory SQLite may use for caching.
+#
+#   durable    - every commit is fsynced (survives power loss), small caches
+#   balanced   - fsync only at checkpoints; a power cut may roll back the
+#                last few commits but never corrupts the database
+#   throughput - no fsync at all plus large caches; only for replicas,
+#                benchmarks and bulk loads that can be re-run
+PROFILES: Dict[str, Dict[str, Any]] = {
+    'durable': {
+        'journal_mode': 'WAL',
+        'synchronous': 'FULL',
+        'mmap_size': 0,
+        'cache_size': -16000,          # KiB (negative = size, not pages)
+        'temp_store': 'DEFAULT',
+        'busy_timeout': 5000,          # ms
+        'wal_autocheckpoint': 1000,    # pages
+        'journal_size_limit': 64 * 1024 * 1024,
+    },
+    'balanced': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -64000,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000,
+        'wal_autocheckpoint': 1000,
+        'journal_size_limit': 64 * 1024 * 1024,
+    },
+    'throughput': {
+        'journal_mode': 'WAL',
+        'synchronous': 'OFF',
+        'mmap_size': 1024 * 1024 * 1024,
+        'cache_size': -262144,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 10000,
+        'wal_autocheckpoint': 4000,
+        'journal_size_limit': 256 * 1024 * 1024,
+    },
+}
+
+DEFAULT_PROFILE = 'balanced'
+
+# Settings that are stored in the database file rather than per connection.
+DATABASE_SETTINGS = ('journal_mode',)
+CONNECTION_SETTINGS = ('synchronous', 'mmap_size', 'cache_size', 'temp_store',
+                       'busy_timeout', 'wal_autocheckpoint', 'journal_size_limit')
+
+# SQLite reports these pragmas as integers; map them back to their names.
+_PRAGMA_NAMES = {
+    'synchronous': {0: 'OFF', 1: 'NORMAL', 2: 'FULL', 3: 'EXTRA'},
+    'temp_store': {0: 'DEFAULT', 1: 'FILE', 2: 'MEMORY'},
+}
+
+
+def resolve_profile(name: Optional[str] = None,
+                    overrides: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Build the settings for a named profile.
+
+    Individual settings can be overridden with SQLITE_<SETTING> environment
+    variables (e.g. SQLITE_MMAP_SIZE=0) or the `overrides` mapping.
+    :param name: profile name, defaults to DEFAULT_PROFILE
+    :param overrides: explicit per-setting overrides
+    :return: dict of pragma name to value, plus the profile name under 'name'
+    """
+    name = name or DEFAULT_PROFILE
+    if name not in PROFILES:
+        raise ValueError(f"Unknown storage profile '{name}'. "
+                         f"Choose one of: {', '.join(PROFILES)}")
+    settings = dict(PROFILES[name])
+    for key in settings:
+        env_value = os.environ.get(f'SQLITE_{key.upper()}')
+        if env_value is not None:
+            settings[key] = env_value
+    if overrides:
+        settings.update(overrides)
+    settings['name'] = name
+    return settings
+
+
+def _pragma(conn: sqlite3.Connection, key: str, value: Any) -> None:
+    # Pragma values cannot be bound as parameters; they come from PROFILES or
+    # the environment, never from requests.
+    conn.execute(f'PRAGMA {key} = {value}')
+
+
+def apply_database_settings(conn: sqlite3.Connection, profile: Dict[str, Any]) -> None:
+    """Apply the settings that persist in the database file (run once at startup)."""
+    mode = conn.execute(f"PRAGMA journal_mode = {profile['journal_mode']}").fetchone()[0]
+    if mode.upper() != str(profile['journal_mode']).upper():
+        logger.warning(f"Requested journal_mode={profile['journal_mode']} but SQLite kept {mode}")
+
+
+def apply_connection_settings(conn: sqlite3.Connection, profile: Dict[str, Any]) -> None:
+    """Apply the per-connection pragmas of a profile to a freshly opened connection."""
+    for key in CONNECTION_SETTINGS:
+        _pragma(conn, key, profile[key])
+
+
+def checkpoint(conn: sqlite3.Connection, mode: str = 'PASSIVE') -> Dict[str, int]:
+    """
+    Run a WAL checkpoint.
+    :param mode: PASSIVE, FULL, RESTART or TRUNCATE
+    :return: busy flag and WAL/checkpointed page counts
+    """
+    busy, log_pages, checkpointed = conn.execute(f'PRAGMA wal_checkpoint({mode})').fetchone()
+    return {'busy': busy, 'walPages': log_pages, 'checkpointedPages': checkpointed}
+
+
+def report_settings(conn: sqlite3.Connection) -> Dict[str, Any]:
+    """Read back the storage settings actually in effect on a connection."""
+    report = {}
+    for key in DATABASE_SETTINGS + CONNECTION_SETTINGS + ('page_size',):
+        value = conn.execute(f'PRAGMA {key}').fetchone()[0]
+        report[key] = _PRAGMA_NAMES.get(key, {}).get(value, value)
+    report['sqlite_version'] = sqlite3.sqlite_version
+    return report
@@ -0,0 +1,79 @@
+import json
+import sqlite3
+import logging
+from typing import Any, Callable, Iterator, List
+
+from flask import Request, Response
+
+logger = logging.getLogger(__name__)
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+STREAM_CHUNK_ROWS = 1000
+
+
+def wants_stream(req: Request) -> bool:
+    """True when the client asked for a streamed response (?stream=1 or NDJSON)."""
+    return req.args.get('stream') in ('1', 'true') or wants_ndjson(req)
+
+
+def wants_ndjson(req: Request) -> bool:
+    """True when the client asked for newline-delimited JSON."""
+    return req.args.get('format') == 'ndjson' or NDJSON_MIMETYPE in req.headers.get('Accept', '')
+
+
+def iter_row_chunks(acquire: Callable[[], sqlite3.Connection], sql: str, params: List[Any],
+                    chunk_rows: int = STREAM_CHUNK_ROWS) -> Iterator[List[sqlite3.Row]]:
+    """
+    Run a query on its own pooled connection and yield rows chunk by chunk.
+
+    The connection is held for the life of the generator (which outlives the
+    request context) and handed back when it is exhausted or closed.
+    """
+    conn = acquire()
+    try:
+        cursor = conn.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows:
+                break
+            yield rows
+    finally:
+        conn.close()
+
+
+def _encode(row: sqlite3.Row) -> str:
+    return json.dumps(dict(row), separators=(',', ':'))
+
+
+def iter_ndjson(chunks: Iterator[List[sqlite3.Row]]) -> Iterator[bytes]:
+    """Encode row chunks as NDJSON, one object per line."""
+    for rows in chunks:
+        yield ''.join(_encode(row) + '\n' for row in rows).encode('utf-8')
+
+
+def iter_json_array(chunks: Iterator[List[sqlite3.Row]]) -> Iterator[bytes]:
+    """Encode row chunks as a single JSON array without materializing it."""
+    yield b'['
+    first = True
+    for rows in chunks:
+        body = ','.join(_encode(row) for row in rows)
+        if not first:
+            body = ',' + body
+        first = False
+        yield body.encode('utf-8')
+    yield b']'
+
+
+def stream_response(acquire: Callable[[], sqlite3.Connection], sql: str, params: List[Any],
+                    ndjson: bool = False, chunk_rows: int = STREAM_CHUNK_ROWS) -> Response:
+    """
+    Build a chunked response that streams a query's rows.
+
+    Memory use is bounded by one chunk of rows regardless of result size.
+    :param acquire: callable returning a connection; close() hands it back
+    :param ndjson: emit NDJSON instead of a JSON array
+    """
+    chunks = iter_row_chunks(acquire, sql, params, chunk_rows)
+    if ndjson:
+        return Response(iter_ndjson(chunks), mimetype=NDJSON_MIMETYPE)
+    return Response(iter_json_array(chunks), mimetype='application/json')
@@ -0,0 +1,27 @@
+import os
+import sys
+import logging
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+sys.path.insert(0, os.path.join(HERE, '..', '..'))
+
+logging.disable(logging.INFO)
+
+from create_database import make_synthetic_database  # noqa: E402
+
+# Scale factors the synthetic_db fixture is built at, e.g. SYNTHETIC_SCALES=0.01,0.1
+SYNTHETIC_SCALES = [float(scale) for scale in os.environ.get('SYNTHETIC_SCALES', '0.01').split(',')]
+
+
+@pytest.fixture(scope='session', params=SYNTHETIC_SCALES, ids=lambda scale: f'scale-{scale:g}')
+def synthetic_db(request, tmp_path_factory) -> str:
+    """
+    Path of a migrated database filled with synthetic data, built once per
+    session at each scale in SYNTHETIC_SCALES (seed from SYNTHETIC_SEED).
+    Tests using it must not write to it.
+    """
+    path = tmp_path_factory.mktemp('synthetic') / f'metro-{request.param:g}.db'
+    return make_synthetic_database(str(path), request.param, int(os.environ.get('SYNTHETIC_SEED', '42')))
@@ -0,0 +1,69 @@
+"""
+The origin-destination matrix: the NumPy path agrees with GROUP BY, and the
+station ID bound and trip scan come from one snapshot, so trips committed
+while it runs cannot push a key past the matrix.
+"""
+import sqlite3
+
+import pytest
+
+import od_matrix
+from od_matrix import parse_hours
+from migrations import migrate
+
+
+@pytest.fixture
+def od_db(tmp_path):
+    path = str(tmp_path / 'od.db')
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    migrate(conn)
+    conn.execute("INSERT INTO Passenger (FirstName, LastName, Email, RegistrationDate) "
+                 "VALUES ('A', 'B', 'a@example.com', '2025-01-01')")
+    conn.execute("INSERT INTO Card (CardNumber, Balance, IssueDate, Status, PassengerID, CardTypeID) "
+                 "VALUES ('C1', 100, '2025-01-01', 'Active', 1, 1)")
+    conn.execute("INSERT INTO Trip (EntryTime, ExitTime, FareAmount, CardID, EntryStationID, ExitStationID) "
+                 "VALUES ('2025-01-02 08:00:00', '2025-01-02 08:20:00', 25, 1, 1, 2)")
+    conn.commit()
+    yield path
+    conn.close()
+
+
+@pytest.mark.parametrize('build', [od_matrix.od_matrix, od_matrix.od_matrix_sql])
+def test_trip_committed_after_the_bound_is_not_counted(od_db, monkeypatch, build):
+    bound = od_matrix.station_id_bound
+
+    def bound_then_new_station(conn):
+        size = bound(conn)
+        writer = sqlite3.connect(od_db)
+        writer.execute("INSERT INTO Station (StationID, StationName) VALUES (40, 'Airport')")
+        writer.execute("INSERT INTO Trip (EntryTime, ExitTime, FareAmount, CardID, EntryStationID, ExitStationID) "
+                       "VALUES ('2025-01-02 09:00:00', '2025-01-02 09:40:00', 60, 1, 40, 1)")
+        writer.commit()
+        writer.close()
+        return size
+
+    monkeypatch.setattr(od_matrix, 'station_id_bound', bound_then_new_station)
+    conn = sqlite3.connect(od_db)
+    matrix = build(conn)
+    assert matrix.total == 1
+    assert not conn.in_transaction
+    conn.close()
+
+
+@pytest.mark.parametrize('filters', [
+    {},
+    {'date_from': '2025-01-15', 'date_to': '2025-02-01'},
+    {'hours': parse_hours('7-10')},
+    {'hours': parse_hours('22-2')},
+    {'card_type_id': 2},
+], ids=['all', 'dates', 'peak', 'overnight', 'card-type'])
+def test_numpy_matches_group_by(synthetic_db, filters):
+    conn = sqlite3.connect(f'file:{synthetic_db}?mode=ro', uri=True)
+    try:
+        vectorized = od_matrix.od_matrix(conn, chunk_rows=1000, **filters)
+        grouped = od_matrix.od_matrix_sql(conn, **filters)
+    finally:
+        conn.close()
+    assert vectorized.total > 0
+    assert (vectorized.counts == grouped.counts).all()
@@ -0,0 +1,174 @@
+"""
+EXPLAIN QUERY PLAN regression tests for the SQL behind each endpoint.
+
+Every query the endpoints issue against the large, unbounded tables (Trip,
+Transaction, Card, Passenger) is explained on a database with the full
+schema and managed index set; a test fails when its plan contains a full
+table SCAN of one of them. Scans that are expected, such as walking
+Passenger in primary-key order under a LIMIT, are allowed explicitly per
+query. The checks run on a fresh database (or QUERY_PLAN_DB, see
+check_query_plans.py) and again on synthetic data, where the planner sees
+real row counts.
+"""
+import os
+import re
+import sqlite3
+from typing import Any, Dict, List, NamedTuple, Sequence, Tuple
+
+import pytest
+
+import app as backend
+from pagination import build_keyset_query, encode_cursor
+
+LARGE_TABLES = {'Trip', 'Transaction', 'Card', 'Passenger'}
+
+# "SCAN t" (full table scan) vs "SCAN t USING INDEX ..." / "SCAN t USING COVERING INDEX ..."
+_FULL_SCAN = re.compile(r'^SCAN (\S+)$')
+_TABLE_ALIAS = re.compile(r'(?:FROM|JOIN)\s+\[?(\w+)\]?(?:\s+(?:AS\s+)?(\w+))?', re.IGNORECASE)
+
+
+class QueryCheck(NamedTuple):
+    name: str
+    sql: str
+    params: Sequence[Any] = ()
+    allowed_scans: Tuple[str, ...] = ()
+
+
+def _page(name: str, select_sql: str, order_by, descending: bool, filters=(), params=(),
+          after: bool = False, allowed_scans: Tuple[str, ...] = ()) -> QueryCheck:
+    cursor = encode_cursor(['2025-01-01 00:00:00', 1][-len(order_by):]) if after else None
+    sql, values = build_keyset_query(select_sql, order_by, descending, list(filters),
+                                     list(params), cursor, 101)
+    return QueryCheck(name, sql, values, allowed_scans)
+
+
+def endpoint_queries() -> List[QueryCheck]:
+    """Every query the endpoints run against the large tables."""
+    checks = [
+        QueryCheck('dashboard: recent transactions', '''
+            SELECT t.TransactionID, t.Amount, t.TransactionDate, t.TransactionType,
+                   c.CardNumber, p.FirstName, p.LastName
+            FROM [Transaction] t
+            JOIN Card c ON t.CardID = c.CardID
+            JOIN Passenger p ON c.PassengerID = p.PassengerID
+            ORDER BY t.TransactionDate DESC
+            LIMIT 5
+        '''),
+        QueryCheck('dashboard: counters', 'SELECT * FROM DashboardCounters WHERE ID = 1'),
+        QueryCheck('passenger by id', 'SELECT * FROM Passenger WHERE PassengerID = ?', (1,)),
+        QueryCheck('card by id', 'SELECT * FROM Card WHERE CardID = ?', (1,)),
+    ]
+
+    passengers = 'SELECT * FROM Passenger'
+    passenger_order = [('PassengerID', 'PassengerID')]
+    # Primary-key order under LIMIT stops after one page, so the scan is bounded.
+    checks += [
+        _page('GET /passengers', passengers, passenger_order, False, allowed_scans=('Passenger',)),
+        _page('GET /passengers (after)', passengers, passenger_order, False, after=True),
+        _page('GET /passengers?email', passengers, passenger_order, False, ['Email = ?'], ['a@b.c']),
+        _page('GET /passengers?from&to', passengers, passenger_order, False,
+              ['RegistrationDate >= ?', 'RegistrationDate < ?'], ['2025-01-01', '2025-02-01']),
+    ]
+
+    cards = '''
+        SELECT c.*, p.FirstName, p.LastName, ct.TypeName
+        FROM Card c
+        LEFT JOIN Passenger p ON c.PassengerID = p.PassengerID
+        LEFT JOIN CardType ct ON c.CardTypeID = ct.CardTypeID
+    '''
+    card_order = [('c.CardID', 'CardID')]
+    checks += [
+        _page('GET /cards', cards, card_order, False, allowed_scans=('c',)),
+        _page('GET /cards (after)', cards, card_order, False, after=True),
+        _page('GET /cards?passengerId', cards, card_order, False, ['c.PassengerID = ?'], [1]),
+        _page('GET /cards?status', cards, card_order, False, ['c.Status = ?'], ['Blocked']),
+        _page('GET /cards?cardTypeId', cards, card_order, False, ['c.CardTypeID = ?'], [1]),
+    ]
+
+    trip_filters = [
+        ('', [], []),
+        ('?cardId', ['t.CardID = ?'], [1]),
+        ('?passengerId', ['c.PassengerID = ?'], [1]),
+        ('?stationId', ['(t.EntryStationID = ? OR t.ExitStationID = ?)'], [1, 1]),
+        ('?status=open', ['t.ExitTime IS NULL'], []),
+        ('?from&to', ['t.EntryTime >= ?', 't.EntryTime < ?'], ['2025-01-01', '2025-02-01']),
+    ]
+    for suffix, filters, params in trip_filters:
+        for after in (False, True):
+            label = f"GET /trips{suffix}{' (after)' if after else ''}"
+            checks.append(_page(label, backend.TRIPS_SELECT, backend.TRIPS_ORDER, True,
+                                filters, params, after))
+
+    tx_filters = [
+        ('', [], []),
+        ('?cardId', ['t.CardID = ?'], [1]),
+        ('?passengerId', ['c.PassengerID = ?'], [1]),
+        ('?from&to', ['t.TransactionDate >= ?', 't.TransactionDate < ?'], ['2025-01-01', '2025-02-01']),
+    ]
+    for suffix, filters, params in tx_filters:
+        for after in (False, True):
+            label = f"GET /transactions{suffix}{' (after)' if after else ''}"
+            checks.append(_page(label, backend.TRANSACTIONS_SELECT, backend.TRANSACTIONS_ORDER, True,
+                                filters, params, after))
+    return checks
+
+
+def _aliases(sql: str) -> Dict[str, str]:
+    """Map each alias (or bare table name) in a query to its table."""
+    aliases = {}
+    for table, alias in _TABLE_ALIAS.findall(sql):
+        aliases[table] = table
+        if alias and alias.upper() not in ('ON', 'WHERE', 'ORDER', 'LEFT', 'JOIN', 'LIMIT'):
+            aliases[alias] = table
+    return aliases
+
+
+def check_query(conn: sqlite3.Connection, check: QueryCheck) -> Tuple[List[str], List[str]]:
+    """
+    Explain one query.
+    :return: (plan detail lines, list of violations)
+    """
+    plan = [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + check.sql, list(check.params))]
+    aliases = _aliases(check.sql)
+    violations = []
+    for detail in plan:
+        match = _FULL_SCAN.match(detail)
+        if not match:
+            continue
+        alias = match.group(1)
+        if aliases.get(alias, alias) in LARGE_TABLES and alias not in check.allowed_scans:
+            violations.append(detail)
+    return plan, violations
+
+
+
+@pytest.fixture(scope='module')
+def plan_conn(tmp_path_factory):
+    path = os.environ.get('QUERY_PLAN_DB')
+    if not path:
+        path, saved = str(tmp_path_factory.mktemp('plans') / 'plans.db'), backend.DB_PATH
+        backend.DB_PATH = path
+        try:
+            backend.initialize_database()
+        finally:
+            backend.DB_PATH = saved
+            backend.reset_db_pool()
+    conn = sqlite3.connect(path)
+    yield conn
+    conn.close()
+
+
+@pytest.mark.parametrize('check', endpoint_queries(), ids=lambda check: check.name)
+def test_no_full_scan_of_large_tables(plan_conn, check):
+    plan, violations = check_query(plan_conn, check)
+    assert violations == [], '\n'.join(plan)
+
+
+@pytest.mark.parametrize('check', endpoint_queries(), ids=lambda check: check.name)
+def test_no_full_scan_on_synthetic_data(synthetic_db, check):
+    conn = sqlite3.connect(f'file:{synthetic_db}?mode=ro', uri=True)
+    try:
+        plan, violations = check_query(conn, check)
+    finally:
+        conn.close()
+    assert violations == [], '\n'.join(plan)
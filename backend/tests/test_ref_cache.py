@@ -0,0 +1,50 @@
+"""
+Reference data versions live in the database (RefVersion), so changes made
+outside this server process still invalidate cached bodies and ETags and
+reload the fare matrix.
+"""
+import sqlite3
+
+import pytest
+
+import app as backend
+
+
+@pytest.fixture
+def client(tmp_path):
+    saved = backend.DB_PATH
+    backend.DB_PATH = str(tmp_path / 'ref.db')
+    backend.initialize_database()
+    backend.reset_db_pool()
+    yield backend.app.test_client()
+    backend.DB_PATH = saved
+    backend.reset_db_pool()
+
+
+def test_write_from_another_connection_invalidates_the_etag(client):
+    first = client.get('/stations')
+    etag = first.headers['ETag']
+    assert client.get('/stations', headers={'If-None-Match': etag}).status_code == 304
+
+    other = sqlite3.connect(backend.DB_PATH)
+    other.execute("INSERT INTO Station (StationName, LineColor) VALUES ('Airport', 'Green')")
+    other.commit()
+    other.close()
+
+    second = client.get('/stations', headers={'If-None-Match': etag})
+    assert second.status_code == 200
+    assert second.headers['ETag'] != etag
+    assert len(second.get_json()) == len(first.get_json()) + 1
+
+
+def test_fare_change_from_another_connection_reprices(client):
+    client.post('/fare-rules', json={'StartStationID': 1, 'EndStationID': 2,
+                                     'FareType': 'Anytime', 'FareAmount': 10})
+    assert client.get('/fares/quote?from=1&to=2').get_json()['fare'] == 10
+
+    other = sqlite3.connect(backend.DB_PATH)
+    other.execute('UPDATE FareRule SET FareAmount = 12.5 WHERE StartStationID = 1 AND EndStationID = 2')
+    other.commit()
+    other.close()
+
+    assert client.get('/fares/quote?from=1&to=2').get_json()['fare'] == 12.5
@@ -0,0 +1,303 @@
+import sqlite3
+import threading
+import time
+import logging
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from fare_engine import FareEngine
+
+logger = logging.getLogger(__name__)
+
+# TransactionType recorded for the fare debited at tap-out.
+FARE_TRANSACTION_TYPE = 'Fare'
+
+# Serializes run_immediate() writers within this process. Threads queue here
+# in order instead of in SQLite's busy handler, which retries on a sleep
+# schedule of up to 100 ms and is what drives tail latency under load.
+# Other processes are still held off by busy_timeout.
+_write_lock = threading.Lock()
+
+
+class TripOpError(Exception):
+    """A write that was refused; carries the HTTP status to answer with."""
+
+    def __init__(self, message: str, status: int):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def run_immediate(conn: sqlite3.Connection, op: Callable[[sqlite3.Connection], Any],
+                  on_lock_wait: Optional[Callable[[float], None]] = None) -> Any:
+    """
+    Run op(conn) in its own BEGIN IMMEDIATE transaction.
+
+    Taking the write lock up front means the reads inside op see the rows
+    they are about to change, and a busy database waits at BEGIN instead of
+    failing halfway through.
+    :param conn: Connection object
+    :param op: callable doing the reads and writes; must not commit
+    :param on_lock_wait: called with the seconds spent getting the write lock
+    :return: whatever op returns
+    """
+    if conn.in_transaction:
+        conn.commit()
+    started = time.perf_counter()
+    with _write_lock:
+        conn.execute('BEGIN IMMEDIATE')
+        if on_lock_wait is not None:
+            on_lock_wait(time.perf_counter() - started)
+        try:
+            result = op(conn)
+            conn.commit()
+            return result
+        except BaseException:
+            conn.rollback()
+            raise
+
+
+def exit_trip(conn: sqlite3.Connection, engine: FareEngine, trip_id: int,
+              exit_station_id: int, exit_time: str) -> Dict[str, Any]:
+    """
+    Complete an open trip: price it, debit the card and record the fare.
+
+    Runs inside the caller's transaction (see run_immediate). The fare comes
+    from the in-memory fare matrix, using the card's type and the entry time
+    to decide the period; call engine.refresh() before opening the
+    transaction.
+    :param conn: Connection object
+    :param engine: loaded FareEngine
+    :param trip_id: TripID to close
+    :param exit_station_id: StationID where the passenger tapped out
+    :param exit_time: exit timestamp ('YYYY-MM-DD HH:MM:SS' or ISO 8601, no UTC
+                      offset); refused with 400 if malformed or before the entry
+    :return: dict describing the completed trip
+    """
+    row = conn.execute('''
+        SELECT t.ExitTime, t.EntryTime, t.EntryStationID, t.CardID,
+               c.CardTypeID, c.Balance, c.Status
+        FROM Trip t
+        JOIN Card c ON t.CardID = c.CardID
+        WHERE t.TripID = ?
+    ''', (trip_id,)).fetchone()
+    if row is None:
+        raise TripOpError("Trip not found", 404)
+    current_exit, entry_time, entry_station_id, card_id, card_type_id, balance, status = row
+    if current_exit is not None:
+        raise TripOpError("Trip already completed", 409)
+    if status != 'Active':
+        raise TripOpError(f"Card is {status}", 403)
+    try:
+        exit_time = _parse_time(exit_time)
+    except (ValueError, TypeError):
+        raise TripOpError("Invalid exitTime; expected 'YYYY-MM-DD HH:MM:SS'", 400)
+    try:
+        stored_entry_time = _parse_time(entry_time)
+    except (ValueError, TypeError):
+        # The stored row is corrupt; nothing the client sent can fix that
+        logger.error(f"Trip {trip_id} has a malformed EntryTime: {entry_time!r}")
+        raise TripOpError("Trip has a malformed entry time", 500)
+    if exit_time < stored_entry_time:
+        raise TripOpError("exitTime is before the trip's entry time", 400)
+
+    quote = engine.quote(entry_station_id, exit_station_id, card_type_id, entry_time)
+    if quote is None:
+        raise TripOpError("No fare rule for this journey", 422)
+    fare = quote['fare']
+
+    # The balance guard is part of the UPDATE, so the card can never go negative.
+    updated = conn.execute('UPDATE Card SET Balance = Balance - ? WHERE CardID = ? AND Balance >= ?',
+                           (fare, card_id, fare)).rowcount
+    if not updated:
+        raise TripOpError("Insufficient balance", 402)
+
+    conn.execute('UPDATE Trip SET ExitTime = ?, ExitStationID = ?, FareAmount = ? WHERE TripID = ?',
+                 (exit_time, exit_station_id, fare, trip_id))
+    transaction_id = conn.execute('''
+        INSERT INTO [Transaction] (TransactionType, Amount, TransactionDate, CardID)
+        VALUES (?, ?, ?, ?)
+    ''', (FARE_TRANSACTION_TYPE, fare, exit_time, card_id)).lastrowid
+
+    return {
+        'tripId': trip_id,
+        'cardId': card_id,
+        'entryStationId': entry_station_id,
+        'exitStationId': exit_station_id,
+        'entryTime': entry_time,
+        'exitTime': exit_time,
+        'fare': fare,
+        'fareType': quote['fareType'],
+        'balance': round(balance - fare, 2),
+        'transactionId': transaction_id,
+    }
+
+
+def is_lock_error(error: sqlite3.Error) -> bool:
+    """True for 'database is locked' / 'busy' errors that are worth retrying."""
+    message = str(error).lower()
+    return isinstance(error, sqlite3.OperationalError) and ('locked' in message or 'busy' in message)
+
+
+# ---------- batch tap ingestion ----------
+
+TAP_EVENT_TYPES = ('entry', 'exit')
+MAX_BATCH_EVENTS = 100_000
+# Stay well under SQLite's bound-parameter limit for IN (...) lookups.
+_LOOKUP_CHUNK = 500
+
+
+def _parse_time(value: Any) -> str:
+    if value is None:
+        return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        raise ValueError("time must not carry a UTC offset")
+    return parsed.replace(microsecond=0).isoformat(sep=' ')
+
+
+def parse_tap_event(event: Any) -> Dict[str, Any]:
+    """
+    Validate one tap event: {"type": "entry"|"exit", "cardId", "stationId", "time"}.
+    :return: normalized event dict
+    :raises ValueError: if the event is malformed
+    """
+    if not isinstance(event, dict):
+        raise ValueError("event must be an object")
+    if event.get('type') not in TAP_EVENT_TYPES:
+        raise ValueError("type must be 'entry' or 'exit'")
+    if event.get('cardId') is None or event.get('stationId') is None:
+        raise ValueError("cardId and stationId are required")
+    return {
+        'type': event['type'],
+        'cardId': int(event['cardId']),
+        'stationId': int(event['stationId']),
+        'time': _parse_time(event.get('time')),
+    }
+
+
+def _fetch_in_chunks(conn: sqlite3.Connection, sql: str, ids: List[int]) -> List[tuple]:
+    """Run `sql` (containing one {marks} placeholder list) over ids in chunks."""
+    rows = []
+    for i in range(0, len(ids), _LOOKUP_CHUNK):
+        chunk = ids[i:i + _LOOKUP_CHUNK]
+        rows.extend(conn.execute(sql.format(marks=','.join('?' * len(chunk))), chunk).fetchall())
+    return rows
+
+
+def ingest_tap_events(conn: sqlite3.Connection, engine: FareEngine,
+                      events: List[Any]) -> List[Dict[str, Any]]:
+    """
+    Apply a batch of gate tap events and return one result per event.
+
+    Runs inside the caller's transaction (see run_immediate). Events are
+    replayed in time order (ties keep their batch order): an entry opens a
+    trip, an exit closes the card's latest trip opened at or before the exit
+    time, whether that trip is already in the database or was opened earlier
+    in the batch. Exits are priced in one vectorized fare matrix call and
+    debited against a running per-card balance, so a rejected event never
+    leaves a partial write. All writes are then issued with executemany.
+
+    Matching happens before pricing, so a refused exit (no fare rule,
+    insufficient balance) leaves its trip open in the database but is not
+    offered to later exits in the same batch.
+    :param conn: Connection object
+    :param engine: loaded FareEngine
+    :param events: raw event dicts
+    :return: list of {"index", "ok", "tripId", "fare", "error"} in input order
+    """
+    results: List[Dict[str, Any]] = [{'index': i, 'ok': False, 'tripId': None, 'fare': None, 'error': None}
+                                     for i in range(len(events))]
+    parsed: List[tuple] = []
+    for i, raw in enumerate(events):
+        try:
+            parsed.append((i, parse_tap_event(raw)))
+        except (ValueError, TypeError) as e:
+            results[i]['error'] = str(e)
+    parsed.sort(key=lambda item: item[1]['time'])
+
+    card_ids = sorted({event['cardId'] for _, event in parsed})
+    cards = {row[0]: [row[1], row[2], row[3]] for row in _fetch_in_chunks(
+        conn, 'SELECT CardID, CardTypeID, Balance, Status FROM Card WHERE CardID IN ({marks})', card_ids)}
+    stations = {row[0] for row in conn.execute('SELECT StationID FROM Station')}
+    exit_cards = sorted({event['cardId'] for _, event in parsed if event['type'] == 'exit'})
+    # Open trips already in the database, per card, oldest first (served by idx_trip_open).
+    open_trips: Dict[int, List[Dict[str, Any]]] = {}
+    for trip_id, card_id, entry_time, entry_station in _fetch_in_chunks(
+            conn, 'SELECT TripID, CardID, EntryTime, EntryStationID FROM Trip '
+                  'WHERE ExitTime IS NULL AND CardID IN ({marks}) ORDER BY CardID, EntryTime', exit_cards):
+        open_trips.setdefault(card_id, []).append(
+            {'tripId': trip_id, 'entryTime': entry_time, 'entryStation': entry_station, 'new': False})
+
+    # New trips get explicit IDs; safe because BEGIN IMMEDIATE holds the write lock.
+    next_trip_id = conn.execute(
+        "SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'Trip'), 0), "
+        "COALESCE((SELECT MAX(TripID) FROM Trip), 0))").fetchone()[0] + 1
+
+    # Pass 1: match exits to trips in time order.
+    new_trips: Dict[int, Dict[str, Any]] = {}
+    exits: List[tuple] = []
+    for i, event in parsed:
+        card = cards.get(event['cardId'])
+        if card is None:
+            results[i]['error'] = "Card not found"
+            continue
+        if event['stationId'] not in stations:
+            results[i]['error'] = "Station not found"
+            continue
+        if card[2] != 'Active':
+            results[i]['error'] = f"Card is {card[2]}"
+            continue
+        stack = open_trips.setdefault(event['cardId'], [])
+        if event['type'] == 'entry':
+            trip = {'tripId': next_trip_id, 'entryTime': event['time'], 'entryStation': event['stationId'],
+                    'cardId': event['cardId'], 'new': True, 'exit': None}
+            next_trip_id += 1
+            stack.append(trip)
+            new_trips[trip['tripId']] = trip
+            results[i].update(ok=True, tripId=trip['tripId'])
+        else:
+            trip = next((t for t in reversed(stack) if t['entryTime'] <= event['time']), None)
+            if trip is None:
+                results[i]['error'] = "No open trip for card"
+                continue
+            stack.remove(trip)
+            exits.append((i, event, trip))
+
+    # Pass 2: price every exit at once, then apply debits in time order.
+    quotes = engine.quote_many([t['entryStation'] for _, _, t in exits],
+                               [e['stationId'] for _, e, _ in exits],
+                               [cards[e['cardId']][0] for _, e, _ in exits],
+                               [t['entryTime'] for _, _, t in exits])
+    closed_trips, debits, fare_rows = [], {}, []
+    for (i, event, trip), fare in zip(exits, quotes['fare'].tolist()):
+        card = cards[event['cardId']]
+        if fare != fare:
+            results[i]['error'] = "No fare rule for this journey"
+        elif card[1] < fare:
+            results[i]['error'] = "Insufficient balance"
+        else:
+            card[1] -= fare
+            debits[event['cardId']] = debits.get(event['cardId'], 0.0) + fare
+            fare_rows.append((FARE_TRANSACTION_TYPE, fare, event['time'], event['cardId']))
+            results[i].update(ok=True, tripId=trip['tripId'], fare=fare)
+            if trip['new']:
+                trip['exit'] = (event['time'], event['stationId'], fare)
+            else:
+                closed_trips.append((event['time'], event['stationId'], fare, trip['tripId']))
+
+    # Pass 3: write everything.
+    conn.executemany(
+        'INSERT INTO Trip (TripID, EntryTime, ExitTime, FareAmount, CardID, EntryStationID, ExitStationID) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?)',
+        ((t['tripId'], t['entryTime'], t['exit'] and t['exit'][0], t['exit'] and t['exit'][2],
+          t['cardId'], t['entryStation'], t['exit'] and t['exit'][1]) for t in new_trips.values()))
+    conn.executemany(
+        'UPDATE Trip SET ExitTime = ?, ExitStationID = ?, FareAmount = ? WHERE TripID = ? AND ExitTime IS NULL',
+        closed_trips)
+    conn.executemany('UPDATE Card SET Balance = Balance - ? WHERE CardID = ?',
+                     ((amount, card_id) for card_id, amount in debits.items()))
+    conn.executemany(
+        'INSERT INTO [Transaction] (TransactionType, Amount, TransactionDate, CardID) VALUES (?, ?, ?, ?)',
+        fare_rows)
+    return results
@@ -0,0 +1,190 @@
+import queue
+import sqlite3
+import threading
+import time
+import logging
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+WriteOp = Callable[[sqlite3.Connection], Any]
+
+
+class WriteQueueFull(sqlite3.OperationalError):
+    """Raised when the write queue is at max_depth and the caller should back off."""
+
+
+class WriteQueue:
+    """
+    Background writer with group commit.
+
+    One thread owns the write connection and takes operations from a bounded
+    queue. An operation that finds the queue otherwise empty is committed
+    straight away, so a lone writer never waits for company; when others are
+    already queued behind it, everything that arrives within max_delay_ms of
+    the first (or until max_batch operations are gathered) runs in a single
+    BEGIN IMMEDIATE transaction, each operation inside its own SAVEPOINT, so
+    one commit (and one fsync) covers the whole group. An operation that
+    raises is rolled back to its savepoint and its caller gets the
+    exception; the rest of the group still commits.
+
+    Operations are callables taking the connection. They must not commit,
+    and should do all their reads inside the call so they see the state
+    left by the operations queued ahead of them.
+    """
+
+    def __init__(self, connect: Callable[[], sqlite3.Connection], max_batch: int = 64,
+                 max_delay_ms: float = 2.0, max_depth: int = 1000,
+                 on_lock_wait: Optional[Callable[[float], None]] = None):
+        if max_batch < 1 or max_depth < 1:
+            raise ValueError("max_batch and max_depth must be at least 1")
+        self.connect = connect
+        self.max_batch = max_batch
+        self.max_delay = max_delay_ms / 1000.0
+        self.on_lock_wait = on_lock_wait  # called with the seconds BEGIN IMMEDIATE waited
+        self._queue: 'queue.Queue[Optional[Tuple[WriteOp, Future]]]' = queue.Queue(max_depth)
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._stopping = False
+
+        self._ops = 0
+        self._failed_ops = 0
+        self._batches = 0
+        self._rejected = 0
+        self._max_batch_seen = 0
+
+    # ---------- callers ----------
+
+    def submit(self, op: WriteOp) -> Future:
+        """
+        Queue an operation without waiting for it.
+        :raises WriteQueueFull: if max_depth operations are already waiting
+        """
+        if self._stopping:
+            raise sqlite3.ProgrammingError("Write queue is stopped")
+        self._ensure_started()
+        future: Future = Future()
+        try:
+            self._queue.put_nowait((op, future))
+        except queue.Full:
+            self._rejected += 1
+            raise WriteQueueFull(f"Write queue is full ({self._queue.maxsize} operations waiting)")
+        return future
+
+    def execute(self, op: WriteOp, timeout: Optional[float] = None) -> Any:
+        """Queue an operation and wait for its committed result (or exception)."""
+        return self.submit(op).result(timeout)
+
+    # ---------- writer thread ----------
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='sqlite-writer', daemon=True)
+                self._thread.start()
+
+    def _gather(self, first: Tuple[WriteOp, Future]) -> Tuple[List[Tuple[WriteOp, Future]], bool]:
+        """Collect up to max_batch operations arriving within max_delay; report a stop request."""
+        batch = [first]
+        if self._queue.empty():
+            return batch, False
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self) -> None:
+        conn = self.connect()
+        try:
+            stop = False
+            while not stop:
+                first = self._queue.get()
+                if first is None:
+                    break
+                batch, stop = self._gather(first)
+                self._commit_group(conn, batch)
+        finally:
+            conn.close()
+
+    def _commit_group(self, conn: sqlite3.Connection, batch: List[Tuple[WriteOp, Future]]) -> None:
+        batch = [(op, future) for op, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        outcomes: List[Tuple[Future, bool, Any]] = []
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            started = time.perf_counter()
+            conn.execute('BEGIN IMMEDIATE')
+            if self.on_lock_wait is not None:
+                self.on_lock_wait(time.perf_counter() - started)
+            for op, future in batch:
+                conn.execute('SAVEPOINT write_op')
+                try:
+                    result = op(conn)
+                except Exception as e:
+                    conn.execute('ROLLBACK TO write_op')
+                    conn.execute('RELEASE write_op')
+                    outcomes.append((future, False, e))
+                else:
+                    conn.execute('RELEASE write_op')
+                    outcomes.append((future, True, result))
+            conn.commit()
+        except Exception as e:
+            # BEGIN or COMMIT failed: nothing in the group was written.
+            logger.error(f"Group commit of {len(batch)} operations failed: {e}")
+            try:
+                conn.rollback()
+            except sqlite3.Error:
+                pass
+            done = {id(future) for future, _, _ in outcomes}
+            outcomes = [(future, False, e if ok else value) for future, ok, value in outcomes]
+            outcomes += [(future, False, e) for _, future in batch if id(future) not in done]
+
+        self._batches += 1
+        self._ops += len(batch)
+        self._max_batch_seen = max(self._max_batch_seen, len(batch))
+        for future, ok, value in outcomes:
+            if ok:
+                future.set_result(value)
+            else:
+                self._failed_ops += 1
+                future.set_exception(value)
+
+    def stop(self, timeout: Optional[float] = 10.0) -> None:
+        """Finish the queued operations, then stop the writer and close its connection."""
+        self._stopping = True
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for /health."""
+        return {
+            'queued': self._queue.qsize(),
+            'maxDepth': self._queue.maxsize,
+            'maxBatch': self.max_batch,
+            'maxDelayMs': self.max_delay * 1000,
+            'ops': self._ops,
+            'failedOps': self._failed_ops,
+            'batches': self._batches,
+            'avgBatch': self._ops / self._batches if self._batches else 0.0,
+            'largestBatch': self._max_batch_seen,
+            'rejected': self._rejected,
+        }
@@ -1,9 +1,15 @@
 import sqlite3
+import datetime
 import os
+import sys
 import logging
 from pathlib import Path
 from typing import Optional, Dict, Any, List, Union
 
+# The schema is defined once, in backend/migrations.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+from migrations import migrate
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -33,7 +39,7 @@ def create_connection(db_file: str) -> Optional[sqlite3.Connection]:
 
 def create_tables_if_not_exist(conn: sqlite3.Connection) -> None:
     """
-    Create database tables if they don't exist
+    Create or upgrade the database schema using the backend migration engine
     :param conn: Connection object
     :return: None
     """
@@ -41,172 +47,12 @@ def create_tables_if_not_exist(conn: sqlite3.Connection) -> None:
         logger.error("No database connection provided")
         return
         
-    tables = {
-        'CardType': """
-        CREATE TABLE IF NOT EXISTS CardType (
-            CardTypeID INTEGER PRIMARY KEY AUTOINCREMENT,
-            TypeName TEXT NOT NULL UNIQUE,
-            BaseFareMultiplier REAL NOT NULL DEFAULT 1.00,
-            Description TEXT
-        )""",
-        
-        'Passenger': """
-        CREATE TABLE IF NOT EXISTS Passenger (
-            PassengerID INTEGER PRIMARY KEY AUTOINCREMENT,
-            FirstName TEXT NOT NULL,
-            LastName TEXT NOT NULL,
-            Email TEXT NOT NULL UNIQUE,
-            PhoneNumber TEXT UNIQUE,
-            RegistrationDate TEXT NOT NULL
-        )""",
-        
-        'Station': """
-        CREATE TABLE IF NOT EXISTS Station (
-            StationID INTEGER PRIMARY KEY AUTOINCREMENT,
-            StationName TEXT NOT NULL UNIQUE,
-            LineColor TEXT
-        )""",
-        
-        'Card': """
-        CREATE TABLE IF NOT EXISTS Card (
-            CardID INTEGER PRIMARY KEY AUTOINCREMENT,
-            CardNumber TEXT NOT NULL UNIQUE,
-            Balance REAL NOT NULL DEFAULT 0.00,
-            IssueDate TEXT NOT NULL,
-            Status TEXT NOT NULL CHECK (Status IN ('Active', 'Inactive', 'Blocked')),
-            PassengerID INTEGER,
-            CardTypeID INTEGER,
-            FOREIGN KEY (PassengerID) REFERENCES Passenger(PassengerID),
-            FOREIGN KEY (CardTypeID) REFERENCES CardType(CardTypeID)
-        )""",
-        
-        'Transaction': """
-        CREATE TABLE IF NOT EXISTS [Transaction] (
-            TransactionID INTEGER PRIMARY KEY AUTOINCREMENT,
-            TransactionType TEXT NOT NULL,
-            Amount REAL NOT NULL,
-            TransactionDate TEXT NOT NULL,
-            CardID INTEGER,
-            FOREIGN KEY (CardID) REFERENCES Card(CardID)
-        )""",
-        
-        'FareRule': """
-        CREATE TABLE IF NOT EXISTS FareRule (
-            FareRuleID INTEGER PRIMARY KEY AUTOINCREMENT,
-            StartStationID INTEGER NOT NULL,
-            EndStationID INTEGER NOT NULL,
-            FareType TEXT,
-            FareAmount REAL NOT NULL,
-            FOREIGN KEY (StartStationID) REFERENCES Station(StationID),
-            FOREIGN KEY (EndStationID) REFERENCES Station(StationID),
-            UNIQUE (StartStationID, EndStationID, FareType)
-        )""",
-        
-        'Trip': """
-        CREATE TABLE IF NOT EXISTS Trip (
-            TripID INTEGER PRIMARY KEY AUTOINCREMENT,
-            EntryTime TEXT NOT NULL,
-            ExitTime TEXT,
-            FareAmount REAL,
-            CardID INTEGER NOT NULL,
-            EntryStationID INTEGER NOT NULL,
-            ExitStationID INTEGER,
-            FOREIGN KEY (CardID) REFERENCES Card(CardID),
-            FOREIGN KEY (EntryStationID) REFERENCES Station(StationID),
-            FOREIGN KEY (ExitStationID) REFERENCES Station(StationID)
-        )"""
-    }
-    
     try:
-        cursor = conn.cursor()
-        
-        # Create tables
-        for table_name, create_sql in tables.items():
-            try:
-                cursor.execute(create_sql)
-                logger.info(f"Created/Verified table: {table_name}")
-            except sqlite3.Error as e:
-                logger.error(f"Error creating table {table_name}: {e}")
-                raise
-        
-        # Insert default card types if they don't exist
-        default_card_types = [
-            ('Regular', 1.0, 'Standard fare card'),
-            ('Student', 0.5, 'Discounted fare for students'),
-            ('Senior', 0.7, 'Discounted fare for senior citizens'),
-            ('Monthly', 0.9, 'Monthly subscription card')
-        ]
-        
-        cursor.execute("SELECT COUNT(*) FROM CardType")
-        if cursor.fetchone()[0] == 0:
-            cursor.executemany(
-                """
-                INSERT INTO CardType (TypeName, BaseFareMultiplier, Description)
-                VALUES (?, ?, ?)
-                """,
-                default_card_types
-            )
-            logger.info("Inserted default card types")
-        
-        conn.commit()
-        logger.info("Database schema initialized successfully")
-        
+        version = migrate(conn)
+        logger.info(f"Database schema initialized successfully (version {version})")
     except sqlite3.Error as e:
         logger.error(f"Error initializing database schema: {e}")
-        conn.rollback()
         raise
-        CREATE TABLE IF NOT EXISTS Card (
-            CardID INTEGER PRIMARY KEY AUTOINCREMENT,
-            CardNumber TEXT NOT NULL UNIQUE,
-            Balance REAL NOT NULL DEFAULT 0.00,
-            IssueDate TEXT NOT NULL,
-            Status TEXT NOT NULL CHECK (Status IN ('Active', 'Inactive', 'Blocked')),
-            PassengerID INTEGER,
-            CardTypeID INTEGER,
-            FOREIGN KEY (PassengerID) REFERENCES Passenger(PassengerID),
-            FOREIGN KEY (CardTypeID) REFERENCES CardType(CardTypeID)
-        );""")
-        
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS [Transaction] (
-            TransactionID INTEGER PRIMARY KEY AUTOINCREMENT,
-            TransactionType TEXT NOT NULL,
-            Amount REAL NOT NULL,
-            TransactionDate TEXT NOT NULL,
-            CardID INTEGER,
-            FOREIGN KEY (CardID) REFERENCES Card(CardID)
-        );""")
-        
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS FareRule (
-            FareRuleID INTEGER PRIMARY KEY AUTOINCREMENT,
-            StartStationID INTEGER NOT NULL,
-            EndStationID INTEGER NOT NULL,
-            FareType TEXT,
-            FareAmount REAL NOT NULL,
-            FOREIGN KEY (StartStationID) REFERENCES Station(StationID),
-            FOREIGN KEY (EndStationID) REFERENCES Station(StationID),
-            UNIQUE (StartStationID, EndStationID, FareType)
-        );""")
-        
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS Trip (
-            TripID INTEGER PRIMARY KEY AUTOINCREMENT,
-            EntryTime TEXT NOT NULL,
-            ExitTime TEXT,
-            FareAmount REAL,
-            CardID INTEGER NOT NULL,
-            EntryStationID INTEGER NOT NULL,
-            ExitStationID INTEGER,
-            FOREIGN KEY (CardID) REFERENCES Card(CardID),
-            FOREIGN KEY (EntryStationID) REFERENCES Station(StationID),
-            FOREIGN KEY (ExitStationID) REFERENCES Station(StationID)
-        );""")
-        
-        conn.commit()
-        print("Tables checked/created successfully.")
-    except sqlite3.Error as e:
-        print(f"Error creating tables: {e}")
 
 # ==============================================================================
 # == Part 2: INSERT Queries for Sample Data
@@ -228,19 +74,10 @@ def insert_sample_data(conn):
         ]
         cursor.executemany("INSERT OR IGNORE INTO Passenger (FirstName, LastName, Email, PhoneNumber, RegistrationDate) VALUES (?, ?, ?, ?, ?);", passengers)
         
-        stations = [
-            ('Central Station', 'Blue'), ('Market Square', 'Blue'),
-            ('University Stop', 'Red'), ('Tech Park', 'Red'),
-            ('City Airport', 'Green')
-        ]
-        cursor.executemany("INSERT OR IGNORE INTO Station (StationName, LineColor) VALUES (?, ?);", stations)
-        
-        card_types = [
-            ('Adult', 1.0, 'Standard adult card'), ('Student', 0.6, 'Discounted card for students'),
-            ('Senior', 0.5, 'Discounted card for senior citizens')
-        ]
-        cursor.executemany("INSERT OR IGNORE INTO CardType (TypeName, BaseFareMultiplier, Description) VALUES (?, ?, ?);", card_types)
-
+        # Stations and card types come from the migrations' defaults
+        # (DEFAULT_STATIONS, DEFAULT_CARD_TYPES): StationID 1-5 are Central
+        # Station, Downtown, University, City Park and Terminal; CardTypeID
+        # 1-3 are Regular (1.0), Student (0.5) and Senior (0.7).
         cards = [
             ('SNJ1001', 500.00, '2025-01-15', 'Active', 1, 1),
             ('PRI2002', 250.50, '2025-02-20', 'Active', 2, 2),
@@ -305,7 +142,7 @@ def perform_dml_commands(conn):
         if result:
             print(f"   Result -> Name: {result[0]} {result[1]}, Card: {result[2]}, New Status: {result[3]}")
 
-        print("\n3. DELETE: Deleting any fare rule that starts or ends at 'Tech Park' (StationID=4).")
+        print("\n3. DELETE: Deleting any fare rule that starts or ends at 'City Park' (StationID=4).")
         cursor.execute("DELETE FROM FareRule WHERE StartStationID = 4 OR EndStationID = 4;")
         rows_deleted = cursor.rowcount
         conn.commit()
@@ -327,8 +164,8 @@ def perform_dml_commands(conn):
         # DML Command 5: A more complex UPDATE to complete a trip
         print("\n5. UPDATE: Completing Rohan's in-progress trip (TripID=4).")
         trip_id_to_complete = 4
-        exit_station_id = 3 # University Stop
-        fare = 24.00 # Assume fare is calculated (40.00 base * 0.6 student multiplier)
+        exit_station_id = 3 # University
+        fare = 20.00 # Assume fare is calculated (40.00 base * 0.5 student multiplier)
         card_id_for_trip = 5 # Rohan's CardID
         
         # First, update the trip record with exit info
@@ -1,8 +1,23 @@
+import argparse
 import sqlite3
 import os
+import sys
+import time
 import logging
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Optional, Dict, Any, List, Union
+from typing import Optional, Dict, Any, Iterator, List, Union
+
+import numpy as np
+
+# The schema is defined once, in backend/migrations.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+from migrations import migrate
+from dashboard_counters import rebuild_counters
+from search import rebuild_search
+from rollups import backfill as backfill_rollups
+from fare_engine import peak_mask
+from storage_profile import resolve_profile, apply_database_settings, apply_connection_settings, checkpoint
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -29,7 +44,7 @@ def create_connection(db_file: str) -> Optional[sqlite3.Connection]:
 
 def create_tables_if_not_exist(conn: sqlite3.Connection) -> None:
     """
-    Create database tables if they don't exist
+    Create or upgrade the database schema using the backend migration engine
     :param conn: Connection object
     :return: None
     """
@@ -37,139 +52,11 @@ def create_tables_if_not_exist(conn: sqlite3.Connection) -> None:
         logger.error("No database connection provided")
         return
         
-    tables = {
-        'CardType': """
-        CREATE TABLE IF NOT EXISTS CardType (
-            CardTypeID INTEGER PRIMARY KEY AUTOINCREMENT,
-            TypeName TEXT NOT NULL UNIQUE,
-            BaseFareMultiplier REAL NOT NULL DEFAULT 1.00,
-            Description TEXT
-        )""",
-        
-        'Passenger': """
-        CREATE TABLE IF NOT EXISTS Passenger (
-            PassengerID INTEGER PRIMARY KEY AUTOINCREMENT,
-            FirstName TEXT NOT NULL,
-            LastName TEXT NOT NULL,
-            Email TEXT NOT NULL UNIQUE,
-            PhoneNumber TEXT UNIQUE,
-            RegistrationDate TEXT NOT NULL
-        )""",
-        
-        'Station': """
-        CREATE TABLE IF NOT EXISTS Station (
-            StationID INTEGER PRIMARY KEY AUTOINCREMENT,
-            StationName TEXT NOT NULL UNIQUE,
-            LineColor TEXT
-        )""",
-        
-        'Card': """
-        CREATE TABLE IF NOT EXISTS Card (
-            CardID INTEGER PRIMARY KEY AUTOINCREMENT,
-            CardNumber TEXT NOT NULL UNIQUE,
-            Balance REAL NOT NULL DEFAULT 0.00,
-            IssueDate TEXT NOT NULL,
-            Status TEXT NOT NULL CHECK (Status IN ('Active', 'Inactive', 'Blocked')),
-            PassengerID INTEGER,
-            CardTypeID INTEGER,
-            FOREIGN KEY (PassengerID) REFERENCES Passenger(PassengerID),
-            FOREIGN KEY (CardTypeID) REFERENCES CardType(CardTypeID)
-        )""",
-        
-        'Transaction': """
-        CREATE TABLE IF NOT EXISTS [Transaction] (
-            TransactionID INTEGER PRIMARY KEY AUTOINCREMENT,
-            TransactionType TEXT NOT NULL,
-            Amount REAL NOT NULL,
-            TransactionDate TEXT NOT NULL,
-            CardID INTEGER,
-            FOREIGN KEY (CardID) REFERENCES Card(CardID)
-        )""",
-        
-        'FareRule': """
-        CREATE TABLE IF NOT EXISTS FareRule (
-            FareRuleID INTEGER PRIMARY KEY AUTOINCREMENT,
-            StartStationID INTEGER NOT NULL,
-            EndStationID INTEGER NOT NULL,
-            FareType TEXT,
-            FareAmount REAL NOT NULL,
-            FOREIGN KEY (StartStationID) REFERENCES Station(StationID),
-            FOREIGN KEY (EndStationID) REFERENCES Station(StationID),
-            UNIQUE (StartStationID, EndStationID, FareType)
-        )""",
-        
-        'Trip': """
-        CREATE TABLE IF NOT EXISTS Trip (
-            TripID INTEGER PRIMARY KEY AUTOINCREMENT,
-            EntryTime TEXT NOT NULL,
-            ExitTime TEXT,
-            FareAmount REAL,
-            CardID INTEGER NOT NULL,
-            EntryStationID INTEGER NOT NULL,
-            ExitStationID INTEGER,
-            FOREIGN KEY (CardID) REFERENCES Card(CardID),
-            FOREIGN KEY (EntryStationID) REFERENCES Station(StationID),
-            FOREIGN KEY (ExitStationID) REFERENCES Station(StationID)
-        )"""
-    }
-    
     try:
-        cursor = conn.cursor()
-        
-        # Create tables
-        for table_name, create_sql in tables.items():
-            try:
-                cursor.execute(create_sql)
-                logger.info(f"Created/Verified table: {table_name}")
-            except sqlite3.Error as e:
-                logger.error(f"Error creating table {table_name}: {e}")
-                raise
-        
-        # Insert default card types if they don't exist
-        default_card_types = [
-            ('Regular', 1.0, 'Standard fare card'),
-            ('Student', 0.5, 'Discounted fare for students'),
-            ('Senior', 0.7, 'Discounted fare for senior citizens'),
-            ('Monthly', 0.9, 'Monthly subscription card')
-        ]
-        
-        cursor.execute("SELECT COUNT(*) FROM CardType")
-        if cursor.fetchone()[0] == 0:
-            cursor.executemany(
-                """
-                INSERT INTO CardType (TypeName, BaseFareMultiplier, Description)
-                VALUES (?, ?, ?)
-                """,
-                default_card_types
-            )
-            logger.info("Inserted default card types")
-        
-        # Insert some default stations if they don't exist
-        default_stations = [
-            ('Central Station', 'Blue'),
-            ('Downtown', 'Blue'),
-            ('University', 'Red'),
-            ('City Park', 'Green'),
-            ('Terminal', 'Red')
-        ]
-        
-        cursor.execute("SELECT COUNT(*) FROM Station")
-        if cursor.fetchone()[0] == 0:
-            cursor.executemany(
-                """
-                INSERT INTO Station (StationName, LineColor)
-                VALUES (?, ?)
-                """,
-                default_stations
-            )
-            logger.info("Inserted default stations")
-        
-        conn.commit()
-        logger.info("Database schema initialized successfully")
-        
+        version = migrate(conn)
+        logger.info(f"Database schema initialized successfully (version {version})")
     except sqlite3.Error as e:
         logger.error(f"Error initializing database schema: {e}")
-        conn.rollback()
         raise
 
 def insert_sample_data(conn: sqlite3.Connection) -> None:
@@ -235,15 +122,246 @@ def insert_sample_data(conn: sqlite3.Connection) -> None:
         conn.rollback()
         raise
 
+# ==================== SYNTHETIC DATA ====================
+
+# Row counts at scale factor 1. Stations and card types do not scale, like
+# the fixed-size tables in TPC benchmarks; everything else grows linearly.
+SCALE_ROWS = {
+    'passengers': 100_000,
+    'cards': 120_000,
+    'trips': 1_000_000,
+    'topups': 100_000,
+}
+SYNTHETIC_STATIONS = 50
+LINE_COLORS = ('Red', 'Blue', 'Green', 'Yellow', 'Purple')
+FIRST_NAMES = ('Aarav', 'Priya', 'Rohan', 'Ananya', 'Vikram', 'Meera', 'John', 'Jane',
+               'Alice', 'Omar', 'Sofia', 'Wei', 'Fatima', 'Lucas', 'Amara', 'Kenji')
+LAST_NAMES = ('Sharma', 'Patel', 'Iyer', 'Khan', 'Smith', 'Doe', 'Garcia', 'Chen',
+              'Okafor', 'Tanaka', 'Silva', 'Nair', 'Brown', 'Kumar', 'Haddad', 'Novak')
+TOPUP_AMOUNTS = np.array([100.0, 200.0, 500.0, 1000.0])
+# Share of trips starting in each hour, for weekdays and weekends.
+WEEKDAY_HOURS = np.array([1, 0, 0, 0, 1, 8, 30, 70, 95, 60, 30, 25, 28, 25, 24, 30,
+                          50, 85, 90, 55, 30, 18, 10, 4], dtype=float)
+WEEKEND_HOURS = np.array([3, 1, 0, 0, 0, 2, 6, 12, 20, 30, 40, 45, 45, 45, 42, 40,
+                          38, 36, 34, 30, 24, 16, 10, 6], dtype=float)
+LOAD_BATCH_ROWS = 500_000
+
+
+@contextmanager
+def bulk_load_mode(conn: sqlite3.Connection) -> Iterator[None]:
+    """
+    Speed up a bulk load: no fsync, large cache, and the managed indexes
+    and triggers dropped for the duration. On exit the saved index and
+    trigger DDL is replayed (indexes are built once, sorted) and the
+    trigger-maintained DashboardCounters, search indexes and rollups are
+    rebuilt from the loaded data and any archived history.
+    """
+    apply_connection_settings(conn, resolve_profile('throughput', {'wal_autocheckpoint': 0}))
+    saved = conn.execute(
+        "SELECT type, name, sql FROM sqlite_master "
+        "WHERE (type = 'index' AND name LIKE 'idx\\_%' ESCAPE '\\') OR type = 'trigger'").fetchall()
+    for kind, name, _ in saved:
+        conn.execute(f'DROP {kind.upper()} IF EXISTS {name}')
+    conn.commit()
+    try:
+        yield
+    finally:
+        for _, name, sql in saved:
+            conn.execute(sql)
+        # The RefVersion triggers were dropped too; count the load as a change
+        conn.execute('UPDATE RefVersion SET Version = Version + 1')
+        rebuild_counters(conn)
+        rebuild_search(conn)
+        backfill_rollups(conn)
+        conn.commit()
+        checkpoint(conn, 'TRUNCATE')
+        apply_connection_settings(conn, resolve_profile(os.environ.get('DB_STORAGE_PROFILE')))
+
+
+def _times_to_text(times: np.ndarray) -> List[str]:
+    """datetime64 values as 'YYYY-MM-DD HH:MM:SS' strings."""
+    return np.char.replace(np.datetime_as_string(times, unit='s'), 'T', ' ').tolist()
+
+
+def _sample_times(rng: np.random.Generator, count: int, day0: np.datetime64, days: int) -> np.ndarray:
+    """Timestamps over `days` days from day0 with weekday/weekend hourly profiles."""
+    day = rng.integers(0, days, count)
+    dates = day0 + day.astype('timedelta64[D]')
+    weekend = ((dates.astype(np.int64) + 3) % 7) >= 5
+    hours = np.where(weekend,
+                     rng.choice(24, count, p=WEEKEND_HOURS / WEEKEND_HOURS.sum()),
+                     rng.choice(24, count, p=WEEKDAY_HOURS / WEEKDAY_HOURS.sum()))
+    seconds = hours * 3600 + rng.integers(0, 3600, count)
+    return dates.astype('datetime64[s]') + seconds.astype('timedelta64[s]')
+
+
+def generate_synthetic_data(conn: sqlite3.Connection, scale: float = 1.0, seed: int = 42,
+                            start_date: str = '2025-01-01', days: int = 90) -> Dict[str, int]:
+    """
+    Load a deterministic synthetic data set sized by a scale factor.
+
+    At scale 1 this is 100k passengers, 120k cards, 1M trips with their Fare
+    transactions, and 100k top-ups over `days` days. Trips follow weekday
+    morning/evening peaks, stations have skewed popularity, and fares are
+    priced from the generated Peak/Off-Peak fare rules and card type
+    multipliers. The same seed and scale always produce the same rows.
+    :param conn: Connection object to a migrated, empty database
+    :param scale: scale factor (e.g. 0.01 for tests, 10 for 10M trips)
+    :param seed: random seed
+    :param start_date: first day of the trip history
+    :param days: length of the trip history in days
+    :return: rows generated per table
+    """
+    if conn.execute('SELECT COUNT(*) FROM Passenger').fetchone()[0]:
+        raise ValueError("Synthetic data must be loaded into an empty database")
+    rng = np.random.default_rng(seed)
+    counts = {name: max(1, int(rows * scale)) for name, rows in SCALE_ROWS.items()}
+    day0 = np.datetime64(start_date, 'D')
+    started = time.perf_counter()
+
+    with bulk_load_mode(conn):
+        # Stations: the defaults from the migration plus generated ones.
+        existing = conn.execute('SELECT COUNT(*) FROM Station').fetchone()[0]
+        conn.executemany('INSERT INTO Station (StationName, LineColor) VALUES (?, ?)',
+                         [(f'Station {i:03d}', LINE_COLORS[i % len(LINE_COLORS)])
+                          for i in range(existing + 1, SYNTHETIC_STATIONS + 1)])
+        station_ids = np.array([row[0] for row in conn.execute('SELECT StationID FROM Station ORDER BY StationID')])
+        stations = len(station_ids)
+
+        # Fare rules for every ordered pair: distance-based, Peak 25% dearer.
+        base = 10.0 + 2.0 * np.abs(np.subtract.outer(np.arange(stations), np.arange(stations)))
+        fare_rules = [(int(station_ids[a]), int(station_ids[b]), fare_type, round(float(base[a, b] * factor), 2))
+                      for a in range(stations) for b in range(stations) if a != b
+                      for fare_type, factor in (('Off-Peak', 1.0), ('Peak', 1.25))]
+        conn.execute('DELETE FROM FareRule')
+        conn.executemany('INSERT INTO FareRule (StartStationID, EndStationID, FareType, FareAmount) '
+                         'VALUES (?, ?, ?, ?)', fare_rules)
+
+        card_types = conn.execute('SELECT CardTypeID, BaseFareMultiplier FROM CardType ORDER BY CardTypeID').fetchall()
+        card_type_ids = np.array([row[0] for row in card_types])
+        multipliers = np.array([row[1] for row in card_types])
+
+        # Passengers
+        passengers = counts['passengers']
+        registered_day = day0 - rng.integers(1, 3 * 365, passengers).astype('timedelta64[D]')
+        registered = _times_to_text(registered_day.astype('datetime64[s]')
+                                    + rng.integers(0, 86400, passengers).astype('timedelta64[s]'))
+        first = rng.integers(0, len(FIRST_NAMES), passengers).tolist()
+        last = rng.integers(0, len(LAST_NAMES), passengers).tolist()
+        conn.executemany(
+            'INSERT INTO Passenger (PassengerID, FirstName, LastName, Email, PhoneNumber, RegistrationDate) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            ((i + 1, FIRST_NAMES[first[i]], LAST_NAMES[last[i]], f'passenger{i + 1}@example.com',
+              f'9{i:09d}', registered[i]) for i in range(passengers)))
+
+        # Cards: every passenger has one, some have a second; mostly Regular.
+        cards = max(counts['cards'], passengers)
+        card_passenger = np.concatenate([np.arange(1, passengers + 1),
+                                         rng.integers(1, passengers + 1, cards - passengers)])
+        card_type_index = rng.choice(len(card_type_ids), cards,
+                                     p=np.array([0.6, 0.2, 0.1, 0.1])[:len(card_type_ids)]
+                                     / np.array([0.6, 0.2, 0.1, 0.1])[:len(card_type_ids)].sum())
+        status = rng.choice(np.array(['Active', 'Inactive', 'Blocked']), cards, p=[0.95, 0.03, 0.02])
+        balance = np.round(rng.gamma(2.0, 150.0, cards), 2)
+        conn.executemany(
+            'INSERT INTO Card (CardID, CardNumber, Balance, IssueDate, Status, PassengerID, CardTypeID) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            zip(range(1, cards + 1), (f'MC{i:010d}' for i in range(1, cards + 1)), balance.tolist(),
+                [t[:10] for t in registered] + [start_date] * (cards - passengers),
+                status.tolist(), card_passenger.tolist(), card_type_ids[card_type_index].tolist()))
+        conn.commit()
+
+        # Trips and transactions, generated a block of days at a time so the
+        # IDs follow time order and memory stays bounded at large scales.
+        station_weight = 1.0 / np.arange(1, stations + 1) ** 0.8
+        station_weight /= station_weight.sum()
+        trips, fares, topups = counts['trips'], 0, counts['topups']
+        blocks = max(1, -(-trips // LOAD_BATCH_ROWS))
+        block_days = np.array_split(np.arange(days), blocks)
+        trip_id = 1
+        for block, block_range in enumerate(block_days):
+            n = trips // blocks + (block < trips % blocks)
+            block_start = day0 + np.timedelta64(int(block_range[0]), 'D')
+            entry = np.sort(_sample_times(rng, n, block_start, len(block_range)))
+            card = rng.integers(1, cards + 1, n)
+            origin = rng.choice(stations, n, p=station_weight)
+            destination = (origin + rng.integers(1, stations, n)) % stations
+            exit_time = entry + rng.integers(5 * 60, 60 * 60, n).astype('timedelta64[s]')
+            completed = rng.random(n) >= 0.002
+            fare = np.round(base[origin, destination] * np.where(peak_mask(entry.astype('datetime64[m]')), 1.25, 1.0)
+                            * multipliers[card_type_index[card - 1]], 2)
+
+            entry_text, exit_text = _times_to_text(entry), _times_to_text(exit_time)
+            done = completed.tolist()
+            conn.executemany(
+                'INSERT INTO Trip (TripID, EntryTime, ExitTime, FareAmount, CardID, EntryStationID, ExitStationID) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                zip(range(trip_id, trip_id + n), entry_text,
+                    (t if d else None for t, d in zip(exit_text, done)),
+                    (f if d else None for f, d in zip(fare.tolist(), done)),
+                    card.tolist(), station_ids[origin].tolist(),
+                    (s if d else None for s, d in zip(station_ids[destination].tolist(), done))))
+            trip_id += n
+
+            # Fare debits at exit plus top-ups, interleaved in time order.
+            m = topups // blocks + (block < topups % blocks)
+            topup_time = _sample_times(rng, m, block_start, len(block_range))
+            times = np.concatenate([exit_time[completed], topup_time])
+            amounts = np.concatenate([fare[completed], rng.choice(TOPUP_AMOUNTS, m)])
+            kinds = np.concatenate([np.full(completed.sum(), 'Fare'), np.full(m, 'Top-up')])
+            tx_cards = np.concatenate([card[completed], rng.integers(1, cards + 1, m)])
+            order = np.argsort(times, kind='stable')
+            conn.executemany(
+                'INSERT INTO [Transaction] (TransactionType, Amount, TransactionDate, CardID) VALUES (?, ?, ?, ?)',
+                zip(kinds[order].tolist(), amounts[order].tolist(), _times_to_text(times[order]),
+                    tx_cards[order].tolist()))
+            conn.commit()
+            fares += int(completed.sum())
+            logger.info(f"Generated {trip_id - 1:,} of {trips:,} trips")
+
+    generated = {'stations': stations, 'fareRules': len(fare_rules), 'passengers': passengers,
+                 'cards': cards, 'trips': trips, 'transactions': fares + topups}
+    logger.info(f"Synthetic data at scale {scale} loaded in {time.perf_counter() - started:.1f}s: {generated}")
+    return generated
+
+
+def make_synthetic_database(db_file: str, scale: float = 0.01, seed: int = 42, **options) -> str:
+    """
+    Create a migrated database at db_file filled with synthetic data.
+    :return: db_file
+    """
+    conn = sqlite3.connect(db_file)
+    try:
+        apply_database_settings(conn, resolve_profile(os.environ.get('DB_STORAGE_PROFILE')))
+        migrate(conn)
+        generate_synthetic_data(conn, scale, seed, **options)
+    finally:
+        conn.close()
+    return db_file
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Create the metro database and load sample or synthetic data')
+    parser.add_argument('--db', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'project.db'),
+                        help='path to the SQLite database')
+    parser.add_argument('--scale', type=float,
+                        help='load synthetic data at this scale factor (1 = 1M trips) instead of the samples')
+    parser.add_argument('--seed', type=int, default=42, help='random seed for synthetic data')
+    parser.add_argument('--start-date', default='2025-01-01', help='first day of synthetic trip history')
+    parser.add_argument('--days', type=int, default=90, help='days of synthetic trip history')
+    args = parser.parse_args()
+
     # Initialize the database
-    db_file = os.path.join(os.path.dirname(__file__), "project.db")
-    conn = create_connection(db_file)
+    conn = create_connection(args.db)
     
     if conn:
         try:
+            apply_database_settings(conn, resolve_profile(os.environ.get('DB_STORAGE_PROFILE')))
             create_tables_if_not_exist(conn)
-            insert_sample_data(conn)
+            if args.scale is not None:
+                generate_synthetic_data(conn, args.scale, args.seed, args.start_date, args.days)
+            else:
+                insert_sample_data(conn)
             logger.info("Database initialization completed successfully!")
         except Exception as e:
             logger.error(f"Error during database initialization: {e}")
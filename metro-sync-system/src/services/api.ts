@@ -1,12 +1,48 @@
 // API service for connecting to Flask backend
 const API_BASE_URL = 'http://10.29.39.140:5000';
 
+export type QueryParams = Record<string, string | number | undefined>;
+
+// List endpoints return one page at a time: { items, nextCursor }.
+export interface Page<T = any> {
+  items: T[];
+  nextCursor: string | null;
+}
+
+const withQuery = (path: string, params: QueryParams = {}) => {
+  const query = new URLSearchParams();
+  Object.entries(params).forEach(([key, value]) => {
+    if (value !== undefined && value !== '') query.set(key, String(value));
+  });
+  const qs = query.toString();
+  return `${API_BASE_URL}${path}${qs ? `?${qs}` : ''}`;
+};
+
+const fetchPage = async <T = any>(path: string, params: QueryParams = {}): Promise<Page<T>> => {
+  const response = await fetch(withQuery(path, params));
+  if (!response.ok) {
+    throw new Error(`Failed to fetch ${path}: ${response.statusText}`);
+  }
+  return response.json();
+};
+
+// Follows nextCursor until the last page and returns every item.
+const fetchAllPages = async <T = any>(path: string, params: QueryParams = {}): Promise<T[]> => {
+  const items: T[] = [];
+  let after: string | undefined;
+  do {
+    const page = await fetchPage<T>(path, { limit: 1000, ...params, after });
+    items.push(...page.items);
+    after = page.nextCursor ?? undefined;
+  } while (after);
+  return items;
+};
+
 export const api = {
   // Passengers
-  getPassengers: async () => {
-    const response = await fetch(`${API_BASE_URL}/passengers`);
-    return response.json();
-  },
+  getPassengers: async (params: QueryParams = {}) => fetchAllPages('/passengers', params),
+
+  getPassengersPage: async (params: QueryParams = {}) => fetchPage('/passengers', params),
   
   createPassenger: async (data: any) => {
     const response = await fetch(`${API_BASE_URL}/passengers`, {
@@ -34,10 +70,9 @@ export const api = {
   },
 
   // Cards
-  getCards: async () => {
-    const response = await fetch(`${API_BASE_URL}/cards`);
-    return response.json();
-  },
+  getCards: async (params: QueryParams = {}) => fetchAllPages('/cards', params),
+
+  getCardsPage: async (params: QueryParams = {}) => fetchPage('/cards', params),
   
   createCard: async (data: any) => {
     const response = await fetch(`${API_BASE_URL}/cards`, {
@@ -96,19 +131,14 @@ export const api = {
   },
 
   // Trips
-  getTrips: async () => {
-    const response = await fetch(`${API_BASE_URL}/trips`);
-    if (!response.ok) {
-      throw new Error(`Failed to fetch trips: ${response.statusText}`);
-    }
-    return response.json();
-  },
+  getTrips: async (params: QueryParams = {}) => fetchAllPages('/trips', params),
+
+  getTripsPage: async (params: QueryParams = {}) => fetchPage('/trips', params),
 
   // Transactions
-  getTransactions: async () => {
-    const response = await fetch(`${API_BASE_URL}/transactions`);
-    return response.json();
-  },
+  getTransactions: async (params: QueryParams = {}) => fetchAllPages('/transactions', params),
+
+  getTransactionsPage: async (params: QueryParams = {}) => fetchPage('/transactions', params),
 
   // Fare Rules
   getFareRules: async () => {